@@ -2,17 +2,33 @@ from flask import Flask
 from flask_swagger_ui import get_swaggerui_blueprint
 from flask_migrate import Migrate
 from .scheduler import start_scheduler
+from . import content
 from .db import db
+from .idempotency import idempotency_cache
 from .mail import mail
+from .mime import message_cache
+from .ratelimit import smtp_limiter
+from .utils.time_utils import set_default_time_zone
 
 
-def create_app():
+def create_app(scheduler=None):
+    """Build the app; the dispatch scheduler runs in-process only when
+    ``scheduler`` is true, or ``SCHEDULER_ENABLED`` when it is None.
+
+    Production runs the API and ``python -m app.worker`` as separate
+    processes.
+    """
     app = Flask(__name__, static_folder='static', static_url_path='/static')
 
     app.config.from_object('config.Config')
+    set_default_time_zone(app.config['TIME_ZONE'])
 
+    content.init_app(app)
     db.init_app(app)
     mail.init_app(app)
+    smtp_limiter.init_app(app)
+    message_cache.init_app(app)
+    idempotency_cache.init_app(app)
     Migrate(app, db)
 
     from .models import Event
@@ -28,7 +44,10 @@ def create_app():
     from .routes import main
     app.register_blueprint(main)
 
-    with app.app_context():
-        start_scheduler(app)
+    if scheduler is None:
+        scheduler = app.config['SCHEDULER_ENABLED']
+    if scheduler:
+        with app.app_context():
+            start_scheduler(app)
 
     return app
@@ -0,0 +1,337 @@
+import asyncio
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import aiosmtplib
+from .content import load_bodies
+from .delivery import DeliveryBackend
+from .mail import is_permanent
+from .metrics import smtp_send_seconds
+from .mime import message_cache
+from .models import Event, EventStatus
+from .ratelimit import is_throttled, smtp_limiter
+from .tasks import load_variables, record_delivery_lag, record_refused
+from .utils.time_utils import get_current_time
+
+
+class AsyncSMTPBackend(DeliveryBackend):
+    """Runs many SMTP sessions on one asyncio event loop.
+
+    A send waiting on the server holds a connection but no thread, so a
+    single loop thread keeps up to ``ASYNC_SMTP_CONNECTIONS`` sessions busy.
+    The calling thread keeps the database work: ``prepare`` renders the
+    claimed events missing from ``message_cache`` with one query, and
+    ``submit`` only fills in the recipients before handing the bytes to the
+    loop. Outcomes are recorded
+    on a separate thread, so a buffer flush never stalls the loop.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        config = app.config
+        self.connections = max(1, config['ASYNC_SMTP_CONNECTIONS'])
+        self.max_messages = config['MAIL_POOL_MAX_MESSAGES']
+        self.throttle_retries = config['SMTP_THROTTLE_RETRIES']
+        self.limiter = smtp_limiter
+        self._options = {
+            'hostname': config['MAIL_SERVER'],
+            'port': config['MAIL_PORT'],
+            'username': config['MAIL_USERNAME'],
+            'password': config['MAIL_PASSWORD'],
+            'use_tls': config['MAIL_USE_SSL'],
+            'start_tls': config['MAIL_USE_TLS'],
+            'timeout': config['ASYNC_SMTP_TIMEOUT'],
+        }
+        # Events of the last few claimed batches, by id.
+        self._events = OrderedDict()
+        self._events_size = 4 * config['DISPATCH_BATCH_SIZE']
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(2 * self.connections)
+        self._done_condition = threading.Condition()
+        self._count = 0
+        self._recorder = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix='outcomes')
+        self._idle = []
+        self._quitting = set()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        daemon=True, name='smtp-loop')
+        self._thread.start()
+        self._run(self._setup())
+
+    def prepare(self, event_ids, owner):
+        rows = _events_query(event_ids, owner).all()
+        _render([row for row in rows
+                 if (row.event_id, row.updated_at) not in message_cache])
+        with self._lock:
+            for row in rows:
+                self._events[row.event_id] = row
+            while len(self._events) > self._events_size:
+                self._events.popitem(last=False)
+
+    def submit(self, event_id, chunk, owner, outcomes):
+        with self._lock:
+            event = self._events.get(event_id)
+        if event is None:
+            event = next(iter(_events_query([event_id], owner)), None)
+            if event is None:
+                # The lease expired and another dispatcher took the event.
+                return
+        if event.personalized:
+            self._submit_personalized(event, chunk, outcomes)
+            return
+        try:
+            message = message_cache.message(
+                event.event_id, event.updated_at,
+                [address for _, address in chunk],
+                lambda: _load_content(event.event_id))
+            envelope = (message.sender, message.recipients,
+                        message.as_bytes())
+        except Exception as e:
+            # Same as a message Flask-Mail could not build: never sendable.
+            _record((get_current_time(), e, {}), event, chunk, outcomes)
+            return
+
+        self._in_flight.acquire()
+        with self._done_condition:
+            self._count += 1
+        future = asyncio.run_coroutine_threadsafe(
+            self._deliver(*envelope), self.loop)
+        future.add_done_callback(
+            lambda f: self._done(f, event, chunk, outcomes))
+
+    def _submit_personalized(self, event, chunk, outcomes):
+        # The chunk's messages are rendered here, one recipient at a time,
+        # and go out concurrently as a single unit of work on the loop.
+        variables = load_variables([recipient_id for recipient_id, _ in chunk])
+        envelopes = []
+        now = get_current_time()
+        for recipient, message in zip(chunk, message_cache.messages(
+                event.event_id, event.updated_at,
+                [(address, variables.get(recipient_id))
+                 for recipient_id, address in chunk],
+                lambda: _load_content(event.event_id))):
+            try:
+                if isinstance(message, Exception):
+                    raise message
+                envelopes.append((recipient, (
+                    message.sender, message.recipients, message.as_bytes())))
+            except Exception as e:
+                _record((now, e, {}), event, [recipient], outcomes)
+        if not envelopes:
+            return
+
+        self._in_flight.acquire()
+        with self._done_condition:
+            self._count += 1
+        future = asyncio.run_coroutine_threadsafe(
+            self._deliver_each(envelopes), self.loop)
+        future.add_done_callback(
+            lambda f: self._each_done(f, event, outcomes))
+
+    async def _deliver_each(self, envelopes):
+        results = await asyncio.gather(*(
+            self._deliver(*envelope) for _, envelope in envelopes))
+        return [(recipient, result) for (recipient, _), result
+                in zip(envelopes, results)]
+
+    def _each_done(self, future, event, outcomes):
+        self._recorder.submit(_record_each, future.result(), event, outcomes)
+        self._in_flight.release()
+        with self._done_condition:
+            self._count -= 1
+            if not self._count:
+                self._done_condition.notify_all()
+
+    def drain(self):
+        with self._done_condition:
+            self._done_condition.wait_for(lambda: not self._count)
+        # The recorder runs its queue in order: once this no-op is through,
+        # every outcome of the drained sends is in the buffer.
+        self._recorder.submit(lambda: None).result()
+
+    def close(self):
+        self.drain()
+        self._run(self._close_idle())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self._recorder.shutdown(wait=True)
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _done(self, future, event, chunk, outcomes):
+        # Runs on the loop thread: hand the bookkeeping off right away.
+        self._recorder.submit(_record, future.result(), event, chunk,
+                              outcomes)
+        self._in_flight.release()
+        with self._done_condition:
+            self._count -= 1
+            if not self._count:
+                self._done_condition.notify_all()
+
+    async def _setup(self):
+        self._slots = asyncio.Semaphore(self.connections)
+
+    async def _deliver(self, sender, recipients, message):
+        # Timed after the send, so the connection slot and limiter waits
+        # count towards the delivery lag.
+        try:
+            async with self._slots:
+                refused = await self._send_paced(sender, recipients, message)
+        except Exception as e:
+            return get_current_time(), e, {}
+        return get_current_time(), None, refused
+
+    async def _send_paced(self, sender, recipients, message):
+        # Same pacing and "slow down" retries as MailPool.send.
+        for attempt in range(self.throttle_retries + 1):
+            wait = self.limiter.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                return await self._send(sender, recipients, message)
+            except smtplib.SMTPException as e:
+                if not is_throttled(e) or attempt == self.throttle_retries:
+                    raise
+                self.limiter.throttled()
+
+    async def _send(self, sender, recipients, message):
+        # Returns the recipients the server refused while accepting the
+        # rest, in the ``{address: (code, reply)}`` form of smtplib.
+        start = time.perf_counter()
+        client = self._idle.pop() if self._idle else None
+        reused = client is not None
+        try:
+            try:
+                if client is None:
+                    client = await self._connect()
+                try:
+                    refused, _ = await client.sendmail(
+                        sender, recipients, message)
+                except aiosmtplib.SMTPServerDisconnected:
+                    if not reused:
+                        raise
+                    # The server closed a connection that sat idle.
+                    client.close()
+                    client = await self._connect()
+                    refused, _ = await client.sendmail(
+                        sender, recipients, message)
+            except BaseException:
+                if client is not None and not client.is_connected:
+                    client = None
+                raise
+        except aiosmtplib.SMTPException as e:
+            raise _to_smtplib(e) from e
+        finally:
+            smtp_send_seconds.observe(time.perf_counter() - start)
+            if client is not None:
+                self._checkin(client)
+        return {address: (response.code, response.message)
+                for address, response in refused.items()}
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(**self._options)
+        await client.connect()
+        client.sent = 0
+        return client
+
+    def _checkin(self, client):
+        client.sent += 1
+        if self.max_messages and client.sent >= self.max_messages:
+            task = self.loop.create_task(_quit(client))
+            self._quitting.add(task)
+            task.add_done_callback(self._quitting.discard)
+        else:
+            self._idle.append(client)
+
+    async def _close_idle(self):
+        clients, self._idle = self._idle, []
+        await asyncio.gather(*self._quitting,
+                             *(_quit(client) for client in clients))
+
+
+def _events_query(event_ids, owner):
+    query = Event.query.filter(Event.event_id.in_(event_ids))
+    if owner is None:
+        query = query.filter(Event.status.in_(EventStatus.ACTIVE))
+    else:
+        query = query.filter(Event.status == EventStatus.CLAIMED,
+                             Event.lease_owner == owner)
+    return query.with_entities(Event.event_id, Event.expected_sent_at,
+                               Event.updated_at, Event.personalized)
+
+
+def _render(rows):
+    # Bodies are loaded only for the events that still need rendering.
+    if not rows:
+        return
+    versions = {row.event_id: row.updated_at for row in rows}
+    events = Event.query.filter(Event.event_id.in_(versions)).with_entities(
+        Event.event_id, Event.email_subject, Event.content_hash,
+        Event.personalized).all()
+    bodies = load_bodies(key for _, _, key, _ in events)
+    for event_id, subject, key, personalized in events:
+        try:
+            message_cache.render(event_id, versions[event_id], subject,
+                                 bodies[key], personalized)
+        except Exception:
+            # submit renders it again and records the failure.
+            pass
+
+
+def _load_content(event_id):
+    subject, key = Event.query.filter(Event.event_id == event_id) \
+        .with_entities(Event.email_subject, Event.content_hash).one()
+    return subject, load_bodies([key])[key]
+
+
+def _record_each(results, event, outcomes):
+    # Recipients that went out are recorded together, failures one by one.
+    sent = [(recipient, result) for recipient, result in results
+            if result[1] is None]
+    if sent:
+        # One recipient per message: a refusal was raised, not returned.
+        _record((max(result[0] for _, result in sent), None, {}), event,
+                [recipient for recipient, _ in sent], outcomes)
+    for recipient, result in results:
+        if result[1] is not None:
+            _record(result, event, [recipient], outcomes)
+
+
+def _record(result, event, chunk, outcomes):
+    now, error, refused = result
+    if error is None:
+        accepted = record_refused(event.event_id, chunk, refused, now,
+                                  outcomes)
+        if accepted:
+            outcomes.sent(event.event_id, accepted, now)
+            record_delivery_lag(event, now)
+    else:
+        outcomes.failed(event.event_id,
+                        [recipient_id for recipient_id, _ in chunk],
+                        str(error), now, permanent=is_permanent(error))
+        print(str(error))
+
+
+def _to_smtplib(error):
+    """Map an aiosmtplib error onto smtplib's, which the rest of the
+    dispatcher classifies."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return smtplib.SMTPRecipientsRefused({
+            refused.recipient: (refused.code, refused.message)
+            for refused in error.recipients})
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return smtplib.SMTPResponseException(error.code, error.message)
+    # Connection failures and timeouts: the server went away.
+    return smtplib.SMTPServerDisconnected(str(error))
+
+
+async def _quit(client):
+    try:
+        await client.quit()
+    except (aiosmtplib.SMTPException, OSError):
+        client.close()
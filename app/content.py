@@ -0,0 +1,94 @@
+import hashlib
+import zlib
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+
+try:
+    import zstandard
+except ImportError:  # only needed for CONTENT_COMPRESSION=zstd
+    zstandard = None
+
+CODECS = ('none', 'zlib', 'zstd')
+
+
+def content_hash(body):
+    """Key of a body in ``event_content``: the SHA-256 of its UTF-8 bytes."""
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def encode(body, codec='none', min_bytes=0):
+    """Return ``(encoding, data)`` for storing ``body``.
+
+    Bodies shorter than ``min_bytes``, or that do not get smaller, are kept
+    as plain UTF-8 ('none').
+    """
+    data = body.encode('utf-8')
+    if codec == 'none' or len(data) < min_bytes:
+        return 'none', data
+    if codec == 'zlib':
+        packed = zlib.compress(data, 6)
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise ValueError(
+                "CONTENT_COMPRESSION=zstd needs the zstandard package.")
+        packed = zstandard.ZstdCompressor().compress(data)
+    else:
+        raise ValueError(f"Invalid CONTENT_COMPRESSION. Use {', '.join(CODECS)}.")
+    if len(packed) >= len(data):
+        return 'none', data
+    return codec, packed
+
+
+def decode(encoding, data):
+    data = bytes(data)
+    if encoding == 'zlib':
+        data = zlib.decompress(data)
+    elif encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError("Reading zstd bodies needs the zstandard package.")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
+
+
+def store_contents(connection, bodies):
+    """Insert the bodies of ``{content_hash: body}`` that are not stored yet.
+
+    A body shared by many events, or already saved by an earlier request, is
+    skipped by the database (ON CONFLICT DO NOTHING), so concurrent writers
+    never fail on the same campaign body.
+    """
+    if not bodies:
+        return
+    from .models import EventContent
+
+    codec = current_app.config['CONTENT_COMPRESSION']
+    min_bytes = current_app.config['CONTENT_COMPRESSION_MIN_BYTES']
+    rows = []
+    for key, body in bodies.items():
+        encoding, data = encode(body, codec, min_bytes)
+        rows.append({'content_hash': key, 'encoding': encoding, 'body': data})
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    connection.execute(
+        dialect.insert(EventContent.__table__).on_conflict_do_nothing(), rows)
+
+
+def load_bodies(hashes):
+    """Return ``{content_hash: body}``, reading each distinct body once."""
+    from .models import EventContent
+
+    hashes = set(hashes)
+    if not hashes:
+        return {}
+    return {key: decode(encoding, data) for key, encoding, data in
+            EventContent.query.filter(EventContent.content_hash.in_(hashes))
+            .with_entities(EventContent.content_hash, EventContent.encoding,
+                           EventContent.body)}
+
+
+def init_app(app):
+    """Fail at startup, not on the first write, on an unusable codec."""
+    codec = app.config['CONTENT_COMPRESSION']
+    if codec not in CODECS:
+        raise ValueError(f"Invalid CONTENT_COMPRESSION. Use {', '.join(CODECS)}.")
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError("CONTENT_COMPRESSION=zstd needs the zstandard package.")
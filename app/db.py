@@ -1,4 +1,30 @@
+from datetime import timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.types import DateTime, TypeDecorator
 
 db = SQLAlchemy()
 
+
+class UTCDateTime(TypeDecorator):
+    """DateTime(timezone=True) that always stores and returns UTC.
+
+    SQLite keeps whatever wall-clock time it is handed, so aware values are
+    converted to UTC before binding and naive results are read back as UTC.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def __init__(self):
+        super().__init__(timezone=True)
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
@@ -0,0 +1,75 @@
+from .dispatcher import Dispatcher
+from .mail import MailPool
+from .ratelimit import smtp_limiter
+
+
+class DeliveryBackend:
+    """Sends the recipient chunks of claimed events.
+
+    ``submit`` queues one chunk and may block while the backend is
+    saturated; the outcome of every chunk is recorded in the OutcomeBuffer
+    passed along with it. ``prepare`` is called with each claimed batch
+    before its chunks are submitted. ``drain`` waits for everything that
+    was submitted and keeps the backend open; ``close`` also releases its
+    connections and threads.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def prepare(self, event_ids, owner):
+        pass
+
+    def submit(self, event_id, chunk, owner, outcomes):
+        raise NotImplementedError
+
+    def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FlaskMailBackend(DeliveryBackend):
+    """Flask-Mail over a MailPool; each send holds a dispatcher thread."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.pool = MailPool(
+            size=app.config['MAIL_POOL_SIZE'],
+            max_messages=app.config['MAIL_POOL_MAX_MESSAGES'],
+            limiter=smtp_limiter,
+            throttle_retries=app.config['SMTP_THROTTLE_RETRIES'])
+        self.dispatcher = Dispatcher(
+            workers=app.config['DISPATCH_WORKERS'],
+            max_in_flight=app.config['DISPATCH_MAX_IN_FLIGHT'])
+
+    def submit(self, event_id, chunk, owner, outcomes):
+        from . import tasks
+        self.dispatcher.submit(tasks.send_chunk, event_id, chunk, self.app,
+                               self.pool, owner, outcomes)
+
+    def drain(self):
+        self.dispatcher.drain()
+
+    def close(self):
+        self.dispatcher.close()
+        self.pool.close()
+
+
+def get_backend(app):
+    """Build the backend named by ``DELIVERY_BACKEND``."""
+    name = app.config['DELIVERY_BACKEND']
+    if name == 'flask_mail':
+        return FlaskMailBackend(app)
+    if name == 'asyncio':
+        # Imported on demand so the default backend works without aiosmtplib.
+        from .async_delivery import AsyncSMTPBackend
+        return AsyncSMTPBackend(app)
+    raise ValueError(f"Unknown delivery backend: {name}.")
@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Dispatcher:
+    """Runs sends on a pool of worker threads with bounded in-flight work.
+
+    ``submit`` blocks once ``max_in_flight`` calls are queued or running, so
+    draining a large backlog never piles every pending send up in memory.
+    Submitted callables must push their own app context; Flask-SQLAlchemy
+    scopes ``db.session`` per thread, so each worker gets its own session.
+    """
+
+    def __init__(self, workers=4, max_in_flight=None):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='dispatch')
+        self._in_flight = threading.BoundedSemaphore(
+            max_in_flight or 2 * self.workers)
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def submit(self, fn, *args):
+        self._in_flight.acquire()
+        with self._idle:
+            self._pending += 1
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._finished()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def drain(self):
+        """Wait for every call submitted so far; the pool stays open."""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._pending)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def _done(self, future):
+        self._finished()
+        if not future.cancelled() and future.exception() is not None:
+            print("dispatch error : ", future.exception())
+
+    def _finished(self):
+        self._in_flight.release()
+        with self._idle:
+            self._pending -= 1
+            if not self._pending:
+                self._idle.notify_all()
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """Bounded LRU of responses already given for an ``Idempotency-Key``.
+
+    A retried request is answered from memory without touching the
+    database. Entries expire after ``ttl`` seconds and the least recently
+    used one is dropped once ``max_entries`` are held; the unique
+    ``event.idempotency_key`` column still catches retries the cache has
+    forgotten or that reach another process.
+    """
+
+    def __init__(self, max_entries=10000, ttl=86400, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self.clock = clock
+        self.configure(max_entries, ttl)
+
+    def init_app(self, app):
+        self.configure(max_entries=app.config['IDEMPOTENCY_CACHE_SIZE'],
+                       ttl=app.config['IDEMPOTENCY_TTL_SECONDS'])
+
+    def configure(self, max_entries=10000, ttl=86400):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+idempotency_cache = IdempotencyCache()
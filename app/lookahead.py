@@ -0,0 +1,161 @@
+import heapq
+import select
+import threading
+from datetime import timedelta
+from sqlalchemy import text
+from .db import db
+from .models import NOTIFY_CHANNEL, Event, EventStatus
+from .tasks import fire_event
+from .utils.time_utils import get_current_time, to_utc
+
+# Longest the timer sleeps before reading the clock again, so a clock moved
+# by set_clock is followed without real time passing.
+_MAX_WAIT = 1.0
+
+
+class Lookahead:
+    """Fires near-due events at their expected_sent_at.
+
+    The minute poll alone sends an email up to a minute late. ``load`` pulls
+    events due within the next window into an in-memory heap and a timer
+    thread hands each event to the backend the moment it falls due. Every
+    process may hold the same event; the lease taken in ``fire_event``
+    decides which one sends it.
+
+    Events are created by the API, in another process. On Postgres a
+    trigger NOTIFYs on every insert and a listener thread loads again right
+    away; elsewhere they are picked up by the ``LOOKAHEAD_INTERVAL_SECONDS``
+    load.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.window = timedelta(0)
+        self._heap = []
+        self._scheduled = set()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._listener = None
+        self._stopped = False
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, app, backend, outcomes):
+        """Fire into ``backend`` and ``outcomes``, which the caller owns and
+        closes after ``stop``."""
+        if self.running:
+            self.stop()
+        self.app = app
+        self.window = timedelta(seconds=app.config['LOOKAHEAD_WINDOW_SECONDS'])
+        self.limit = app.config['DISPATCH_BATCH_SIZE']
+        self.backend = backend
+        self.outcomes = outcomes
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='lookahead')
+        self._thread.start()
+        with app.app_context():
+            driver = db.get_engine(app).dialect.driver
+        if driver == 'psycopg2':
+            self._listener = threading.Thread(target=self._listen, daemon=True,
+                                              name='lookahead-listen')
+            self._listener.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+        if self._listener is not None:
+            self._listener.join()
+            self._listener = None
+        self._heap = []
+        self._scheduled = set()
+
+    def schedule(self, event_id, expected_sent_at):
+        """Queue an event if it falls due within the look-ahead window.
+
+        Overdue events are left to the regular poll.
+        """
+        if not self.running:
+            return False
+        now = get_current_time()
+        if not now <= expected_sent_at <= now + self.window:
+            return False
+        due_at = to_utc(expected_sent_at)
+        with self._condition:
+            if event_id in self._scheduled:
+                return False
+            heapq.heappush(self._heap, (due_at, event_id))
+            self._scheduled.add(event_id)
+            self._condition.notify()
+        return True
+
+    def load(self):
+        """Queue the next ``DISPATCH_BATCH_SIZE`` events due in the window.
+
+        A larger campaign is not pulled into memory whole: the rest is
+        queued by the next load or claimed by the poll.
+        """
+        with self.app.app_context():
+            now = get_current_time()
+            rows = Event.query.filter(
+                Event.status == EventStatus.PENDING,
+                Event.expected_sent_at > now,
+                Event.expected_sent_at <= now + self.window
+            ).order_by(Event.expected_sent_at).limit(self.limit) \
+                .with_entities(Event.event_id, Event.expected_sent_at)
+            for event_id, expected_sent_at in rows:
+                self.schedule(event_id, to_utc(expected_sent_at))
+
+    def _listen(self):
+        # One connection held in autocommit for LISTEN; notifications that
+        # arrive together trigger a single load.
+        while not self._stopped:
+            try:
+                with self.app.app_context():
+                    engine = db.get_engine(self.app)
+                with engine.connect().execution_options(
+                        isolation_level='AUTOCOMMIT') as connection:
+                    connection.execute(text(f'LISTEN {NOTIFY_CHANNEL}'))
+                    raw = connection.connection.dbapi_connection
+                    self.load()
+                    while not self._stopped:
+                        if not select.select([raw], [], [], _MAX_WAIT)[0]:
+                            continue
+                        raw.poll()
+                        if raw.notifies:
+                            raw.notifies.clear()
+                            self.load()
+            except Exception as e:
+                print("lookahead : listen error :", e)
+                with self._condition:
+                    self._condition.wait_for(lambda: self._stopped, 5)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    now = get_current_time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = _MAX_WAIT
+                    if self._heap:
+                        timeout = min(timeout, (self._heap[0][0] - now)
+                                      .total_seconds())
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                _, event_id = heapq.heappop(self._heap)
+                self._scheduled.discard(event_id)
+            try:
+                # The backend bounds the sends; this thread only claims.
+                fire_event(event_id, self.app, self.backend, self.outcomes)
+            except Exception as e:
+                print("lookahead error : ", e)
+
+
+lookahead = Lookahead()
@@ -1,4 +1,174 @@
-from flask_mail import Mail
+import queue
+import smtplib
+import threading
+import time
+from flask_mail import (BadHeaderError, Mail, sanitize_address,
+                        sanitize_addresses)
+from .metrics import smtp_send_seconds
+from .ratelimit import is_throttled
 
 
 mail = Mail()
+
+
+class MailPool:
+    """Keeps a few authenticated SMTP connections open for a dispatch cycle.
+
+    Connections are opened lazily through ``mail.connect()``, handed out to
+    one sender at a time and recycled after ``max_messages`` sends. A
+    connection the server dropped is replaced and the message retried once.
+    With a ``limiter``, sends are paced by it and messages refused with a
+    throttling reply are retried up to ``throttle_retries`` times.
+
+    ``send`` returns the recipients the server refused while accepting the
+    rest of the message, as ``send_message`` does.
+    """
+
+    def __init__(self, size=1, max_messages=100, limiter=None,
+                 throttle_retries=3):
+        self.size = max(1, size)
+        self.max_messages = max_messages
+        self.limiter = limiter
+        self.throttle_retries = throttle_retries
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._open = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def send(self, message):
+        if self.limiter is None:
+            return self._send(message)
+        # Paced by the limiter; a "slow down" reply backs it off and the
+        # message is tried again instead of being failed.
+        for attempt in range(self.throttle_retries + 1):
+            self.limiter.acquire()
+            try:
+                return self._send(message)
+            except smtplib.SMTPException as e:
+                if not is_throttled(e) or attempt == self.throttle_retries:
+                    raise
+                self.limiter.throttled()
+
+    def _send(self, message):
+        with self._slots:
+            start = time.perf_counter()
+            connection = self._checkout()
+            try:
+                try:
+                    return send_message(connection, message)
+                except OSError as e:
+                    if not _is_dropped(e):
+                        raise
+                    self._discard(connection)
+                    connection = self._connect()
+                    return send_message(connection, message)
+            except BaseException:
+                if not _is_alive(connection):
+                    self._discard(connection)
+                    connection = None
+                raise
+            finally:
+                smtp_send_seconds.observe(time.perf_counter() - start)
+                if connection is not None:
+                    self._checkin(connection)
+
+    def close(self):
+        with self._lock:
+            connections, self._open = self._open, []
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for connection in connections:
+            _quit(connection)
+
+    def _connect(self):
+        connection = mail.connect()
+        connection.__enter__()
+        connection.sent = 0
+        with self._lock:
+            self._open.append(connection)
+        return connection
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _checkin(self, connection):
+        connection.sent += 1
+        if self.max_messages and connection.sent >= self.max_messages:
+            self._discard(connection)
+        else:
+            self._idle.put(connection)
+
+    def _discard(self, connection):
+        with self._lock:
+            if connection in self._open:
+                self._open.remove(connection)
+        _quit(connection)
+
+
+def send_message(connection, message):
+    """Send ``message`` over a Flask-Mail connection and return the
+    recipients the server refused, as ``{address: (code, reply)}``.
+
+    ``Connection.send`` drops what ``SMTP.sendmail`` returns, which would
+    make a message refused for some of its recipients look delivered to
+    all of them. The addresses are the message's own, not the sanitized
+    ones used on the wire.
+    """
+    if connection.host is None:
+        # MAIL_SUPPRESS_SEND: nothing goes out.
+        connection.send(message)
+        return {}
+    if message.has_bad_headers():
+        raise BadHeaderError
+    if message.date is None:
+        message.date = time.time()
+    send_to = list(message.send_to)
+    addresses = dict(zip(sanitize_addresses(send_to), send_to))
+    refused = connection.host.sendmail(
+        sanitize_address(message.sender), list(addresses),
+        message.as_bytes(), message.mail_options, message.rcpt_options)
+    return {addresses.get(address, address): reply
+            for address, reply in refused.items()}
+
+
+def is_permanent(error):
+    """True when resending the same message cannot succeed.
+
+    5xx replies and errors outside the network stack (a malformed message,
+    say) are permanent. Connection failures, timeouts and 4xx replies are
+    transient: the provider may be down or busy and a later retry can work.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(
+            code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return not isinstance(error, OSError)
+
+
+def _is_dropped(error):
+    # SMTPException subclasses OSError, but only a disconnect or a socket
+    # error means the connection itself is gone.
+    return (isinstance(error, smtplib.SMTPServerDisconnected)
+            or not isinstance(error, smtplib.SMTPException))
+
+
+def _is_alive(connection):
+    host = getattr(connection, 'host', None)
+    return host is None or getattr(host, 'sock', None) is not None
+
+
+def _quit(connection):
+    try:
+        connection.__exit__(None, None, None)
+    except (smtplib.SMTPException, OSError):
+        pass
@@ -0,0 +1,234 @@
+import bisect
+import threading
+
+
+class _PerThread:
+    """One cell of values per thread, summed when metrics are collected.
+
+    Recording touches only the calling thread's cell, so the hot path takes
+    no lock; the registry lock is held once per thread, when its cell is
+    created. Cells of threads that have exited are folded into a shared one
+    so short-lived request threads do not pile up.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells = []
+        self._retired = {}
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = {}
+            with self._lock:
+                self._fold()
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def collect(self):
+        """Sum of every cell, as ``{labels: [values...]}``."""
+        with self._lock:
+            self._fold()
+            cells = [self._retired] + [cell for _, cell in self._cells]
+        totals = {}
+        for cell in cells:
+            # list() copies under the GIL; a value recorded meanwhile shows
+            # up in the next scrape.
+            for labels, values in list(cell.items()):
+                _add(totals.setdefault(labels, [0] * len(values)), values)
+        return totals
+
+    def _fold(self):
+        alive = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+                continue
+            for labels, values in cell.items():
+                _add(self._retired.setdefault(labels, [0] * len(values)),
+                     values)
+        self._cells = alive
+
+
+def _add(totals, values):
+    for i, value in enumerate(values):
+        totals[i] += value
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by ``labelnames``."""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = _PerThread()
+        (registry or REGISTRY).register(self)
+
+    def inc(self, amount=1, labels=()):
+        cell = self._values.cell()
+        values = cell.get(labels)
+        if values is None:
+            values = cell[labels] = [0]
+        values[0] += amount
+
+    def value(self, labels=()):
+        return self._values.collect().get(tuple(labels), [0])[0]
+
+    def samples(self):
+        for labels, (value,) in sorted(self._values.collect().items()):
+            yield (self.name + '_total', _format_labels(self.labelnames,
+                                                        labels), value)
+
+
+class Histogram:
+    """Counts of observations per cumulative ``buckets`` upper bound."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=(),
+                 registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = _PerThread()
+        (registry or REGISTRY).register(self)
+
+    def observe(self, value, labels=()):
+        cell = self._values.cell()
+        values = cell.get(labels)
+        if values is None:
+            # One count per bucket, then the sum and the count.
+            values = cell[labels] = [0] * (len(self.buckets) + 2)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def count(self, labels=()):
+        values = self._values.collect().get(tuple(labels))
+        return values[-1] if values else 0
+
+    def samples(self):
+        for labels, values in sorted(self._values.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield (self.name + '_bucket', _format_labels(
+                    self.labelnames, labels,
+                    [('le', _format_value(float(bound)))]), cumulative)
+            label_text = _format_labels(self.labelnames, labels)
+            yield self.name + '_sum', label_text, values[-2]
+            yield self.name + '_count', label_text, values[-1]
+
+
+class Gauge:
+    """A value read from ``function`` whenever metrics are collected."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, function, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        (registry or REGISTRY).register(self)
+
+    def samples(self):
+        try:
+            value = self.function()
+        except Exception as e:
+            # A failing gauge must not take the other metrics down with it.
+            print("metrics : gauge", self.name, "failed :", e)
+            return
+        # None means no value right now, such as the rate of an unlimited
+        # limiter; the sample is left out.
+        if value is not None:
+            yield self.name, '', value
+
+
+class FunctionCounter(Gauge):
+    """A running total kept elsewhere, read from ``function`` when metrics
+    are collected."""
+
+    type = 'counter'
+
+    def samples(self):
+        for name, labels, value in super().samples():
+            yield name + '_total', labels, value
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text format."""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (.1, .5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+CYCLE_BUCKETS = (.1, .5, 1, 5, 10, 30, 60, 120, 300, 600)
+
+recipients_sent = Counter(
+    'janus_recipients_sent',
+    'Recipients whose message the SMTP server accepted.')
+recipients_failed = Counter(
+    'janus_recipients_failed',
+    'Recipients refused for good.')
+recipients_retried = Counter(
+    'janus_recipients_retried',
+    'Recipients put back to pending after a transient failure.')
+smtp_send_seconds = Histogram(
+    'janus_smtp_send_seconds',
+    'Time to hand one message to the SMTP server, connecting if needed.',
+    LATENCY_BUCKETS)
+dispatch_cycle_seconds = Histogram(
+    'janus_dispatch_cycle_seconds',
+    'Duration of one send_scheduled_emails cycle, drain included.',
+    CYCLE_BUCKETS)
+delivery_lag_seconds = Histogram(
+    'janus_delivery_lag_seconds',
+    'Seconds between expected_sent_at and the SMTP server accepting a send.',
+    LAG_BUCKETS)
+http_request_seconds = Histogram(
+    'janus_http_request_seconds',
+    'Latency of the API and web routes.',
+    LATENCY_BUCKETS, labelnames=('method', 'endpoint', 'status'))
+events_archived = Counter(
+    'janus_events_archived',
+    'Sent, failed and cancelled events moved to event_archive.')
@@ -0,0 +1,279 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, make_msgid
+from functools import lru_cache
+import socket
+from email.message import Message as EmailMessage
+from flask_mail import Message, message_policy, sanitize_subject
+from jinja2.sandbox import SandboxedEnvironment
+from sqlalchemy import event as orm_event
+from .models import Event
+
+# Stand-ins rendered into a template and swapped out for every send.
+_TO = 'janus-to@render.invalid'
+_MESSAGE_ID = '<janus-message-id@render.invalid>'
+_SUBJECT = 'janus-subject'
+
+# Templates come from API clients: sandboxed, and plain text, not HTML.
+_environment = SandboxedEnvironment(autoescape=False,
+                                    keep_trailing_newline=True)
+_NEWLINE = re.compile(r'\r\n|\r|\n')
+
+
+@lru_cache(maxsize=1)
+def _message_id_domain():
+    # make_msgid() resolves the host name on every call; once is enough.
+    return socket.getfqdn()
+
+
+class MessageTemplate:
+    """The MIME bytes of an event, rendered once through Flask-Mail.
+
+    Everything but the To, Date and Message-ID headers is fixed per event,
+    so ``render`` only substitutes those three header lines and joins the
+    bytes; header encoding and MIME assembly happen once, ahead of time.
+    """
+
+    __slots__ = ('subject', 'sender', 'head', 'body', 'size',
+                 '_to', '_date', '_message_id', '_subject')
+
+    def __init__(self, subject, body, sender=None):
+        message = Message(subject=subject, recipients=[_TO], body=body,
+                          sender=sender)
+        message.date = 0
+        message.msgId = _MESSAGE_ID
+        head, separator, body = message.as_bytes().partition(b'\r\n\r\n')
+        self.subject = message.subject
+        self.sender = message.sender
+        self.head = head + separator
+        self.body = body
+        self.size = len(self.head) + len(self.body)
+        self._to = b'\r\nTo: ' + _TO.encode()
+        self._date = b'\r\nDate: ' + formatdate(0, localtime=True).encode()
+        self._message_id = b'\r\nMessage-ID: ' + _MESSAGE_ID.encode()
+        self._subject = b'\r\n' + _subject_header(_SUBJECT)
+
+    def render(self, recipients, date=None, body=None, subject=None):
+        # One address per folded line keeps long chunks under the SMTP
+        # line length limit. ``body`` replaces the rendered body and
+        # ``subject`` the Subject header line, as from _subject_header.
+        head = self.head
+        if subject is not None:
+            head = head.replace(self._subject, b'\r\n' + subject, 1)
+        head = head.replace(
+            self._to, b'\r\nTo: ' + ',\r\n '.join(recipients).encode(), 1
+        ).replace(
+            self._date,
+            b'\r\nDate: ' + formatdate(date, localtime=True).encode(), 1
+        ).replace(
+            self._message_id, b'\r\nMessage-ID: '
+            + make_msgid(domain=_message_id_domain()).encode(), 1)
+        return head + (self.body if body is None else body)
+
+
+def _subject_header(subject):
+    """The Subject header line Flask-Mail writes for ``subject``."""
+    message = EmailMessage()
+    message['Subject'] = sanitize_subject(subject, 'utf-8')
+    if message_policy:
+        message.policy = message_policy
+    # Drop the blank line that ends the headers.
+    return message.as_bytes()[:-2]
+
+
+def compile_template(source):
+    """Compile a subject or body template; raises jinja2.TemplateError."""
+    return _environment.from_string(source)
+
+
+class PersonalizedTemplate:
+    """Subject and body templates of a personalized event, compiled once.
+
+    ``message`` renders both with one recipient's variables. Apart from the
+    subject, the MIME headers only depend on whether the body is ASCII, so
+    they are built through Flask-Mail once per case; each message swaps in
+    its encoded Subject line and appends the body bytes as they are, the
+    way Flask-Mail encodes them.
+    """
+
+    __slots__ = ('subject', 'sender', 'size', '_subject', '_body', '_heads')
+
+    def __init__(self, subject, body, sender=None):
+        self.subject = subject
+        self.sender = sender
+        self.size = len(subject.encode()) + len(body.encode())
+        self._subject = compile_template(subject)
+        self._body = compile_template(body)
+        self._heads = {}
+
+    def message(self, recipient, variables):
+        subject = self._subject.render(variables)
+        if '\r' in subject or '\n' in subject:
+            raise ValueError('Invalid subject: it spans several lines.')
+        body = _NEWLINE.sub('\r\n', self._body.render(variables)).encode()
+        ascii = body.isascii()
+        head = self._heads.get(ascii)
+        if head is None:
+            # Only the transfer encoding header depends on the body.
+            head = self._heads[ascii] = MessageTemplate(
+                _SUBJECT, '' if ascii else '\u00e9', self.sender)
+        message = RenderedMessage(head, [recipient], body)
+        message.subject = subject
+        message.rendered_subject = _subject_header(subject)
+        return message
+
+
+class RenderedMessage(Message):
+    """A Flask-Mail Message whose bytes come from a MessageTemplate.
+
+    Skips Message.__init__, which builds a Message-ID through a host name
+    lookup that ``render`` does per send anyway.
+    """
+
+    def __init__(self, template, recipients, body=None):
+        self.template = template
+        self.rendered_body = body
+        self.rendered_subject = None
+        self.subject = template.subject
+        self.sender = template.sender
+        self.recipients = recipients
+        self.reply_to = None
+        self.cc = []
+        self.bcc = []
+        self.body = None
+        self.html = None
+        self.date = None
+        self.msgId = None
+        self.charset = None
+        self.extra_headers = None
+        self.mail_options = []
+        self.rcpt_options = []
+        self.attachments = []
+
+    def as_bytes(self):
+        return self.template.render(self.recipients, self.date,
+                                    self.rendered_body, self.rendered_subject)
+
+    def as_string(self):
+        return self.as_bytes().decode()
+
+
+class MessageCache:
+    """Bounded cache of rendered events, keyed on ``event_id``.
+
+    Entries carry the ``updated_at`` they were rendered from, so an event
+    edited in any process misses and is rendered again; edits in this
+    process also drop the entry right away. Eviction is first in, first
+    out: templates are rendered roughly in due order and used once, so the
+    oldest entry is the one most likely to have been sent already.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self._lock = threading.Lock()
+        self.configure(max_entries, max_bytes)
+
+    def init_app(self, app):
+        self.configure(max_entries=app.config['MIME_CACHE_SIZE'],
+                       max_bytes=app.config['MIME_CACHE_MAX_BYTES'])
+
+    def configure(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._entries = OrderedDict()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __contains__(self, key):
+        event_id, version = key
+        with self._lock:
+            entry = self._entries.get(event_id)
+        return entry is not None and entry[0] == version
+
+    def get(self, event_id, version):
+        with self._lock:
+            entry = self._entries.get(event_id)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def put(self, event_id, version, template):
+        if not self.max_entries or template.size > self.max_bytes:
+            return template
+        with self._lock:
+            self._discard(event_id)
+            self._entries[event_id] = (version, template)
+            self.bytes += template.size
+            while (len(self._entries) > self.max_entries
+                   or self.bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+        return template
+
+    def render(self, event_id, version, subject, body, personalized=False):
+        template = (PersonalizedTemplate if personalized
+                    else MessageTemplate)(subject, body)
+        return self.put(event_id, version, template)
+
+    def message(self, event_id, version, recipients, load):
+        """A message for ``recipients``; ``load`` returns the event's
+        ``(subject, body)`` and is only called on a miss."""
+        template = self.get(event_id, version)
+        if template is None:
+            template = self.render(event_id, version, *load())
+        return RenderedMessage(template, recipients)
+
+    def messages(self, event_id, version, recipients, load):
+        """Yield one message per ``(address, variables)`` of a personalized
+        event, rendered as the iteration reaches it. ``load`` is as for
+        ``message``; ``variables`` is the stored JSON object or None.
+
+        A recipient whose message cannot be rendered yields the exception
+        instead, so the others still go out; every recipient does when the
+        templates themselves cannot be loaded or compiled.
+        """
+        template = self.get(event_id, version)
+        if template is None:
+            try:
+                template = self.render(event_id, version, *load(),
+                                       personalized=True)
+            except Exception as e:
+                for _ in recipients:
+                    yield e
+                return
+        for address, variables in recipients:
+            try:
+                yield template.message(
+                    address, json.loads(variables) if variables else {})
+            except Exception as e:
+                yield e
+
+    def invalidate(self, event_id):
+        with self._lock:
+            self._discard(event_id)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _discard(self, event_id):
+        entry = self._entries.pop(event_id, None)
+        if entry is not None:
+            self.bytes -= entry[1].size
+
+
+message_cache = MessageCache()
+
+
+@orm_event.listens_for(Event, 'after_update')
+def invalidate_rendered_message(mapper, connection, target):
+    message_cache.invalidate(target.event_id)
@@ -1,33 +1,241 @@
-from .db import db
+from .content import content_hash, decode, store_contents
+from .db import db, UTCDateTime
 from .utils.time_utils import get_current_time
-from sqlalchemy import event, Index
+from sqlalchemy import DDL, event, inspect, Index, text
+from sqlalchemy.ext.hybrid import hybrid_property
+
+
+class EventStatus:
+    """Delivery states of an Event, stored as a small integer.
+
+    pending -> claimed -> sent | failed, and pending or claimed -> cancelled.
+    A claimed event whose lease expired goes back to pending; a send that
+    outlived its lease still records its outcome from pending.
+    """
+    PENDING = 0
+    CLAIMED = 1
+    SENT = 2
+    FAILED = 3
+    CANCELLED = 4
+
+    NAMES = {
+        PENDING: 'pending',
+        CLAIMED: 'claimed',
+        SENT: 'sent',
+        FAILED: 'failed',
+        CANCELLED: 'cancelled',
+    }
+
+    TRANSITIONS = {
+        PENDING: {CLAIMED, SENT, FAILED, CANCELLED},
+        CLAIMED: {PENDING, SENT, FAILED, CANCELLED},
+        SENT: set(),
+        FAILED: set(),
+        CANCELLED: set(),
+    }
+
+    # States the dispatcher still has to look at.
+    ACTIVE = (PENDING, CLAIMED)
+
+    @classmethod
+    def sources(cls, status):
+        """States an event may be in to move to ``status``; the filter of
+        every UPDATE that moves events there."""
+        return tuple(source for source, targets in cls.TRANSITIONS.items()
+                     if status in targets)
+
+    @classmethod
+    def from_name(cls, name):
+        for value, value_name in cls.NAMES.items():
+            if value_name == name:
+                return value
+        raise ValueError(f"Invalid status. Use {', '.join(cls.NAMES.values())}.")
 
 
 class Event(db.Model):
     __tablename__ = 'event'
 
-    event_id = db.Column(db.String(50), primary_key=True,
-                         unique=True, nullable=False)
+    event_id = db.Column(db.String(50), primary_key=True, nullable=False)
     email_subject = db.Column(db.String(120), nullable=False)
-    email_content = db.Column(db.Text, nullable=False)
+    # The body lives in event_content, once per distinct body; it is only
+    # read when a message is built or the body is shown.
+    content_hash = db.Column(db.String(64),
+                             db.ForeignKey('event_content.content_hash'),
+                             nullable=False)
     recipients = db.Column(db.Text, nullable=False)
     created_at = db.Column(
-        db.DateTime(timezone=True))
+        UTCDateTime())
     updated_at = db.Column(
-        db.DateTime(timezone=True))
-    deleted_at = db.Column(db.DateTime(timezone=True), nullable=True)
-    expected_sent_at = db.Column(db.DateTime(timezone=True), index=True)
-    exactly_sent_at = db.Column(db.DateTime(
-        timezone=True), index=True, nullable=True)
-    is_sent = db.Column(db.Boolean, default=False, index=True)
-    is_failed = db.Column(db.Boolean, default=False, index=True)
+        UTCDateTime())
+    deleted_at = db.Column(UTCDateTime(), nullable=True)
+    expected_sent_at = db.Column(UTCDateTime(), index=True)
+    exactly_sent_at = db.Column(UTCDateTime(), nullable=True)
+    status = db.Column(db.SmallInteger, nullable=False,
+                       default=EventStatus.PENDING,
+                       server_default=str(EventStatus.PENDING))
+    error_message = db.Column(db.Text, nullable=True)
+    lease_owner = db.Column(db.String(120), nullable=True)
+    lease_expires_at = db.Column(UTCDateTime(), nullable=True)
+    # IANA zone the event was scheduled in; times themselves are UTC.
+    time_zone = db.Column(db.String(64), nullable=True)
+    # Delivery attempts that ended in a transient failure, and when the
+    # dispatcher may pick the event up again.
+    attempts = db.Column(db.Integer, nullable=False, default=0,
+                         server_default='0')
+    next_attempt_at = db.Column(UTCDateTime(), nullable=True)
+    # Client-chosen Idempotency-Key of the request that created the event.
+    idempotency_key = db.Column(db.String(255), nullable=True, unique=True)
+    # Subject and body are templates filled in with each recipient's
+    # variables; every address gets its own message.
+    personalized = db.Column(db.Boolean, nullable=False, default=False,
+                             server_default=db.false())
+
+    content = db.relationship('EventContent', lazy='select')
+    recipient_rows = db.relationship(
+        'EventRecipient', lazy='select', cascade='all, delete-orphan',
+        passive_deletes=True)
+
+    # Only pending and claimed events are polled, so delivered history stays
+    # out of the index the dispatcher scans.
+    __table_args__ = (
+        Index('idx_event_status_expected_sent_at',
+              'status', 'expected_sent_at', 'event_id',
+              postgresql_where=text('status IN (0, 1)'),
+              sqlite_where=text('status IN (0, 1)')),
+    )
+
+    @property
+    def email_content(self):
+        body = self.__dict__.get('_email_content')
+        if body is None and self.content is not None:
+            body = self.content.text
+        return body
+
+    @email_content.setter
+    def email_content(self, body):
+        # The event_content row is written by the before_flush hook below.
+        self._email_content = body
+        self.content_hash = content_hash(body)
+
+    # Read-only: status changes go through bulk UPDATEs filtered on
+    # EventStatus.sources, never through the ORM.
+    @hybrid_property
+    def is_sent(self):
+        return self.status == EventStatus.SENT
+
+    @hybrid_property
+    def is_failed(self):
+        return self.status == EventStatus.FAILED
+
+class EventRecipient(db.Model):
+    """Delivery state of one address of an Event.
+
+    Status uses the EventStatus values: claimed while a chunk is in flight,
+    back to pending after a transient failure, failed only for good. A retry
+    therefore resends just the addresses that did not go out.
+    """
+    __tablename__ = 'event_recipient'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'),
+                   primary_key=True)
+    event_id = db.Column(db.String(50),
+                         db.ForeignKey('event.event_id', ondelete='CASCADE'),
+                         nullable=False)
+    address = db.Column(db.String(320), nullable=False)
+    status = db.Column(db.SmallInteger, nullable=False,
+                       default=EventStatus.PENDING,
+                       server_default=str(EventStatus.PENDING))
+    sent_at = db.Column(UTCDateTime(), nullable=True)
+    # When the current claim was taken, so a reload can tell a chunk still
+    # in flight from one left behind by a dispatcher that went away.
+    claimed_at = db.Column(UTCDateTime(), nullable=True)
     error_message = db.Column(db.Text, nullable=True)
+    # JSON object of template variables, for personalized events only.
+    variables = db.Column(db.Text, nullable=True)
 
     __table_args__ = (
-        Index('idx_expected_sent_at_is_sent_is_failed_deleted_at',
-              'expected_sent_at', 'is_sent', 'is_failed', 'deleted_at'),
+        db.UniqueConstraint('event_id', 'address',
+                            name='uq_event_recipient_event_id_address'),
     )
 
+
+class EventContent(db.Model):
+    """An email body, stored once however many events send it.
+
+    Keyed by the SHA-256 of the text, so the rows of a campaign share one
+    body and a row never changes once written. ``encoding`` is 'none',
+    'zlib' or 'zstd' (see ``CONTENT_COMPRESSION``).
+    """
+    __tablename__ = 'event_content'
+
+    content_hash = db.Column(db.String(64), primary_key=True)
+    encoding = db.Column(db.String(16), nullable=False)
+    body = db.Column(db.LargeBinary, nullable=False)
+
+    @property
+    def text(self):
+        return decode(self.encoding, self.body)
+
+
+class ArchivedEvent(db.Model):
+    """A sent, failed or cancelled Event moved out of the hot table.
+
+    ``app.retention.archive_events`` moves terminal rows here in batches once
+    they are older than ``ARCHIVE_AFTER_DAYS``, so the ``event`` table and its
+    indexes only hold what the dispatcher and recent listings touch. Columns
+    mirror Event minus the dispatch lease.
+    """
+    __tablename__ = 'event_archive'
+
+    event_id = db.Column(db.String(50), primary_key=True, nullable=False)
+    email_subject = db.Column(db.String(120), nullable=False)
+    content_hash = db.Column(db.String(64),
+                             db.ForeignKey('event_content.content_hash'),
+                             nullable=False)
+    recipients = db.Column(db.Text, nullable=False)
+    created_at = db.Column(UTCDateTime())
+    updated_at = db.Column(UTCDateTime())
+    deleted_at = db.Column(UTCDateTime(), nullable=True)
+    expected_sent_at = db.Column(UTCDateTime())
+    exactly_sent_at = db.Column(UTCDateTime(), nullable=True)
+    status = db.Column(db.SmallInteger, nullable=False)
+    error_message = db.Column(db.Text, nullable=True)
+    time_zone = db.Column(db.String(64), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0,
+                         server_default='0')
+    next_attempt_at = db.Column(UTCDateTime(), nullable=True)
+    idempotency_key = db.Column(db.String(255), nullable=True)
+    personalized = db.Column(db.Boolean, nullable=False, default=False,
+                             server_default=db.false())
+    archived_at = db.Column(UTCDateTime(), nullable=False)
+
+    # History is listed newest first with the same keyset as the hot table.
+    __table_args__ = (
+        Index('idx_event_archive_expected_sent_at_event_id',
+              'expected_sent_at', 'event_id'),
+    )
+
+    content = db.relationship('EventContent', lazy='select')
+
+    @property
+    def email_content(self):
+        return self.content.text if self.content is not None else None
+
+
+class ArchivedEventRecipient(db.Model):
+    """Final delivery state of one address of an ArchivedEvent."""
+    __tablename__ = 'event_recipient_archive'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'),
+                   primary_key=True, autoincrement=False)
+    event_id = db.Column(db.String(50), nullable=False, index=True)
+    address = db.Column(db.String(320), nullable=False)
+    status = db.Column(db.SmallInteger, nullable=False)
+    sent_at = db.Column(UTCDateTime(), nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    variables = db.Column(db.Text, nullable=True)
+
+
 # Set created_at and updated_at before insert
 @event.listens_for(Event, 'before_insert')
 def receive_before_insert(mapper, connection, target):
@@ -39,3 +247,34 @@ def receive_before_insert(mapper, connection, target):
 @event.listens_for(Event, 'before_update')
 def receive_before_update(mapper, connection, target):
     target.updated_at = get_current_time()
+
+
+# Store the bodies of new or edited events before the events reference them
+@event.listens_for(db.session, 'before_flush')
+def receive_before_flush(session, flush_context, instances):
+    bodies = {}
+    for target in list(session.new) + list(session.dirty):
+        if isinstance(target, Event) and '_email_content' in target.__dict__ \
+                and inspect(target).attrs.content_hash.history.added:
+            bodies[target.content_hash] = target._email_content
+    if bodies:
+        store_contents(session.connection(), bodies)
+
+
+# Postgres wakes the worker's look-ahead whenever events are created or
+# rescheduled, so it never waits for its next load; one NOTIFY per
+# statement, and identical ones are folded per transaction. The migration
+# that adds the trigger creates the same objects.
+NOTIFY_CHANNEL = 'janus_event'
+
+event.listen(Event.__table__, 'after_create', DDL(f"""
+    CREATE OR REPLACE FUNCTION janus_notify_event() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    CREATE TRIGGER event_notify
+        AFTER INSERT OR UPDATE OF expected_sent_at ON event
+        FOR EACH STATEMENT EXECUTE PROCEDURE janus_notify_event();
+""").execute_if(dialect='postgresql'))
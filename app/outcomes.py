@@ -0,0 +1,296 @@
+import random
+import threading
+import time
+from datetime import timedelta
+from sqlalchemy import bindparam, case, exists, func, select
+from .db import db
+from .metrics import recipients_failed, recipients_retried, recipients_sent
+from .models import Event, EventRecipient, EventStatus
+from .utils.time_utils import get_current_time
+
+
+def backoff_delay(attempts, base, cap):
+    """Seconds before retry number ``attempts`` (1-based).
+
+    Exponential with "equal jitter": half the delay is fixed and half is
+    random, so events that failed together during an outage come back
+    spread out instead of all at once.
+    """
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class OutcomeBuffer:
+    """Collects delivery outcomes and writes them back in bulk.
+
+    An outcome covers the recipients of one sent chunk. Outcomes are
+    recorded only after the SMTP server accepted (or refused) the message
+    and are flushed every ``flush_size`` outcomes or ``flush_interval_ms``,
+    whichever comes first, inside a single transaction: one set-based UPDATE
+    per chunk on ``event_recipient``, then a few bulk UPDATEs that settle
+    every touched event with no chunk left in flight. A crash can therefore
+    lose the record of a send, which the lease makes visible again for a
+    retry, but never marks an event sent that was not sent.
+
+    Recipients refused with a transient error go back to pending and their
+    event is retried after a jittered exponential backoff, up to
+    ``RETRY_MAX_ATTEMPTS`` attempts; permanent refusals fail at once.
+
+    Recipients are claimed as their chunks are submitted, so an event is
+    only settled after ``finish``: between ``begin`` and ``finish`` its
+    unclaimed recipients are still waiting for a chunk, not for a retry.
+    Until then, and while recipients it ``submitted`` have no outcome yet,
+    flushes also extend the event's lease every third of
+    ``DISPATCH_LEASE_SECONDS``, so a long send is not taken over and sent
+    twice.
+    """
+
+    def __init__(self, app, flush_size=100, flush_interval_ms=500):
+        self.engine = db.get_engine(app)
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_attempts = app.config['RETRY_MAX_ATTEMPTS']
+        self.retry_base = app.config['RETRY_BASE_SECONDS']
+        self.retry_cap = app.config['RETRY_MAX_SECONDS']
+        self.lease_seconds = app.config['DISPATCH_LEASE_SECONDS']
+        self._pending = []
+        self._streaming = set()
+        # event_id -> [lease owner, recipients submitted without an outcome]
+        self._leases = {}
+        self._renew_at = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._timer = None
+        if self.flush_interval > 0:
+            self._timer = threading.Thread(target=self._run, daemon=True,
+                                           name='outcome-flush')
+            self._timer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def sent(self, event_id, recipient_ids, sent_at):
+        self._record((event_id, tuple(recipient_ids), EventStatus.SENT,
+                      sent_at, None))
+
+    def failed(self, event_id, recipient_ids, error_message, failed_at,
+               permanent=True):
+        status = EventStatus.FAILED if permanent else EventStatus.PENDING
+        self._record((event_id, tuple(recipient_ids), status, failed_at,
+                      error_message))
+
+    def begin(self, event_id, owner):
+        with self._lock:
+            self._streaming.add(event_id)
+            self._leases.setdefault(event_id, [owner, 0])
+
+    def submitted(self, event_id, count):
+        with self._lock:
+            if event_id in self._leases:
+                self._leases[event_id][1] += count
+
+    def finish(self, event_id):
+        # Every chunk is submitted: settle the event once they are in.
+        with self._lock:
+            self._streaming.discard(event_id)
+            self._release(event_id)
+        self._record((event_id, (), None, None, None))
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                outcomes, self._pending = self._pending, []
+                settle = {outcome[0] for outcome in outcomes} \
+                    - self._streaming
+            if outcomes:
+                self._write(outcomes, settle)
+            if self._leases and time.monotonic() >= self._renew_at:
+                self._renew()
+
+    def close(self):
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush()
+
+    def _record(self, outcome):
+        event_id, recipient_ids = outcome[:2]
+        with self._lock:
+            self._pending.append(outcome)
+            if recipient_ids and event_id in self._leases:
+                self._leases[event_id][1] -= len(recipient_ids)
+                self._release(event_id)
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self.flush()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def _write(self, outcomes, settle):
+        try:
+            with self.engine.begin() as connection:
+                for statement in _build_updates(outcomes):
+                    connection.execute(statement)
+                exhausted = (self._settle(connection, settle)
+                             if settle else 0)
+        except Exception as e:
+            # Keep the outcomes for the next flush rather than dropping
+            # the record of emails that were already sent.
+            with self._lock:
+                self._pending[:0] = outcomes
+            print("outcome flush error : ", e)
+            return
+        _count(outcomes, exhausted)
+
+    def _release(self, event_id):
+        # Called with the lock held: nothing of the event is left in flight.
+        lease = self._leases.get(event_id)
+        if (lease is not None and lease[1] <= 0
+                and event_id not in self._streaming):
+            del self._leases[event_id]
+
+    def _renew(self):
+        """Extend the leases this buffer still has sends outstanding for.
+
+        A lease lost to another dispatcher is left alone and forgotten.
+        """
+        self._renew_at = time.monotonic() + self.lease_seconds / 3
+        with self._lock:
+            owners = {}
+            for event_id, (owner, _) in self._leases.items():
+                owners.setdefault(owner, []).append(event_id)
+        table = Event.__table__
+        expires_at = get_current_time() + timedelta(seconds=self.lease_seconds)
+        held = set()
+        try:
+            with self.engine.begin() as connection:
+                for owner, event_ids in owners.items():
+                    leased = (table.c.event_id.in_(event_ids),
+                              table.c.status == EventStatus.CLAIMED,
+                              table.c.lease_owner == owner)
+                    connection.execute(table.update().where(*leased)
+                                       .values(lease_expires_at=expires_at))
+                    held.update(connection.execute(
+                        select(table.c.event_id).where(*leased)).scalars())
+        except Exception as e:
+            print("lease renewal error : ", e)
+            return
+        with self._lock:
+            for event_ids in owners.values():
+                for event_id in set(event_ids) - held:
+                    self._leases.pop(event_id, None)
+
+    def _settle(self, connection, event_ids):
+        """Finish, retry or fail every event with no chunk in flight.
+
+        Returns how many pending recipients failed with an event that ran
+        out of attempts.
+        """
+        recipients = EventRecipient.__table__
+        table = Event.__table__
+
+        def of_event(*criteria):
+            return (recipients.c.event_id == table.c.event_id,) + criteria
+
+        def has(status):
+            return exists().where(*of_event(recipients.c.status == status))
+
+        rows = connection.execute(select(
+            table.c.event_id, table.c.attempts,
+            has(EventStatus.PENDING).label('retry'),
+            has(EventStatus.FAILED).label('failed'),
+            has(EventStatus.SENT).label('sent'),
+            select(func.min(recipients.c.error_message)).where(*of_event(
+                recipients.c.status != EventStatus.SENT,
+                recipients.c.error_message.isnot(None))
+            ).scalar_subquery().label('error'),
+        ).where(
+            table.c.event_id.in_(event_ids),
+            table.c.status.in_(EventStatus.ACTIVE),
+            ~has(EventStatus.CLAIMED)))
+
+        now = get_current_time()
+        sent_at = select(func.max(recipients.c.sent_at)) \
+            .where(*of_event()).scalar_subquery()
+        sent, failed, retry = [], {}, {}
+        exhausted = 0
+        for row in rows:
+            if row.retry and row.attempts + 1 < self.max_attempts:
+                retry[row.event_id] = (row.attempts + 1, row.error)
+            elif row.retry or row.failed or not row.sent:
+                failed[row.event_id] = row.error or 'No recipients.'
+            else:
+                sent.append(row.event_id)
+
+        # Each UPDATE only moves events from a state allowed to reach its
+        # target, so an event settled meanwhile is never overwritten.
+        if sent:
+            connection.execute(table.update().where(
+                table.c.event_id.in_(sent),
+                table.c.status.in_(EventStatus.sources(EventStatus.SENT))
+            ).values(
+                status=EventStatus.SENT, updated_at=now, error_message=None,
+                exactly_sent_at=sent_at))
+        if failed:
+            # Out of attempts: what is left pending fails with the event. Its
+            # sent addresses stay sent.
+            exhausted = connection.execute(recipients.update().where(
+                recipients.c.event_id.in_(failed),
+                recipients.c.status == EventStatus.PENDING
+            ).values(status=EventStatus.FAILED)).rowcount
+            connection.execute(table.update().where(
+                table.c.event_id.in_(failed),
+                table.c.status.in_(EventStatus.sources(EventStatus.FAILED))
+            ).values(status=EventStatus.FAILED, updated_at=now,
+                     exactly_sent_at=sent_at,
+                     error_message=case(failed, value=table.c.event_id)))
+        if retry:
+            # Claimed, or already pending again if its lease ran out first.
+            connection.execute(table.update().where(
+                table.c.event_id == bindparam('event'),
+                table.c.status.in_(EventStatus.ACTIVE)
+            ).values(
+                status=EventStatus.PENDING, updated_at=now,
+                lease_owner=None, lease_expires_at=None,
+                attempts=bindparam('attempts'),
+                next_attempt_at=bindparam('next_attempt_at'),
+                error_message=bindparam('error')
+            ), [{
+                'event': event_id, 'attempts': attempts, 'error': error,
+                'next_attempt_at': now + timedelta(seconds=backoff_delay(
+                    attempts, self.retry_base, self.retry_cap)),
+            } for event_id, (attempts, error) in retry.items()])
+        return exhausted
+
+
+def _count(outcomes, exhausted):
+    # Counted once the transaction committed, off the send path.
+    for _, recipient_ids, status, _, _ in outcomes:
+        if status == EventStatus.SENT:
+            recipients_sent.inc(len(recipient_ids))
+        elif status == EventStatus.FAILED:
+            recipients_failed.inc(len(recipient_ids))
+        elif status == EventStatus.PENDING:
+            recipients_retried.inc(len(recipient_ids))
+    if exhausted:
+        recipients_failed.inc(exhausted)
+
+
+def _build_updates(outcomes):
+    recipients = EventRecipient.__table__
+
+    for _, recipient_ids, status, at, error in outcomes:
+        if not recipient_ids:
+            continue
+        values = {'status': status, 'error_message': error}
+        if status == EventStatus.SENT:
+            values['sent_at'] = at
+        yield recipients.update().where(
+            recipients.c.id.in_(recipient_ids),
+            recipients.c.status.in_(EventStatus.ACTIVE)).values(**values)
@@ -0,0 +1,178 @@
+import smtplib
+import threading
+import time
+from .metrics import FunctionCounter, Gauge
+
+# Replies that mean "slow down" rather than "this message is bad".
+THROTTLE_CODES = (421, 451)
+
+
+class RateLimiter:
+    """Token bucket that paces SMTP sends and adapts to provider throttling.
+
+    ``acquire`` takes one token, sleeping outside the lock until the
+    reserved token is due. ``throttled`` multiplies the rate by ``backoff``
+    (at most once per ``cooldown``, so a burst of 421s from parallel senders
+    backs off once) and ``acquire`` multiplies it back up by ``recovery``
+    every ``recovery_interval`` without a throttle, up to the configured
+    rate. With no configured rate the limiter only paces after the provider
+    pushed back, starting below the rate that was being sent and then
+    probing upwards.
+    """
+
+    def __init__(self, rate=0, burst=10, min_rate=1.0, backoff=0.7,
+                 recovery=1.05, recovery_interval=1.0, cooldown=1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.backoff = backoff
+        self.recovery = recovery
+        self.recovery_interval = recovery_interval
+        self.cooldown = cooldown
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._exported = False
+        self.configure(rate, burst, min_rate)
+
+    def init_app(self, app):
+        self.configure(rate=app.config['SMTP_RATE_LIMIT'],
+                       burst=app.config['SMTP_BURST'],
+                       min_rate=app.config['SMTP_MIN_RATE'])
+
+    def configure(self, rate=0, burst=10, min_rate=1.0):
+        with self._lock:
+            self.max_rate = rate or None
+            self.rate = self.max_rate
+            self.burst = max(1, burst)
+            self.min_rate = min_rate
+            self.tokens = float(self.burst)
+            self.waits = 0
+            self.wait_seconds = 0.0
+            self.throttles = 0
+            self._updated = self._calm_since = self._throttled_at = \
+                self._window_start = self.clock()
+            self._window_count = 0
+            self._sent_rate = 0.0
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            self.sleep(wait)
+        return wait
+
+    def reserve(self):
+        """Take one token and return how long to wait before using it.
+
+        For callers that cannot block, such as coroutines, which sleep off
+        the wait themselves.
+        """
+        with self._lock:
+            now = self.clock()
+            self._count(now)
+            if self.rate is None:
+                return 0.0
+            self._recover(now)
+            self.tokens = min(self.burst, self.tokens
+                              + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now and sleep off the deficit outside the
+            # lock, so concurrent senders queue up in order.
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait:
+                self.waits += 1
+                self.wait_seconds += wait
+            return wait
+
+    def throttled(self):
+        with self._lock:
+            now = self.clock()
+            self._calm_since = now
+            if now - self._throttled_at < self.cooldown and self.throttles:
+                return
+            self._throttled_at = now
+            self.throttles += 1
+            current = self.rate or max(self._sent_rate,
+                                       self._window_rate(now), self.min_rate)
+            self.rate = max(self.min_rate, current * self.backoff)
+            self.tokens = min(self.tokens, 0.0)
+            self._updated = now
+
+    def export(self, registry):
+        """Publish the limiter's state in ``registry``, once.
+
+        Only processes that send mail call this; anywhere else the limiter
+        is never used and would only ever report an idle state.
+        """
+        if self._exported:
+            return
+        self._exported = True
+
+        def field(name):
+            return lambda: self.snapshot()[name]
+
+        Gauge('janus_smtp_rate_limit_rate',
+              'Messages per second the SMTP rate limiter allows right now; '
+              'absent while unlimited.', field('rate'), registry)
+        Gauge('janus_smtp_rate_limit_max_rate',
+              'SMTP_RATE_LIMIT; absent when not configured.',
+              field('max_rate'), registry)
+        Gauge('janus_smtp_rate_limit_tokens',
+              'Tokens left in the bucket; negative while sends queue up.',
+              field('tokens'), registry)
+        FunctionCounter('janus_smtp_rate_limit_waits',
+                        'Sends the rate limiter delayed.',
+                        field('waits'), registry)
+        FunctionCounter('janus_smtp_rate_limit_wait_seconds',
+                        'Time sends spent waiting on the rate limiter.',
+                        field('wait_seconds'), registry)
+        FunctionCounter('janus_smtp_rate_limit_throttles',
+                        'Throttling replies that backed the rate off.',
+                        field('throttles'), registry)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'max_rate': self.max_rate,
+                'tokens': self.tokens if self.rate is not None else None,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 6),
+                'throttles': self.throttles,
+            }
+
+    def _recover(self, now):
+        if now - self._calm_since < self.recovery_interval:
+            return
+        self._calm_since = now
+        if self.max_rate is None:
+            # No configured ceiling: keep probing upwards until the provider
+            # pushes back again.
+            self.rate *= self.recovery
+        elif self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate * self.recovery)
+
+    def _count(self, now):
+        # Sends per second over the last full second, used as the starting
+        # point when an unlimited sender gets throttled.
+        self._window_count += 1
+        if now - self._window_start >= 1.0:
+            self._sent_rate = self._window_rate(now)
+            self._window_start = now
+            self._window_count = 0
+
+    def _window_rate(self, now):
+        elapsed = now - self._window_start
+        return self._window_count / elapsed if elapsed > 0 else 0.0
+
+
+def is_throttled(error):
+    """True for SMTP replies asking the client to slow down and retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(
+            code in THROTTLE_CODES for code, _ in error.recipients.values())
+    return getattr(error, 'smtp_code', None) in THROTTLE_CODES
+
+
+# Shared by every MailPool of the process, since provider caps are per
+# account rather than per connection.
+smtp_limiter = RateLimiter()
@@ -0,0 +1,77 @@
+from datetime import timedelta
+from sqlalchemy import literal, select
+from .db import db
+from .metrics import events_archived
+from .models import (ArchivedEvent, ArchivedEventRecipient, Event,
+                     EventRecipient, EventStatus)
+from .utils.time_utils import get_current_time
+
+# Events the dispatcher is done with.
+TERMINAL = (EventStatus.SENT, EventStatus.FAILED, EventStatus.CANCELLED)
+
+
+def archive_batch(cutoff, limit, archived_at=None):
+    """Move up to ``limit`` terminal events due before ``cutoff``, and their
+    recipients, to the archive tables in one transaction.
+
+    Rows are copied with INSERT ... SELECT and deleted from the hot tables,
+    so nothing passes through Python. Rows locked by another archiver are
+    skipped. Returns how many events were moved.
+    """
+    archived_at = archived_at or get_current_time()
+    event_ids = [event_id for event_id, in Event.query.filter(
+        Event.status.in_(TERMINAL), Event.expected_sent_at < cutoff
+    ).order_by(Event.expected_sent_at).limit(limit)
+        .with_for_update(skip_locked=True).with_entities(Event.event_id)]
+    if not event_ids:
+        db.session.commit()
+        return 0
+
+    events = Event.__table__
+    recipients = EventRecipient.__table__
+    archive = ArchivedEvent.__table__
+    columns = [column.name for column in archive.columns
+               if column.name != 'archived_at']
+    db.session.execute(archive.insert().from_select(
+        columns + ['archived_at'],
+        select(*[events.c[name] for name in columns],
+               literal(archived_at, ArchivedEvent.archived_at.type))
+        .where(events.c.event_id.in_(event_ids))))
+
+    recipient_archive = ArchivedEventRecipient.__table__
+    recipient_columns = [column.name for column in recipient_archive.columns]
+    db.session.execute(recipient_archive.insert().from_select(
+        recipient_columns,
+        select(*[recipients.c[name] for name in recipient_columns])
+        .where(recipients.c.event_id.in_(event_ids))))
+
+    # Explicit, since SQLite does not enforce the ON DELETE CASCADE.
+    db.session.execute(recipients.delete().where(
+        recipients.c.event_id.in_(event_ids)))
+    db.session.execute(events.delete().where(
+        events.c.event_id.in_(event_ids)))
+    db.session.commit()
+    events_archived.inc(len(event_ids))
+    return len(event_ids)
+
+
+def archive_events(app, stopping=None):
+    """Move sent, failed and cancelled events older than
+    ``ARCHIVE_AFTER_DAYS`` out of the hot tables, ``ARCHIVE_BATCH_SIZE`` at a
+    time.
+
+    Each batch commits on its own, so locks stay short and an interrupted
+    run simply continues on the next one.
+    """
+    with app.app_context():
+        cutoff = get_current_time() - timedelta(
+            days=app.config['ARCHIVE_AFTER_DAYS'])
+        limit = app.config['ARCHIVE_BATCH_SIZE']
+        total = 0
+        while stopping is None or not stopping.is_set():
+            moved = archive_batch(cutoff, limit)
+            total += moved
+            if moved < limit:
+                break
+        print("archived events : ", total)
+        return total
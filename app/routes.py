@@ -1,30 +1,189 @@
-from flask import Blueprint, request, render_template, redirect, url_for, flash, jsonify
+from flask import (Blueprint, request, render_template, redirect, url_for,
+                   flash, jsonify, current_app, g, Response)
 from . import db
-from .models import Event
+from .content import content_hash, load_bodies, store_contents
+from .models import ArchivedEvent, Event, EventRecipient, EventStatus
+from .idempotency import idempotency_cache
+from .metrics import REGISTRY, http_request_seconds
+from .mime import compile_template
 from datetime import datetime
+import base64
+import heapq
+import json
+import time
 import uuid
-from .utils.email_utils import validate_and_get_recipients
-from .utils.time_utils import get_default_time_zone
-import pytz
-from pytz import timezone, UTC
-from sqlalchemy import desc
+from functools import lru_cache
+from itertools import islice
+from .utils.email_utils import (RecipientResult, check_email,
+                                validate_and_get_recipients)
+from .utils.time_utils import (get_current_time, get_default_time_zone,
+                               get_time_zone, to_utc)
+from sqlalchemy import desc, tuple_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from jinja2 import TemplateError
 from flask import Flask, send_from_directory
 
 main = Blueprint('main', __name__)
 
 
+@main.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@main.after_request
+def _observe_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        http_request_seconds.observe(
+            time.perf_counter() - started,
+            (request.method, request.endpoint, str(response.status_code)))
+    return response
+
+
+def _encode_cursor(row):
+    value = json.dumps([row.expected_sent_at.isoformat(), row.event_id])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        expected_sent_at, event_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(expected_sent_at), event_id
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor.')
+
+
+def _list_events(columns, status=None, cursor=None, limit=None):
+    """Return one page of events, newest first, and the next page's cursor.
+
+    Keyset pagination on (expected_sent_at, event_id) keeps every page an
+    index range scan. Rows are plain read-only tuples of ``columns``.
+
+    Sent, failed and cancelled events may have been moved to
+    ``event_archive``; unless only pending or claimed events are asked for,
+    a page of the archive is read with the same keyset and merged in.
+    """
+    page_size = current_app.config['EVENTS_PAGE_SIZE']
+    limit = min(limit or page_size, current_app.config['EVENTS_MAX_PAGE_SIZE'])
+    if limit < 1:
+        raise ValueError('Invalid limit.')
+    status = None if status is None else EventStatus.from_name(status)
+    after = _decode_cursor(cursor) if cursor else None
+
+    def page(model):
+        if status is None:
+            query = model.query.filter(model.status != EventStatus.CANCELLED)
+        else:
+            query = model.query.filter(model.status == status)
+        if after:
+            query = query.filter(tuple_(model.expected_sent_at, model.event_id)
+                                 < tuple_(*after, types=(
+                                     model.expected_sent_at.type,
+                                     model.event_id.type)))
+        return query.order_by(desc(model.expected_sent_at),
+                              desc(model.event_id)) \
+            .with_entities(*[getattr(model, column.key) for column in columns]) \
+            .limit(limit + 1).all()
+
+    rows = page(Event)
+    if status not in EventStatus.ACTIVE:
+        rows = list(islice(heapq.merge(
+            rows, page(ArchivedEvent), reverse=True,
+            key=lambda row: (row.expected_sent_at, row.event_id)), limit + 1))
+
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _request_time_zone():
+    """Return the zone named by ``?tz=`` or ``X-Time-Zone``, if any."""
+    zone = request.args.get('tz') or request.headers.get('X-Time-Zone')
+    if zone:
+        get_time_zone(zone)
+    return zone
+
+
+def _localize(rows, zone=None):
+    """Convert the datetimes of the rows being displayed, in one pass.
+
+    Each row is shown in ``zone`` when the request names one and otherwise
+    in the zone its event was scheduled in. Rows become plain dicts, so the
+    stored values are never touched.
+    """
+    default = get_default_time_zone()
+    events = []
+    for row in rows:
+        event = row._asdict()
+        tz = get_time_zone(zone or event['time_zone'] or default)
+        for field in ('expected_sent_at', 'exactly_sent_at',
+                      'next_attempt_at'):
+            if event.get(field) is not None:
+                event[field] = to_utc(event[field]).astimezone(tz)
+        events.append(event)
+    return events
+
+
 @main.route('/')
 def index():
-    events = Event.query.order_by(desc(Event.expected_sent_at)).all()
-    tz = timezone(get_default_time_zone())
+    status = request.args.get('status') or None
+    try:
+        zone = _request_time_zone()
+        events, next_cursor = _list_events(
+            (Event.event_id, Event.email_subject, Event.content_hash,
+             Event.recipients, Event.expected_sent_at, Event.status,
+             Event.time_zone),
+            status=status, cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int))
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.index'))
 
+    events = _localize(events, zone)
+    # One read per distinct body on the page, not one per event.
+    bodies = load_bodies(event['content_hash'] for event in events)
     for event in events:
-        if event.expected_sent_at.tzinfo is None:
-            event.expected_sent_at = event.expected_sent_at.replace(tzinfo=UTC)
-        event.expected_sent_at = event.expected_sent_at.astimezone(
-            tz)
+        event['email_content'] = bodies.get(event['content_hash'])
+    return render_template('index.html', events=events,
+                           status=status,
+                           next_cursor=next_cursor,
+                           status_names=EventStatus.NAMES)
+
+
+@main.route('/api/events', methods=['GET'])
+def list_emails():
+    try:
+        zone = _request_time_zone()
+        events, next_cursor = _list_events(
+            (Event.event_id, Event.email_subject, Event.recipients,
+             Event.expected_sent_at, Event.exactly_sent_at, Event.status,
+             Event.error_message, Event.time_zone, Event.attempts,
+             Event.next_attempt_at, Event.personalized),
+            status=request.args.get('status') or None,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return render_template('index.html', events=events)
+    return jsonify({
+        'events': [{
+            'event_id': event['event_id'],
+            'email_subject': event['email_subject'],
+            'recipients': event['recipients'],
+            'expected_sent_at': event['expected_sent_at'].isoformat(),
+            'exactly_sent_at': event['exactly_sent_at'].isoformat()
+            if event['exactly_sent_at'] else None,
+            'time_zone': event['time_zone'],
+            'status': EventStatus.NAMES[event['status']],
+            'error_message': event['error_message'],
+            'attempts': event['attempts'],
+            'next_attempt_at': event['next_attempt_at'].isoformat()
+            if event['next_attempt_at'] else None,
+            'personalized': event['personalized'],
+        } for event in _localize(events, zone)],
+        'next_cursor': next_cursor,
+    })
 
 
 @main.route('/add', methods=['GET', 'POST'])
@@ -34,14 +193,19 @@ def add_email():
         email_content = request.form.get('email_content')
         expected_sent_at = request.form.get('send_at')
         recipients_str = request.form.get('recipients')
-        _, error = validate_and_get_recipients(recipients_str)
+        recipients, error = validate_and_get_recipients(recipients_str)
         if error:
             flash(error, 'error')
             return redirect(url_for('main.add_email'))
 
         event_id = str(uuid.uuid4())
 
-        tz = pytz.timezone(get_default_time_zone())
+        zone = request.form.get('time_zone') or get_default_time_zone()
+        try:
+            tz = get_time_zone(zone)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('main.add_email'))
 
         try:
             send_at = datetime.fromisoformat(expected_sent_at)
@@ -54,7 +218,10 @@ def add_email():
             email_subject=email_subject,
             email_content=email_content,
             expected_sent_at=send_at,
-            recipients=recipients_str
+            time_zone=zone,
+            recipients=','.join(recipients),
+            recipient_rows=[EventRecipient(address=address)
+                            for address in recipients]
         )
 
         db.session.add(new_event)
@@ -65,44 +232,318 @@ def add_email():
     return render_template('add_email.html')
 
 
-@main.route('/api/events', methods=['POST'])
-def save_emails():
-    data = request.get_json()
+@lru_cache(maxsize=4096)
+def _parse_expected_sent_at(value, zone):
+    # Rows of a campaign usually share a send time; parse and localize once.
+    return get_time_zone(zone).localize(datetime.fromisoformat(value))
+
+
+def _parse_event(data, zone):
+    """Validate one event payload and return ``(row, error)``.
+
+    ``zone`` is the request's time zone; a ``time_zone`` field on the
+    payload overrides it for that event.
+    """
+    if not isinstance(data, dict):
+        return None, 'Each event must be a JSON object.'
 
     # Validate and get recipients
     recipients_str = data.get('recipients', '')
-    _, error = validate_and_get_recipients(recipients_str)
+    recipients, error = validate_and_get_recipients(recipients_str)
     if error:
-        return jsonify({'error': error}), 400
+        return None, error
+
+    row, error = _parse_fields(data, zone)
+    if error:
+        return None, error
+    # Trimmed and deduplicated; one event_recipient row per address.
+    row['recipients'] = ','.join(recipients)
+    return row, None
+
 
+def _parse_fields(data, zone):
+    """Validate everything but the recipients of an event payload."""
     email_subject = data.get('email_subject')
     email_content = data.get('email_content')
     expected_sent_at_str = data.get('expected_sent_at')
 
     if not email_subject or not email_content or not expected_sent_at_str:
-        return jsonify({'error': 'Missing required fields.'}), 400
+        return None, 'Missing required fields.'
 
-    tz = pytz.timezone(get_default_time_zone())
+    if len(email_subject) > Event.email_subject.type.length:
+        return None, 'Email subject is too long.'
 
+    zone = data.get('time_zone') or zone
+    if not isinstance(zone, str):
+        return None, 'Invalid time zone.'
     try:
-        expected_sent_at_naive = datetime.fromisoformat(expected_sent_at_str)
-        expected_sent_at = tz.localize(expected_sent_at_naive)
-    except ValueError:
-        return jsonify({'error': 'Invalid datetime format. Use ISO 8601 format.'}), 400
+        get_time_zone(zone)
+    except ValueError as e:
+        return None, str(e)
+
+    try:
+        expected_sent_at = _parse_expected_sent_at(expected_sent_at_str, zone)
+    except (TypeError, ValueError):
+        return None, 'Invalid datetime format. Use ISO 8601 format.'
+
+    return {
+        'event_id': str(uuid.uuid4()),
+        'email_subject': email_subject,
+        'email_content': email_content,
+        'expected_sent_at': expected_sent_at,
+        'time_zone': zone,
+    }, None
+
+
+def _insert_events(rows):
+    # Core multi-row insert: skips the ORM unit of work, so the
+    # before_insert timestamps are filled in here.
+    now = get_current_time()
+    bodies = {}
+    for row in rows:
+        body = row.pop('email_content')
+        row.update(created_at=now, updated_at=now,
+                   status=EventStatus.PENDING, content_hash=content_hash(body))
+        # A campaign's rows share their body; it is stored once.
+        bodies[row['content_hash']] = body
+    store_contents(db.session.connection(), bodies)
+    db.session.execute(Event.__table__.insert(), rows)
+    db.session.execute(EventRecipient.__table__.insert(), [
+        {'event_id': row['event_id'], 'address': address,
+         'status': EventStatus.PENDING}
+        for row in rows for address in row['recipients'].split(',')])
+    db.session.commit()
 
-    event_id = str(uuid.uuid4())
 
-    new_event = Event(
-        event_id=event_id,
-        email_subject=email_subject,
-        email_content=email_content,
-        expected_sent_at=expected_sent_at,
-        recipients=recipients_str
-    )
+def _read_batch():
+    """Yield event payloads from a JSON array or an NDJSON stream."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+        return
 
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array or NDJSON body.')
+    yield from data
+
+
+def _replay(response):
+    body, status = response
+    return jsonify(body), status, {'Idempotent-Replayed': 'true'}
+
+
+@main.route('/api/events', methods=['POST'])
+def save_emails():
+    # A client retrying after a timeout sends the same Idempotency-Key and
+    # gets the first response back instead of a second event.
+    key = request.headers.get('Idempotency-Key')
+    if key is not None:
+        if not key or len(key) > Event.idempotency_key.type.length:
+            return jsonify({'error': 'Invalid Idempotency-Key.'}), 400
+        response = idempotency_cache.get(key)
+        if response is not None:
+            return _replay(response)
+
+    data = request.get_json()
+
+    try:
+        zone = _request_time_zone() or get_default_time_zone()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    row, error = _parse_event(data, zone)
+    if error:
+        return jsonify({'error': error}), 400
+
+    new_event = Event(**row, idempotency_key=key, recipient_rows=[
+        EventRecipient(address=address)
+        for address in row['recipients'].split(',')])
+
+    response = ({"status": "success", "message": "Email scheduled successfully"}, 201)
     db.session.add(new_event)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # The same key was saved first by a concurrent request, or before
+        # this process started.
+        if key is None or not Event.query.filter_by(
+                idempotency_key=key).with_entities(Event.event_id).first():
+            raise
+        idempotency_cache.put(key, response)
+        return _replay(response)
+    if key is not None:
+        idempotency_cache.put(key, response)
+    return jsonify(response[0]), response[1]
+
+
+@main.route('/api/events/batch', methods=['POST'])
+def save_emails_batch():
+    try:
+        zone = _request_time_zone() or get_default_time_zone()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    chunk_size = current_app.config['BATCH_INSERT_CHUNK_SIZE']
+    created = 0
+    errors = []
+    chunk = []
+    indexes = []
+
+    def flush():
+        nonlocal created
+        try:
+            _insert_events(chunk)
+            created += len(chunk)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            errors.extend({'index': i, 'error': 'Could not save event.'}
+                          for i in indexes)
+            print(str(e))
+        chunk.clear()
+        indexes.clear()
+
+    try:
+        for index, data in enumerate(_read_batch()):
+            row, error = _parse_event(data, zone)
+            if error:
+                errors.append({'index': index, 'error': error})
+                continue
+            chunk.append(row)
+            indexes.append(index)
+            if len(chunk) >= chunk_size:
+                flush()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if chunk:
+        flush()
+
+    status = 'success' if not errors else 'partial' if created else 'error'
+    return jsonify({'status': status, 'created': created,
+                    'errors': errors}), 201 if created else 400
+
+
+def _read_campaign():
+    """Return a campaign's fields and an iterator over its recipients.
+
+    JSON bodies carry the recipients as a ``recipients`` array; NDJSON
+    streams the fields on the first line and one recipient per line after
+    it, so a large list is never held in memory at once.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        lines = (line.strip() for line in request.stream)
+        lines = (line for line in lines if line)
+        try:
+            data = json.loads(next(lines, b'null'))
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise ValueError('The first line must be the campaign object.')
+
+        def recipients():
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+        return data, recipients()
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(
+            data.get('recipients'), list):
+        raise ValueError('Expected a JSON object with a recipients array, '
+                         'or NDJSON.')
+    return data, iter(data['recipients'])
+
+
+def _campaign_recipient(item, result, seen):
+    """Return ``(address, variables)`` for a valid, new recipient, else None;
+    invalid and duplicate ones are tallied on ``result``."""
+    email = item.get('email') if isinstance(item, dict) else None
+    variables = item.get('variables', {}) if isinstance(item, dict) else None
+    checked = check_email(email) if isinstance(email, str) else None
+    if checked is None or not isinstance(variables, dict):
+        result.invalid_count += 1
+        if len(result.invalid) < result.max_invalid:
+            result.invalid.append(email if isinstance(email, str)
+                                  else json.dumps(item))
+        return None
+    if checked[1] in seen:
+        result.duplicate_count += 1
+        return None
+    seen.add(checked[1])
+    return checked[0], json.dumps(variables, separators=(',', ':'))
+
+
+@main.route('/api/campaigns', methods=['POST'])
+def save_campaign():
+    """One personalized event: a subject and body template sent to each
+    recipient with their own variables."""
+    try:
+        zone = _request_time_zone() or get_default_time_zone()
+        data, recipients = _read_campaign()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    row, error = _parse_fields(data, zone)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        compile_template(row['email_subject'])
+        compile_template(row['email_content'])
+    except TemplateError as e:
+        return jsonify({'error': f'Invalid template: {e}'}), 400
+
+    # The body is stored once; addresses and variables are the only
+    # per-recipient data. Everything commits together, so the dispatcher
+    # never sees half a campaign.
+    now = get_current_time()
+    body = row.pop('email_content')
+    row.update(created_at=now, updated_at=now, status=EventStatus.PENDING,
+               content_hash=content_hash(body), personalized=True,
+               recipients='')
+    store_contents(db.session.connection(), {row['content_hash']: body})
+    db.session.execute(Event.__table__.insert(), [row])
+
+    chunk_size = current_app.config['BATCH_INSERT_CHUNK_SIZE']
+    result = RecipientResult()
+    seen = set()
+    chunk = []
+    created = 0
+    for item in recipients:
+        recipient = _campaign_recipient(item, result, seen)
+        if recipient is None:
+            continue
+        chunk.append({'event_id': row['event_id'], 'address': recipient[0],
+                      'variables': recipient[1],
+                      'status': EventStatus.PENDING})
+        if len(chunk) >= chunk_size:
+            db.session.execute(EventRecipient.__table__.insert(), chunk)
+            created += len(chunk)
+            chunk.clear()
+    if chunk:
+        db.session.execute(EventRecipient.__table__.insert(), chunk)
+        created += len(chunk)
+    if not created:
+        db.session.rollback()
+        return jsonify({'error': result.error or 'Recipients are required.'}), 400
     db.session.commit()
-    return jsonify({"status": "success", "message": "Email scheduled successfully"}), 201
+
+    return jsonify({'status': 'partial' if result.invalid_count else 'success',
+                    'event_id': row['event_id'],
+                    'recipients': created,
+                    'duplicates': result.duplicate_count,
+                    'error': result.error}), 201
+
+
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format; each process (web, worker) exposes its own.
+    return Response(REGISTRY.render(), content_type=REGISTRY.CONTENT_TYPE)
 
 
 @main.route('/swagger/swagger.yaml')
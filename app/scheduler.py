@@ -1,10 +1,67 @@
+import threading
 from apscheduler.schedulers.background import BackgroundScheduler
-from .tasks import send_scheduled_emails
-from datetime import datetime, timedelta
+from .delivery import get_backend
+from .lookahead import lookahead
+from .metrics import REGISTRY
+from .outcomes import OutcomeBuffer
+from .ratelimit import smtp_limiter
+from .retention import archive_events
+from .tasks import prerender_due_events, send_scheduled_emails
+from datetime import datetime
+
+# Set while the dispatcher drains: a running cycle stops claiming batches.
+stopping = threading.Event()
+
+# The delivery backend and outcome buffer of this process, shared by the
+# poll and the look-ahead timer so DISPATCH_WORKERS bounds both.
+delivery = {}
 
 
 def start_scheduler(app):
+    stopping.clear()
+    # This process sends mail, so its limiter state is worth scraping.
+    smtp_limiter.export(REGISTRY)
+    backend = delivery['backend'] = get_backend(app)
+    outcomes = delivery['outcomes'] = OutcomeBuffer(
+        app, flush_size=app.config['STATUS_FLUSH_SIZE'],
+        flush_interval_ms=app.config['STATUS_FLUSH_INTERVAL_MS'])
     scheduler = BackgroundScheduler()
-    job = scheduler.add_job(send_scheduled_emails, 'interval', minutes=1, args=[app])
-    print(f"Scheduled a one-time job with ID: {job.id} to run at", datetime.now() + timedelta(minutes=1))
+    # First cycle right away, so a restarted worker picks up the backlog.
+    job = scheduler.add_job(send_scheduled_emails, 'interval', minutes=1,
+                            args=[app, stopping, backend, outcomes],
+                            max_instances=1, coalesce=True,
+                            next_run_time=datetime.now())
+    if app.config['LOOKAHEAD_ENABLED']:
+        lookahead.start(app, backend, outcomes)
+        scheduler.add_job(lookahead.load, 'interval',
+                          seconds=app.config['LOOKAHEAD_INTERVAL_SECONDS'],
+                          max_instances=1, coalesce=True,
+                          next_run_time=datetime.now())
+    if app.config['PRERENDER_WINDOW_SECONDS'] > 0:
+        scheduler.add_job(prerender_due_events, 'interval',
+                          seconds=app.config['PRERENDER_INTERVAL_SECONDS'],
+                          args=[app], max_instances=1, coalesce=True,
+                          next_run_time=datetime.now())
+    if app.config['ARCHIVE_AFTER_DAYS'] > 0:
+        scheduler.add_job(archive_events, 'interval',
+                          seconds=app.config['ARCHIVE_INTERVAL_SECONDS'],
+                          args=[app, stopping], max_instances=1, coalesce=True)
+    print(f"Scheduled job with ID: {job.id} to run every minute from", datetime.now())
     scheduler.start()
+    return scheduler
+
+
+def stop_scheduler(scheduler):
+    """Stop polling and wait for the sends already claimed to go out.
+
+    The running cycle finishes its current batch rather than claiming more
+    and the look-ahead timer stops firing; then the shared backend and
+    outcome buffer drain what both of them submitted.
+    """
+    stopping.set()
+    scheduler.shutdown(wait=True)
+    if lookahead.running:
+        lookahead.stop()
+    if delivery:
+        delivery.pop('backend').close()
+        delivery.pop('outcomes').close()
@@ -1,44 +1,379 @@
+import itertools
+import os
+import smtplib
+import socket
+import time
+from contextlib import ExitStack
 from flask import current_app
-from datetime import datetime, timezone
-from flask_mail import Message
-from .models import Event
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import and_, or_, tuple_
+from .models import Event, EventRecipient, EventStatus
+from .content import load_bodies
 from .db import db
-from .mail import mail
-from .utils.time_utils import get_current_time
+from .delivery import get_backend
+from .mail import mail, is_permanent
+from .metrics import (Gauge, delivery_lag_seconds,
+                      dispatch_cycle_seconds)
+from .mime import message_cache
+from .outcomes import OutcomeBuffer
+from .utils.time_utils import get_current_time, to_utc
 
 
-def send_email(event, app):
-    with app.app_context():
-        recipients = event.recipients.split(',')
-        message = Message(
-            subject=event.email_subject,
-            recipients=recipients,
-            body=event.email_content
-        )
+def record_delivery_lag(event, sent_at):
+    if event.expected_sent_at is not None:
+        delivery_lag_seconds.observe(
+            (to_utc(sent_at) - to_utc(event.expected_sent_at)).total_seconds())
+
+
+def count_backlog():
+    """Events already due that have not been sent or failed yet."""
+    return Event.query.filter(
+        Event.status.in_(EventStatus.ACTIVE),
+        Event.expected_sent_at <= get_current_time()).count()
+
+
+backlog = Gauge('janus_dispatch_backlog', count_backlog.__doc__,
+                count_backlog)
+
+
+def get_lease_owner():
+    # Computed per call so forked gunicorn workers get distinct owners.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_due_events(now, owner, limit, lease_seconds, after=None):
+    """Lease up to ``limit`` due events to ``owner`` and return their keys.
+
+    Rows locked by another dispatcher are skipped rather than waited on, so
+    any number of processes can split the backlog without sending an event
+    twice. Claims whose lease expired come back through
+    ``release_expired_leases``.
+
+    Keys are ``(expected_sent_at, event_id)`` pairs in scan order; pass the
+    last one back as ``after`` to continue from there instead of rescanning
+    rows that were already claimed. Events backing off after a transient
+    failure are skipped until their ``next_attempt_at``.
+    """
+    leased_at = get_current_time()
+    claimable = Event.status.in_(EventStatus.sources(EventStatus.CLAIMED))
+    query = Event.query.filter(claimable,
+                               Event.expected_sent_at <= now,
+                               _retry_due(now))
+    if after is not None:
+        query = query.filter(
+            tuple_(Event.expected_sent_at, Event.event_id)
+            > tuple_(*after, types=(Event.expected_sent_at.type,
+                                    Event.event_id.type)))
+    keys = [tuple(row) for row in query
+            .order_by(Event.expected_sent_at, Event.event_id).limit(limit)
+            .with_for_update(skip_locked=True)
+            .with_entities(Event.expected_sent_at, Event.event_id)]
+
+    if keys:
+        Event.query.filter(Event.event_id.in_([k[1] for k in keys]),
+                           claimable).update({
+            Event.status: EventStatus.CLAIMED,
+            Event.lease_owner: owner,
+            Event.lease_expires_at: leased_at + timedelta(seconds=lease_seconds),
+        }, synchronize_session=False)
+    db.session.commit()
+    return keys
+
+
+def _retry_due(now):
+    return or_(Event.next_attempt_at.is_(None), Event.next_attempt_at <= now)
+
+
+def release_expired_leases():
+    """Put claimed events whose dispatcher died back to pending."""
+    released = Event.query.filter(
+        Event.status.in_(EventStatus.sources(EventStatus.PENDING)),
+        Event.lease_expires_at <= get_current_time()
+    ).update({Event.status: EventStatus.PENDING}, synchronize_session=False)
+    db.session.commit()
+    return released
+
+
+def claim_event(event_id, owner, lease_seconds):
+    """Lease a single due, pending event to ``owner``; True if it was won.
+
+    An event whose send time was moved later after it was scheduled is left
+    alone. The conditional UPDATE is atomic, so when several processes fire the
+    same event only one of them gets a row back.
+    """
+    leased_at = get_current_time()
+    claimed = Event.query.filter(
+        Event.event_id == event_id,
+        Event.status.in_(EventStatus.sources(EventStatus.CLAIMED)),
+        Event.expected_sent_at <= leased_at,
+        _retry_due(leased_at)
+    ).update({
+        Event.status: EventStatus.CLAIMED,
+        Event.lease_owner: owner,
+        Event.lease_expires_at: leased_at + timedelta(seconds=lease_seconds),
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+
+def load_recipient_chunks(event_ids, chunk_size, lease_seconds):
+    """Claim the unsent recipients of claimed events a chunk at a time.
+
+    Yields ``(event_id, [(recipient_id, address), ...])``. Recipients are
+    paged by ``(event_id, id)``, ``chunk_size`` rows per query, and each
+    page is marked claimed just before it is yielded, so a large event is
+    never held in memory or claimed all at once and a saturated backend
+    slows the claiming down with it. A page that spans two events yields
+    a shorter chunk for each. Sent and permanently failed addresses are
+    never resent, and neither are the ones claimed less than a lease ago:
+    the dispatcher that claimed them may still be sending them.
+    """
+    after = None
+    while True:
         now = get_current_time()
+        claimable = or_(
+            EventRecipient.status == EventStatus.PENDING,
+            and_(EventRecipient.status == EventStatus.CLAIMED,
+                 or_(EventRecipient.claimed_at.is_(None),
+                     EventRecipient.claimed_at
+                     <= now - timedelta(seconds=lease_seconds))))
+        query = EventRecipient.query.filter(
+            EventRecipient.event_id.in_(event_ids), claimable)
+        if after is not None:
+            query = query.filter(
+                tuple_(EventRecipient.event_id, EventRecipient.id) > after)
+        rows = query.order_by(EventRecipient.event_id, EventRecipient.id) \
+            .with_entities(EventRecipient.event_id, EventRecipient.id,
+                           EventRecipient.address).limit(chunk_size).all()
+        if not rows:
+            return
+        EventRecipient.query.filter(
+            EventRecipient.id.in_([row.id for row in rows]), claimable
+        ).update({EventRecipient.status: EventStatus.CLAIMED,
+                  EventRecipient.claimed_at: now},
+                 synchronize_session=False)
+        db.session.commit()
+        after = (rows[-1].event_id, rows[-1].id)
+        for event_id, page in itertools.groupby(rows, lambda row: row[0]):
+            yield event_id, [(recipient_id, address)
+                             for _, recipient_id, address in page]
+
+
+def submit_events(event_ids, app, backend, owner, outcomes):
+    """Stream the unsent recipients of claimed events to ``backend``.
+
+    The events are only settled once their last chunk was submitted and
+    its outcome recorded; until then ``outcomes`` keeps their leases.
+    """
+    backend.prepare(event_ids, owner)
+    for event_id in event_ids:
+        outcomes.begin(event_id, owner)
+    try:
+        # Chunks of one event go out in parallel.
+        for event_id, chunk in load_recipient_chunks(
+                event_ids, app.config['RECIPIENT_CHUNK_SIZE'],
+                app.config['DISPATCH_LEASE_SECONDS']):
+            outcomes.submitted(event_id, len(chunk))
+            backend.submit(event_id, chunk, owner, outcomes)
+    finally:
+        for event_id in event_ids:
+            outcomes.finish(event_id)
+
+
+def fire_event(event_id, app, backend, outcomes):
+    # Called by the look-ahead timer at the event's expected_sent_at.
+    with app.app_context():
+        owner = get_lease_owner()
+        if not claim_event(event_id, owner,
+                           app.config['DISPATCH_LEASE_SECONDS']):
+            return
+        submit_events([event_id], app, backend, owner, outcomes)
+
+
+def send_chunk(event_id, chunk, app, sender=None, owner=None, outcomes=None):
+    """Send one message to a chunk of an event's recipients.
+
+    Runs on a dispatcher worker: the event is loaded through this thread's
+    own session instead of sharing ORM objects across threads, and the
+    result is recorded per recipient in ``outcomes``.
+    """
+    with app.app_context():
+        event = Event.query.get(event_id)
+        if event is None or event.status not in EventStatus.ACTIVE:
+            return
+        if owner is not None and (event.status != EventStatus.CLAIMED
+                                  or event.lease_owner != owner):
+            # The lease expired and another dispatcher took the event over.
+            return
+        if event.personalized:
+            send_personalized_chunk(event, chunk, sender, outcomes)
+            return
+        recipient_ids = [recipient_id for recipient_id, _ in chunk]
+        try:
+            # Rendered ahead of time by prerender_due_events, or by the first
+            # chunk of the event; the deferred body only loads on a miss.
+            message = message_cache.message(
+                event_id, event.updated_at,
+                [address for _, address in chunk],
+                lambda: (event.email_subject, event.email_content))
+            # Give the connection back before waiting on SMTP: with more
+            # dispatcher threads than pooled connections the sends would
+            # otherwise queue for the database instead of the server.
+            db.session.close()
+            refused = (sender or mail).send(message)
+        except Exception as e:
+            # Transient errors are retried with backoff; permanent ones fail
+            # the recipients for good.
+            outcomes.failed(event_id, recipient_ids, str(e),
+                            get_current_time(), permanent=is_permanent(e))
+            print(str(e))
+        else:
+            # Taken once the server accepted the message, so the limiter
+            # and pool waits count towards the delivery lag.
+            now = get_current_time()
+            accepted = record_refused(event_id, chunk, refused, now, outcomes)
+            if accepted:
+                outcomes.sent(event_id, accepted, now)
+                record_delivery_lag(event, now)
+
+
+def record_refused(event_id, chunk, refused, failed_at, outcomes):
+    """Fail the recipients of a sent chunk that the server refused and
+    return the ids of the ones it accepted.
+
+    ``refused`` maps addresses to ``(code, reply)`` as ``sendmail`` returns
+    them; each refusal is permanent or retried by its own reply code.
+    """
+    if not refused:
+        return [recipient_id for recipient_id, _ in chunk]
+    accepted = []
+    for recipient_id, address in chunk:
+        if address not in refused:
+            accepted.append(recipient_id)
+            continue
+        error = smtplib.SMTPRecipientsRefused({address: refused[address]})
+        outcomes.failed(event_id, [recipient_id], str(error), failed_at,
+                        permanent=is_permanent(error))
+        print(str(error))
+    return accepted
+
+
+def load_variables(recipient_ids):
+    """Return ``{recipient_id: variables}`` for one chunk of a personalized
+    event; variables are read a chunk at a time, as it is sent."""
+    return dict(EventRecipient.query.filter(
+        EventRecipient.id.in_(recipient_ids)).with_entities(
+        EventRecipient.id, EventRecipient.variables))
+
+
+def send_personalized_chunk(event, chunk, sender, outcomes):
+    """Send every recipient of a chunk its own message, rendered from the
+    event's compiled templates just before it goes out."""
+    event_id = event.event_id
+    variables = load_variables([recipient_id for recipient_id, _ in chunk])
+    messages = message_cache.messages(
+        event_id, event.updated_at,
+        [(address, variables.get(recipient_id))
+         for recipient_id, address in chunk],
+        lambda: (event.email_subject, event.email_content))
+    # The first message needs the body; the session is free after it.
+    first = next(messages)
+    db.session.close()
+    sent = []
+    for (recipient_id, _), message in zip(
+            chunk, itertools.chain([first], messages)):
         try:
-            mail.send(message)
-            print("Email sent to:", recipients)
-            event.is_sent = True
-            event.updated_at = now
-            event.exactly_sent_at = now
-            db.session.commit()
+            if isinstance(message, Exception):
+                raise message
+            (sender or mail).send(message)
         except Exception as e:
-            event.is_failed = True
-            event.error_message = str(e)
-            event.updated_at = now
-            db.session.commit()
+            outcomes.failed(event_id, [recipient_id], str(e),
+                            get_current_time(), permanent=is_permanent(e))
             print(str(e))
+        else:
+            sent.append(recipient_id)
+    if sent:
+        now = get_current_time()
+        outcomes.sent(event_id, sent, now)
+        record_delivery_lag(event, now)
+
+
+def prerender_due_events(app):
+    """Render the MIME messages of events due within the next
+    ``PRERENDER_WINDOW_SECONDS`` into ``message_cache``.
+
+    Only events that are not cached yet, or were edited since, have their
+    bodies loaded, so a run over an unchanged window is one index scan.
+    """
+    with app.app_context():
+        now = get_current_time()
+        rows = Event.query.filter(
+            Event.status == EventStatus.PENDING,
+            Event.expected_sent_at > now,
+            Event.expected_sent_at <= now + timedelta(
+                seconds=app.config['PRERENDER_WINDOW_SECONDS'])
+        ).order_by(Event.expected_sent_at) \
+            .limit(app.config['MIME_CACHE_SIZE']) \
+            .with_entities(Event.event_id, Event.updated_at).all()
+        missing = [event_id for event_id, updated_at in rows
+                   if (event_id, updated_at) not in message_cache]
+        rendered = 0
+        for start in range(0, len(missing), 500):
+            rows = Event.query.filter(
+                Event.event_id.in_(missing[start:start + 500])
+            ).with_entities(Event.event_id, Event.email_subject,
+                            Event.content_hash, Event.updated_at,
+                            Event.personalized).all()
+            # Events of a campaign share one stored body.
+            bodies = load_bodies(row.content_hash for row in rows)
+            for event_id, subject, key, updated_at, personalized in rows:
+                try:
+                    message_cache.render(event_id, updated_at, subject,
+                                         bodies[key], personalized)
+                    rendered += 1
+                except Exception as e:
+                    # Left for the send path, which records the failure.
+                    print(str(e))
+        db.session.commit()
+        return rendered
+
 
+def send_scheduled_emails(app, stopping=None, backend=None, outcomes=None):
+    """Claim and send every due event, one batch at a time.
 
-def send_scheduled_emails(app):
+    Once ``stopping`` is set no further batch is claimed; the sends of the
+    batches already claimed are drained before returning. ``backend`` and
+    ``outcomes`` are the worker's long-lived ones and stay open; without
+    them the cycle builds its own and closes them on the way out.
+    """
+    start = time.perf_counter()
     with app.app_context():
         now = get_current_time()
         print("now :  ",
               now)
-        events = Event.query.filter(Event.expected_sent_at <= now, Event.is_sent ==
-                                    False, Event.is_failed == False, Event.deleted_at == None).all()
+        owner = get_lease_owner()
+        count = 0
+        after = None
+        release_expired_leases()
+        with ExitStack() as stack:
+            if outcomes is None:
+                outcomes = stack.enter_context(OutcomeBuffer(
+                    app, flush_size=app.config['STATUS_FLUSH_SIZE'],
+                    flush_interval_ms=app.config['STATUS_FLUSH_INTERVAL_MS']))
+            if backend is None:
+                backend = stack.enter_context(get_backend(app))
+            while stopping is None or not stopping.is_set():
+                keys = claim_due_events(
+                    now, owner, app.config['DISPATCH_BATCH_SIZE'],
+                    app.config['DISPATCH_LEASE_SECONDS'], after)
+                if not keys:
+                    break
+                count += len(keys)
+                after = keys[-1]
+                submit_events([event_id for _, event_id in keys], app,
+                              backend, owner, outcomes)
+            backend.drain()
+            outcomes.flush()
 
-        print("event count : ", len(events))
-        for event in events:
-            send_email(event, app)
+        print("event count : ", count)
+    dispatch_cycle_seconds.observe(time.perf_counter() - start)
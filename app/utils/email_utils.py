@@ -1,21 +1,119 @@
 # app/utils/email_utils.py
 
 import re
+from functools import lru_cache
 from flask import request, jsonify
 
 
+ADDRESS_PATTERN = r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+'
+EMAIL_RE = re.compile(rf'^{ADDRESS_PATTERN}$')
+# A whole comma-separated list of valid addresses, checked in one C call.
+RECIPIENTS_RE = re.compile(
+    rf'[ \t]*{ADDRESS_PATTERN}[ \t]*(?:,[ \t]*{ADDRESS_PATTERN}[ \t]*)*')
+
+# Invalid addresses quoted back to the caller; the rest are only counted.
+MAX_REPORTED_INVALID = 10
+
+
 def is_valid_email(email):
-    regex = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
-    return re.match(regex, email) is not None
+    return EMAIL_RE.match(email) is not None
+
+
+@lru_cache(maxsize=65536)
+def check_email(email):
+    """Return ``(address, dedupe_key)`` for a valid address, else None.
+
+    Addresses are trimmed and compared case-insensitively, keeping the
+    first spelling. Bulk imports repeat the same addresses across events,
+    so results are kept in a bounded LRU keyed on the raw string.
+    """
+    email = email.strip()
+    if EMAIL_RE.match(email) is None:
+        return None
+    return email, email.lower()
+
+
+class RecipientResult:
+    """Outcome of validating a list or stream of addresses.
+
+    ``valid`` holds the trimmed, deduplicated addresses in input order.
+    Only the first ``max_invalid`` invalid addresses are kept; the rest are
+    counted, so a bad import cannot blow up the response.
+    """
+
+    __slots__ = ('valid', 'invalid', 'invalid_count', 'duplicate_count',
+                 'max_invalid')
+
+    def __init__(self, max_invalid=MAX_REPORTED_INVALID):
+        self.valid = []
+        self.invalid = []
+        self.invalid_count = 0
+        self.duplicate_count = 0
+        self.max_invalid = max_invalid
+
+    @property
+    def error(self):
+        if not self.invalid_count:
+            return None
+        error = f"Invalid emails: {', '.join(self.invalid)}"
+        if self.invalid_count > len(self.invalid):
+            error += f" and {self.invalid_count - len(self.invalid)} more"
+        return error
+
+
+def _dedupe(addresses, keys):
+    if len(set(keys)) == len(keys):
+        return addresses
+    seen = set()
+    return [email for email, key in zip(addresses, keys)
+            if not (key in seen or seen.add(key))]
+
+
+def iter_recipients(addresses, result):
+    """Yield valid, trimmed, deduplicated addresses from any iterable.
+
+    Works on streams in a single pass; invalid and duplicate addresses are
+    tallied on ``result`` instead of being collected.
+    """
+    seen = set()
+    add = seen.add
+    for email in addresses:
+        checked = check_email(email)
+        if checked is None:
+            result.invalid_count += 1
+            if len(result.invalid) < result.max_invalid:
+                result.invalid.append(email.strip())
+        elif checked[1] in seen:
+            result.duplicate_count += 1
+        else:
+            add(checked[1])
+            yield checked[0]
+
+
+def validate_recipients(addresses, max_invalid=MAX_REPORTED_INVALID):
+    """Validate a comma-separated string or an iterable of addresses."""
+    result = RecipientResult(max_invalid)
+    if isinstance(addresses, str):
+        if RECIPIENTS_RE.fullmatch(addresses) is not None:
+            # Every address is valid: trim and dedupe with string methods on
+            # the whole list instead of one call per address.
+            compact = addresses.replace(' ', '').replace('\t', '')
+            lowered = compact.lower()
+            keys = lowered.split(',')
+            valid = keys if lowered == compact else compact.split(',')
+            result.valid = _dedupe(valid, keys)
+            result.duplicate_count = len(keys) - len(result.valid)
+            return result
+        addresses = addresses.split(',')
+    result.valid = list(iter_recipients(addresses, result))
+    return result
 
 
 def validate_and_get_recipients(recipients_str):
     if not recipients_str:
         return [], 'Recipients are required.'
 
-    recipients = [email.strip() for email in recipients_str.split(',')]
-    invalid_emails = [
-        email for email in recipients if not is_valid_email(email)]
-    if invalid_emails:
-        return None, f"Invalid emails: {', '.join(invalid_emails)}"
-    return recipients, None
+    result = validate_recipients(recipients_str)
+    if result.invalid_count:
+        return None, result.error
+    return result.valid, None
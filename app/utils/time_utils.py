@@ -1,11 +1,59 @@
 # app/utils/time_utils.py
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 import pytz
 
+DEFAULT_TIME_ZONE = 'Asia/Singapore'
+
+
+def _system_clock():
+    return datetime.now(timezone.utc)
+
+
+_clock = _system_clock
+
+
+def set_clock(clock=None):
+    """Replace the clock behind get_current_time; returns the previous one.
+
+    ``clock`` returns an aware datetime. Pass None to restore the system
+    clock.
+    """
+    global _clock
+    previous, _clock = _clock, clock or _system_clock
+    return previous
+
+
+@lru_cache(maxsize=None)
+def get_time_zone(name):
+    """Resolve an IANA time zone name once and reuse the tzinfo."""
+    try:
+        return pytz.timezone(name)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError('Invalid time zone.')
+
+
+_default_time_zone = DEFAULT_TIME_ZONE
+
+
+def set_default_time_zone(name):
+    """Set the zone used when neither the event nor the request names one."""
+    global _default_time_zone
+    get_time_zone(name)
+    _default_time_zone = name
+
+
+def get_current_time(zone=None):
+    return _clock().astimezone(get_time_zone(zone or _default_time_zone))
 
-def get_current_time():
-    singapore_tz = pytz.timezone(get_default_time_zone())
-    return datetime.now(singapore_tz)
 
 def get_default_time_zone():
-    return 'Asia/Singapore'
+    return _default_time_zone
+
+
+def to_utc(value):
+    # Naive datetimes come back from SQLite; they were stored as UTC.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=pytz.UTC)
+    return value.astimezone(pytz.UTC)
+
@@ -0,0 +1,81 @@
+"""Dispatcher process: ``python -m app.worker``.
+
+Runs the dispatch poll and the look-ahead timer without serving HTTP, so
+the API and the sender tier scale separately. SIGTERM or SIGINT stops
+claiming new work and exits once the sends in flight are done.
+"""
+import signal
+import threading
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+from dotenv import load_dotenv
+from . import create_app
+from .metrics import REGISTRY
+from .scheduler import start_scheduler, stop_scheduler
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(app, port, host='0.0.0.0'):
+    """Serve this process's metrics on ``port`` from a daemon thread.
+
+    The worker has no HTTP server of its own, and its dispatch counters are
+    not visible to the web app's /metrics. Returns the server; call
+    ``shutdown()`` to stop it.
+    """
+    def metrics_app(environ, start_response):
+        if environ['PATH_INFO'] != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        with app.app_context():
+            body = REGISTRY.render().encode()
+        start_response('200 OK', [('Content-Type', REGISTRY.CONTENT_TYPE)])
+        return [body]
+
+    server = make_server(host, port, metrics_app,
+                         handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True,
+                     name='metrics').start()
+    return server
+
+
+def run(app, stop=None):
+    """Dispatch until ``stop`` is set, then drain; blocks the caller.
+
+    Without ``stop`` the worker installs its own SIGTERM/SIGINT handlers.
+    """
+    if stop is None:
+        stop = threading.Event()
+
+        def handle_signal(signum, frame):
+            print("worker : received signal", signum, ", draining")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+
+    metrics_server = None
+    if app.config['WORKER_METRICS_PORT']:
+        metrics_server = serve_metrics(app, app.config['WORKER_METRICS_PORT'])
+    with app.app_context():
+        scheduler = start_scheduler(app)
+    print("worker : started")
+    # Wake up periodically so signals are handled promptly.
+    while not stop.wait(1):
+        pass
+    stop_scheduler(scheduler)
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+    print("worker : stopped")
+
+
+def main():
+    load_dotenv()
+    run(create_app(scheduler=False))
+
+
+if __name__ == '__main__':
+    main()
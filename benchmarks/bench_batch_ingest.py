@@ -0,0 +1,70 @@
+# benchmarks/bench_batch_ingest.py
+#
+# Ingestion rate of POST /api/events (one event per request) against
+# POST /api/events/batch with an NDJSON body, through the Flask test client
+# so only the application and the database are measured.
+#
+#   python -m benchmarks.bench_batch_ingest --events 100000
+
+import argparse
+import json
+import time
+from app.db import db
+from app.models import Event
+from app.routes import main as main_blueprint
+from .common import create_bench_app
+
+
+def payload(i):
+    return {
+        'email_subject': f'Campaign {i}',
+        'email_content': 'Hello from the benchmark.',
+        'expected_sent_at': '2030-01-01T10:00:00',
+        'recipients': f'user{i}@example.com',
+    }
+
+
+def single(client, count):
+    for i in range(count):
+        client.post('/api/events', json=payload(i))
+
+
+def batch(client, count, batch_size):
+    for start in range(0, count, batch_size):
+        body = '\n'.join(json.dumps(payload(i)) for i in
+                         range(start, min(start + batch_size, count)))
+        client.post('/api/events/batch', data=body,
+                    content_type='application/x-ndjson')
+
+
+def run(name, fn, count):
+    db.drop_all()
+    db.create_all()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    stored = Event.query.count()
+    print(f'{name:<8} {count / elapsed:>10.1f} events/s  {stored} stored  '
+          f'{elapsed:.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--single-events', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    app.register_blueprint(main_blueprint)
+    client = app.test_client()
+    with app.app_context():
+        run('single', lambda: single(client, args.single_events),
+            args.single_events)
+        run('batch', lambda: batch(client, args.events, args.batch_size),
+            args.events)
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
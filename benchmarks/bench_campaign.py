@@ -0,0 +1,118 @@
+# benchmarks/bench_campaign.py
+#
+# A personalized campaign against the equivalent batch of one event per
+# recipient: N recipients with their own variables are created through
+# POST /api/campaigns (one stored body, N small recipient rows) and through
+# POST /api/events/batch (N rendered bodies). Reports ingest recipients/s,
+# the bytes held by event, event_recipient and event_content, and how fast
+# the dispatcher renders the campaign's messages from the compiled template,
+# a chunk of variables at a time.
+#
+# Uses DATABASE_URL when set (table sizes are only reported on Postgres) and
+# a temporary SQLite file otherwise.
+#
+#   python -m benchmarks.bench_campaign --recipients 100000
+
+import argparse
+import json
+import time
+from sqlalchemy import text
+from app.db import db
+from app.mail import mail
+from app.mime import message_cache
+from app.models import Event, EventRecipient
+from app.routes import main as main_blueprint
+from app.tasks import load_variables
+from .common import create_bench_app
+
+SUBJECT = 'Your order, {{ name }}'
+BODY = ('Hi {{ name }},\n\nOrder {{ order }} shipped today and should '
+        'arrive by {{ day }}.\n' + 'Thank you for shopping with us.\n' * 30)
+
+
+def variables(i):
+    return {'name': f'Customer {i}', 'order': 100000 + i, 'day': 'Friday'}
+
+
+def table_bytes(*tables):
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    return sum(db.session.execute(text(
+        f"SELECT pg_total_relation_size('{table}')")).scalar()
+        for table in tables)
+
+
+def ingest(client, args, personalized):
+    start = time.perf_counter()
+    if personalized:
+        lines = [json.dumps({'email_subject': SUBJECT, 'email_content': BODY,
+                             'expected_sent_at': '2030-01-01T10:00:00'})]
+        lines += (json.dumps({'email': f'user{i}@example.com',
+                              'variables': variables(i)})
+                  for i in range(args.recipients))
+        client.post('/api/campaigns', data='\n'.join(lines),
+                    content_type='application/x-ndjson')
+    else:
+        subject, body = SUBJECT.replace('{{ name }}', '{name}'), BODY
+        for token in ('name', 'order', 'day'):
+            body = body.replace('{{ %s }}' % token, '{%s}' % token)
+        for first in range(0, args.recipients, 1000):
+            client.post('/api/events/batch', data='\n'.join(json.dumps({
+                'email_subject': subject.format(**variables(i)),
+                'email_content': body.format(**variables(i)),
+                'expected_sent_at': '2030-01-01T10:00:00',
+                'recipients': f'user{i}@example.com',
+            }) for i in range(first, min(first + 1000, args.recipients))),
+                content_type='application/x-ndjson')
+    return args.recipients / (time.perf_counter() - start)
+
+
+def render(args):
+    """Messages per second, rendered the way send_personalized_chunk does."""
+    event = Event.query.one()
+    ids = [recipient_id for recipient_id, in EventRecipient.query.filter_by(
+        event_id=event.event_id).order_by(EventRecipient.id)
+        .with_entities(EventRecipient.id)]
+    message_cache.invalidate(event.event_id)
+    start = time.perf_counter()
+    for first in range(0, len(ids), args.chunk_size):
+        chunk = ids[first:first + args.chunk_size]
+        stored = load_variables(chunk)
+        recipients = [(f'user{i}@example.com', stored[i]) for i in chunk]
+        for message in message_cache.messages(
+                event.event_id, event.updated_at, recipients,
+                lambda: (event.email_subject, event.email_content)):
+            message.as_bytes()
+    return len(ids) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipients', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='recipients read and rendered together')
+    args = parser.parse_args()
+
+    app = create_bench_app(MAIL_DEFAULT_SENDER='bench@example.com')
+    mail.init_app(app)
+    app.register_blueprint(main_blueprint)
+    client = app.test_client()
+    with app.app_context():
+        for personalized in (False, True):
+            db.drop_all()
+            db.create_all()
+            rate = ingest(client, args, personalized)
+            size = table_bytes('event', 'event_recipient', 'event_content')
+            line = (f'{"campaign" if personalized else "batch":<8} '
+                    f'{args.recipients} recipients: {rate:>8.0f} recipients/s'
+                    f'  events {Event.query.count():>7}  '
+                    f'tables {size or 0:>11} B')
+            if personalized:
+                line += f'  render {render(args):>8.0f} msgs/s'
+            print(line)
+            db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
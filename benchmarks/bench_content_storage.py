@@ -0,0 +1,93 @@
+# benchmarks/bench_content_storage.py
+#
+# Storage and read cost of email bodies in event_content: N events are
+# created through POST /api/events/batch with --distinct different bodies
+# (1 = one campaign), once per CONTENT_COMPRESSION codec. Reports ingest
+# events/s, the bytes held by event and event_content, and the latency of
+# the listing page and API, which no longer read bodies they do not show.
+#
+# Uses DATABASE_URL when set (table sizes are only reported on Postgres) and
+# a temporary SQLite file otherwise.
+#
+#   python -m benchmarks.bench_content_storage --events 20000 --body-size 20
+
+import argparse
+import json
+import os
+import time
+from sqlalchemy import func, text
+from app.content import zstandard
+from app.db import db
+from app.models import EventContent
+from app import routes
+from app.routes import main as main_blueprint
+from .common import create_bench_app
+
+
+def body(i, size_kb):
+    line = f'Newsletter {i}: the quick brown fox jumps over the lazy dog.\n'
+    return line * (size_kb * 1024 // len(line))
+
+
+def table_bytes(table):
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    return db.session.execute(text(
+        f"SELECT pg_total_relation_size('{table}')")).scalar()
+
+
+def timed(client, path, runs=20):
+    start = time.perf_counter()
+    for _ in range(runs):
+        client.get(path)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def run(codec, args):
+    app = create_bench_app(CONTENT_COMPRESSION=codec)
+    app.template_folder = os.path.join(os.path.dirname(routes.__file__),
+                                       'templates')
+    app.register_blueprint(main_blueprint)
+    client = app.test_client()
+    bodies = [body(i, args.body_size) for i in range(args.distinct)]
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        for first in range(0, args.events, 1000):
+            client.post('/api/events/batch', data='\n'.join(json.dumps({
+                'email_subject': f'Campaign {i}',
+                'email_content': bodies[i % args.distinct],
+                'expected_sent_at': '2030-01-01T10:00:00',
+                'recipients': f'user{i}@example.com',
+            }) for i in range(first, min(first + 1000, args.events))),
+                content_type='application/x-ndjson')
+        ingest = args.events / (time.perf_counter() - start)
+        stored = db.session.query(
+            func.sum(func.length(EventContent.body))).scalar()
+        print(f'{codec:<5} {args.events} events, {args.distinct} bodies of '
+              f'{args.body_size} KB: {ingest:>8.0f} events/s  '
+              f'bodies stored {stored / 1024:>9.1f} KB  '
+              f'event {table_bytes("event") or 0:>10} B  '
+              f'event_content {table_bytes("event_content") or 0:>10} B  '
+              f'GET / {timed(client, "/"):>6.1f} ms  '
+              f'GET /api/events {timed(client, "/api/events"):>6.1f} ms')
+        db.session.remove()
+        db.drop_all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=1,
+                        help='different bodies among the events')
+    parser.add_argument('--body-size', type=int, default=20,
+                        help='body size in KB')
+    args = parser.parse_args()
+    codecs = ['none', 'zlib'] + (['zstd'] if zstandard is not None else [])
+    for codec in codecs:
+        run(codec, args)
+
+
+if __name__ == '__main__':
+    main()
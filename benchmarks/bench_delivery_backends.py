@@ -0,0 +1,94 @@
+# benchmarks/bench_delivery_backends.py
+#
+# Messages/sec and peak RSS of one dispatch cycle with each delivery
+# backend against a local SMTP sink that spends --message-latency on every
+# message, the way a remote provider does. "flask_mail" keeps one thread
+# per send in flight; "asyncio" runs --connections SMTP sessions on one
+# event loop. Each backend runs in its own process so the peaks do not mix;
+# the sink stays in this one.
+#
+#   python -m benchmarks.bench_delivery_backends --events 5000 --connections 200
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+from app.db import db
+from app.mail import mail
+from app.models import Event, EventStatus
+from app.tasks import send_scheduled_emails
+from .common import create_bench_app, seed
+from .smtp_sink import SMTPSink
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(args):
+    os.environ['DATABASE_URL'] = args.url
+    app = create_bench_app(
+        DELIVERY_BACKEND=args.child,
+        DISPATCH_WORKERS=args.workers,
+        DISPATCH_MAX_IN_FLIGHT=2 * args.workers,
+        MAIL_POOL_SIZE=args.workers,
+        ASYNC_SMTP_CONNECTIONS=args.connections,
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=args.port, MAIL_USE_TLS=False,
+        MAIL_USE_SSL=False, MAIL_USERNAME=None, MAIL_PASSWORD=None,
+        MAIL_DEFAULT_SENDER='bench@example.com')
+    mail.init_app(app)
+    baseline = peak_rss_mb()
+
+    start = time.perf_counter()
+    send_scheduled_emails(app)
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        sent = Event.query.filter_by(status=EventStatus.SENT).count()
+    concurrency = args.connections if args.child == 'asyncio' else args.workers
+    print(f'{args.child:<10} {concurrency:>4} in flight  '
+          f'{sent / elapsed:>8.1f} msgs/s  {sent:>6} sent  '
+          f'peak RSS {peak_rss_mb():>6.1f} MB (+{peak_rss_mb() - baseline:.1f} MB)  '
+          f'{elapsed:.2f}s', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=4,
+                        help='dispatcher threads for flask_mail')
+    parser.add_argument('--connections', type=int, default=200,
+                        help='SMTP sessions for asyncio')
+    parser.add_argument('--message-latency', type=float, default=50,
+                        help='simulated provider time per message (ms)')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--child', choices=['flask_mail', 'asyncio'])
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    app = create_bench_app()
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    with SMTPSink(port=args.port,
+                  message_latency=args.message_latency / 1000) as sink:
+        runs = [('flask_mail', args.workers), ('flask_mail', args.connections),
+                ('asyncio', args.workers), ('asyncio', args.connections)]
+        for backend, concurrency in runs:
+            with app.app_context():
+                seed(args.events)
+            subprocess.run([
+                sys.executable, '-m', __spec__.name, '--child', backend,
+                '--url', url, '--port', str(args.port),
+                '--workers', str(concurrency),
+                '--connections', str(concurrency)], check=True)
+    with app.app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
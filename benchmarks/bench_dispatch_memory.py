@@ -0,0 +1,83 @@
+# benchmarks/bench_dispatch_memory.py
+#
+# Peak RSS of one dispatch cycle over N due events. "load-all" is the old
+# Event.query.filter(...).all() poll with every body loaded; "streaming"
+# runs send_scheduled_emails, which claims keyset-paginated batches and
+# reads a body only when building its message. Each mode runs in its own
+# process so the peaks do not mix. Mail sending is suppressed.
+#
+#   python -m benchmarks.bench_dispatch_memory --events 200000
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+from sqlalchemy.orm import joinedload
+from app.db import db
+from app.models import Event, EventStatus
+from app.tasks import send_scheduled_emails
+from app.utils.time_utils import get_current_time
+from .common import create_bench_app, seed
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_all(app):
+    with app.app_context():
+        now = get_current_time()
+        events = Event.query.options(joinedload(Event.content)).filter(
+            Event.expected_sent_at <= now,
+            Event.status == EventStatus.PENDING).all()
+        return len(events)
+
+
+def streaming(app):
+    send_scheduled_emails(app)
+    with app.app_context():
+        return Event.query.filter_by(status=EventStatus.SENT).count()
+
+
+def child(mode, url):
+    os.environ['DATABASE_URL'] = url
+    app = create_bench_app(MAIL_SUPPRESS_SEND=True,
+                           MAIL_DEFAULT_SENDER='bench@example.com')
+    with app.app_context():
+        db.engine.dispose()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    count = {'load-all': load_all, 'streaming': streaming}[mode](app)
+    elapsed = time.perf_counter() - start
+    print(f'{mode:<10} {count:>8} events  peak RSS {peak_rss_mb():>8.1f} MB  '
+          f'(+{peak_rss_mb() - baseline:.1f} MB)  {elapsed:.1f}s', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--body-size', type=int, default=2000)
+    parser.add_argument('--child', choices=['load-all', 'streaming'])
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.url)
+        return
+
+    app = create_bench_app()
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    with app.app_context():
+        seed(args.events, body='x' * args.body_size)
+
+    for mode in ('load-all', 'streaming'):
+        subprocess.run([sys.executable, '-m', __spec__.name,
+                        '--child', mode, '--url', url], check=True)
+    with app.app_context():
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
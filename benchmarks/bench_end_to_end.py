@@ -0,0 +1,211 @@
+# benchmarks/bench_end_to_end.py
+#
+# The whole path in one run: N events are created through POST /api/events
+# and POST /api/events/batch, fall due together, and one dispatch cycle of
+# app/tasks.py sends them to a local aiosmtpd sink. Reports ingest
+# requests/s, batch events/s, dispatch messages/s, delivery lag percentiles
+# and peak RSS, per delivery backend, and compares them with the baselines
+# stored in benchmarks/baselines.json.
+#
+# Uses DATABASE_URL when set (point it at a throwaway Postgres database) and
+# a temporary SQLite file otherwise. Each backend runs in its own process so
+# the peaks do not mix; the sink stays in this one.
+#
+#   python -m benchmarks.bench_end_to_end --events 5000
+#   python -m benchmarks.bench_end_to_end --check            # exit 1 on regression
+#   python -m benchmarks.bench_end_to_end --save-baseline    # after a deliberate change
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from app.db import db
+from app.mail import mail
+from app.models import Event, EventStatus
+from app.routes import main as main_blueprint
+from app.tasks import send_scheduled_emails
+from app.utils.time_utils import get_current_time
+from .common import create_bench_app
+from .smtp_sink import SMTPSink
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# Metric, unit, and whether a higher value is better.
+METRICS = [
+    ('ingest_requests_per_second', 'req/s', True),
+    ('batch_events_per_second', 'events/s', True),
+    ('dispatch_messages_per_second', 'msgs/s', True),
+    ('lag_p50_seconds', 's', False),
+    ('lag_p95_seconds', 's', False),
+    ('lag_p99_seconds', 's', False),
+    ('peak_rss_mb', 'MB', False),
+]
+
+
+def payload(i):
+    return {
+        'email_subject': f'Campaign {i}',
+        'email_content': 'Hello from the benchmark.\n' * 40,
+        'expected_sent_at': '2030-01-01T10:00:00',
+        'recipients': f'user{i}@example.com',
+    }
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def child(args):
+    app = create_bench_app(
+        DELIVERY_BACKEND=args.child,
+        DISPATCH_WORKERS=args.concurrency,
+        DISPATCH_MAX_IN_FLIGHT=2 * args.concurrency,
+        MAIL_POOL_SIZE=args.concurrency,
+        ASYNC_SMTP_CONNECTIONS=args.concurrency,
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=args.port, MAIL_USE_TLS=False,
+        MAIL_USE_SSL=False, MAIL_USERNAME=None, MAIL_PASSWORD=None,
+        MAIL_DEFAULT_SENDER='bench@example.com')
+    mail.init_app(app)
+    app.register_blueprint(main_blueprint)
+    client = app.test_client()
+    results = {}
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        single = min(args.single_events, args.events)
+        start = time.perf_counter()
+        for i in range(single):
+            client.post('/api/events', json=payload(i))
+        results['ingest_requests_per_second'] = \
+            single / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for first in range(single, args.events, args.batch_size):
+            body = '\n'.join(json.dumps(payload(i)) for i in range(
+                first, min(first + args.batch_size, args.events)))
+            client.post('/api/events/batch', data=body,
+                        content_type='application/x-ndjson')
+        batched = args.events - single
+        results['batch_events_per_second'] = \
+            batched / (time.perf_counter() - start) if batched else None
+
+        # Everything falls due at the instant the cycle starts.
+        due = get_current_time()
+        Event.query.update({Event.expected_sent_at: due},
+                           synchronize_session=False)
+        db.session.commit()
+
+    start = time.perf_counter()
+    send_scheduled_emails(app)
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        rows = Event.query.filter(Event.status == EventStatus.SENT) \
+            .with_entities(Event.expected_sent_at, Event.exactly_sent_at).all()
+        lags = [(sent - expected).total_seconds() for expected, sent in rows]
+        # End the read transaction first: Postgres would wait on its locks.
+        db.session.remove()
+        db.drop_all()
+
+    results['sent'] = len(rows)
+    results['dispatch_messages_per_second'] = len(rows) / elapsed
+    for q in (50, 95, 99):
+        results[f'lag_p{q}_seconds'] = percentile(lags, q) if lags else None
+    results['peak_rss_mb'] = \
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(results), flush=True)
+
+
+def compare(name, results, baseline, tolerance):
+    """Print one backend's results against its baseline; True if any metric
+    regressed by more than ``tolerance``."""
+    regressed = False
+    print(f'{name}  ({results["sent"]} sent)')
+    for metric, unit, higher_is_better in METRICS:
+        value = results.get(metric)
+        if value is None:
+            continue
+        line = f'  {metric:<30} {value:>10.3f} {unit:<8}'
+        expected = (baseline or {}).get(metric)
+        if expected:
+            change = (value - expected) / expected
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > tolerance:
+                flag = '  REGRESSION'
+                regressed = True
+            line += f' baseline {expected:>10.3f}  {change:+7.1%}{flag}'
+        print(line)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--single-events', type=int, default=1000,
+                        help='events created one request at a time; the '
+                             'rest go through the batch endpoint')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='dispatcher threads or SMTP connections')
+    parser.add_argument('--message-latency', type=float, default=5,
+                        help='simulated provider time per message (ms)')
+    parser.add_argument('--backends', default='flask_mail,asyncio')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative change before a regression')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 on a regression')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--child', choices=['flask_mail', 'asyncio'])
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    dialect = (os.environ.get('DATABASE_URL') or 'sqlite').split(':')[0]
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+
+    regressed = False
+    with SMTPSink(port=args.port,
+                  message_latency=args.message_latency / 1000):
+        for backend in args.backends.split(','):
+            output = subprocess.run([
+                sys.executable, '-m', __spec__.name, '--child', backend,
+                '--events', str(args.events),
+                '--single-events', str(args.single_events),
+                '--batch-size', str(args.batch_size),
+                '--concurrency', str(args.concurrency),
+                '--port', str(args.port)],
+                check=True, stdout=subprocess.PIPE, text=True).stdout
+            # The dispatcher prints progress; the results are the last line.
+            results = json.loads(output.strip().splitlines()[-1])
+            key = f'{dialect}/{backend}'
+            regressed |= compare(key, results, baselines.get(key),
+                                 args.tolerance)
+            if args.save_baseline:
+                baselines[key] = {metric: results[metric]
+                                  for metric, _, _ in METRICS
+                                  if results.get(metric) is not None}
+
+    if args.save_baseline:
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'baselines written to {BASELINES}')
+    if regressed and args.check:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
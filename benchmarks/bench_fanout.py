@@ -0,0 +1,56 @@
+# benchmarks/bench_fanout.py
+#
+# Sends events with large recipient lists through send_scheduled_emails,
+# once as a single message per event (the old behaviour) and once split into
+# RECIPIENT_CHUNK_SIZE chunks sent in parallel, against a local SMTP sink
+# that spends --recipient-latency on every RCPT TO.
+#
+#   python -m benchmarks.bench_fanout --events 1 --recipients 5000
+
+import argparse
+import time
+from app.mail import mail
+from app.models import EventRecipient, EventStatus
+from app.tasks import send_scheduled_emails
+from .common import create_bench_app, seed
+from .smtp_sink import SMTPSink
+
+
+def run(name, sink, args, chunk_size):
+    app = create_bench_app(RECIPIENT_CHUNK_SIZE=chunk_size,
+                           DISPATCH_WORKERS=args.workers,
+                           MAIL_POOL_SIZE=args.workers, **sink.mail_config())
+    mail.init_app(app)
+    with app.app_context():
+        seed(args.events, recipients=args.recipients)
+    messages = sink.handler.messages
+
+    start = time.perf_counter()
+    send_scheduled_emails(app)
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        sent = EventRecipient.query.filter_by(status=EventStatus.SENT).count()
+    print(f'{name:<10} {sent / elapsed:>10.1f} recipients/s  '
+          f'{sink.handler.messages - messages:>6} messages  {elapsed:.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=1)
+    parser.add_argument('--recipients', type=int, default=5000)
+    parser.add_argument('--chunk-size', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--recipient-latency', type=float, default=0.5,
+                        help='simulated cost of each RCPT TO (ms)')
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    with SMTPSink(port=args.port,
+                  recipient_latency=args.recipient_latency / 1000) as sink:
+        run('single', sink, args, args.recipients)
+        run('chunked', sink, args, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
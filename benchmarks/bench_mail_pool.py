@@ -0,0 +1,76 @@
+# benchmarks/bench_mail_pool.py
+#
+# Compares messages/sec of the old one-connection-per-message path
+# (mail.send) with MailPool against a local SMTP sink.
+#
+#   python -m benchmarks.bench_mail_pool --messages 2000 --connect-latency 20
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from flask_mail import Message
+from app.mail import mail, MailPool
+from .smtp_sink import SMTPSink
+
+
+def build_message(i):
+    return Message(subject=f'Benchmark {i}',
+                   recipients=[f'user{i}@example.com'],
+                   body='Hello from the benchmark.')
+
+
+def per_message(app, count, threads):
+    def send(i):
+        with app.app_context():
+            mail.send(build_message(i))
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send, range(count)))
+
+
+def pooled(app, count, threads, max_messages):
+    with MailPool(size=threads, max_messages=max_messages) as pool:
+        def send(i):
+            with app.app_context():
+                pool.send(build_message(i))
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(send, range(count)))
+
+
+def run(name, fn, sink, count):
+    connections = sink.handler.connections
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<12} {count / elapsed:>10.1f} msgs/s  '
+          f'{sink.handler.connections - connections:>6} connections  '
+          f'{elapsed:.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--max-messages', type=int, default=100)
+    parser.add_argument('--connect-latency', type=float, default=10,
+                        help='simulated TLS + AUTH cost per connection (ms)')
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    with SMTPSink(port=args.port,
+                  connect_latency=args.connect_latency / 1000) as sink:
+        app = Flask(__name__)
+        app.config.update(sink.mail_config())
+        mail.init_app(app)
+
+        run('per-message', lambda: per_message(
+            app, args.messages, args.threads), sink, args.messages)
+        run('pooled', lambda: pooled(
+            app, args.messages, args.threads, args.max_messages), sink,
+            args.messages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_prerender.py
+#
+# Time from the due instant to the first and the last message at a local
+# SMTP sink for a batch of events that all fall due at once, with the
+# messages rendered at send time ("cold") and rendered ahead of time by
+# prerender_due_events ("prerendered"). Bodies are --body-kb of non-ASCII
+# text, like most localized mail.
+#
+#   python -m benchmarks.bench_prerender --events 2000 --body-kb 20
+
+import argparse
+import time
+from datetime import timedelta
+from app.db import db
+from app.mime import message_cache
+from app.models import Event
+from app.tasks import prerender_due_events, send_scheduled_emails
+from app.utils.time_utils import get_current_time
+from .common import create_bench_app, seed
+from .smtp_sink import SMTPSink
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run(app, sink, args, backend, prerender):
+    app.config['DELIVERY_BACKEND'] = backend
+    with app.app_context():
+        seed(args.events,
+             body='Grüße aus dem Benchmark, Zeile für Zeile.\n' * (args.body_kb * 24))
+        message_cache.configure(app.config['MIME_CACHE_SIZE'],
+                                app.config['MIME_CACHE_MAX_BYTES'])
+        due = get_current_time() + timedelta(seconds=args.lead)
+        Event.query.update({Event.expected_sent_at: due},
+                           synchronize_session=False)
+        db.session.commit()
+    render_time = 0.0
+    if prerender:
+        start = time.perf_counter()
+        prerender_due_events(app)
+        render_time = time.perf_counter() - start
+    # The cycle starts at the due instant, like the look-ahead timer.
+    delay = (due - get_current_time()).total_seconds()
+    if delay > 0:
+        time.sleep(delay)
+
+    sink.handler.arrivals.clear()
+    start = time.perf_counter()
+    send_scheduled_emails(app)
+    arrivals = [t - start for t in sink.handler.arrivals]
+    label = 'prerendered' if prerender else 'cold'
+    print(f'{backend:<10} {label:<11}  '
+          f'first {arrivals[0] * 1000:>7.1f} ms  '
+          f'p50 {percentile(arrivals, 50) * 1000:>7.1f} ms  '
+          f'p99 {percentile(arrivals, 99) * 1000:>7.1f} ms  '
+          f'last {arrivals[-1] * 1000:>7.1f} ms  '
+          f'({len(arrivals)} sent, rendered ahead in {render_time:.2f}s)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--body-kb', type=int, default=20)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--lead', type=float, default=10,
+                        help='seconds between seeding and the due instant')
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    with SMTPSink(port=args.port) as sink:
+        app = create_bench_app(
+            ASYNC_SMTP_CONNECTIONS=args.connections,
+            DISPATCH_WORKERS=args.connections,
+            DISPATCH_MAX_IN_FLIGHT=2 * args.connections,
+            MAIL_POOL_SIZE=args.connections,
+            MIME_CACHE_SIZE=args.events,
+            LOOKAHEAD_ENABLED=False, **sink.mail_config())
+        for backend in ('flask_mail', 'asyncio'):
+            for prerender in (False, True):
+                run(app, sink, args, backend, prerender)
+        with app.app_context():
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
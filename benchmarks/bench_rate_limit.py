@@ -0,0 +1,71 @@
+# benchmarks/bench_rate_limit.py
+#
+# Sends through MailPool to a sink that answers 421 above --ceiling
+# messages/s: without a limiter, with a conservative fixed rate, and with
+# the adaptive limiter starting well above the ceiling.
+#
+#   python -m benchmarks.bench_rate_limit --messages 3000 --ceiling 200
+
+import argparse
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from app.mail import mail, MailPool
+from app.ratelimit import RateLimiter
+from .bench_mail_pool import build_message
+from .smtp_sink import SMTPSink
+
+
+def run(name, app, sink, args, limiter=None):
+    sent = sink.handler.messages
+    failed = 0
+
+    with MailPool(size=args.threads, limiter=limiter,
+                  throttle_retries=args.retries) as pool:
+        def send(i):
+            with app.app_context():
+                try:
+                    pool.send(build_message(i))
+                    return True
+                except smtplib.SMTPException:
+                    return False
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            failed = list(executor.map(send, range(args.messages))).count(False)
+        elapsed = time.perf_counter() - start
+
+    delivered = sink.handler.messages - sent
+    state = limiter.snapshot() if limiter else {}
+    print(f'{name:<10} {delivered / elapsed:>8.1f} msgs/s delivered  '
+          f'{failed:>5} failed  {state.get("throttles", 0):>3} throttles  '
+          f'final rate {state.get("rate")}  {elapsed:.2f}s')
+    # Let the sink's allowance refill before the next run.
+    time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=3000)
+    parser.add_argument('--ceiling', type=float, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    with SMTPSink(port=args.port, max_rate=args.ceiling) as sink:
+        app = Flask(__name__)
+        app.config.update(sink.mail_config())
+        mail.init_app(app)
+
+        run('none', app, sink, args)
+        run('fixed', app, sink, args,
+            RateLimiter(rate=args.ceiling / 2, burst=args.threads))
+        run('adaptive', app, sink, args,
+            RateLimiter(rate=args.ceiling * 4, burst=args.threads))
+        run('unlimited', app, sink, args, RateLimiter(burst=args.threads))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/common.py
+
+import os
+import tempfile
+from datetime import timedelta
+from flask import Flask
+from app.content import content_hash, store_contents
+from app.db import db
+from app.mail import mail
+from app.mime import message_cache
+from app.models import Event, EventRecipient, EventStatus
+from app.utils.time_utils import get_current_time, set_default_time_zone
+
+
+def create_bench_app(**config):
+    """Flask app wired like create_app(), minus the background scheduler.
+
+    Uses DATABASE_URL when set and a throwaway SQLite file otherwise.
+    """
+    url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(), 'bench.db')
+    app = Flask(__name__)
+    app.config.from_object('config.Config')
+    app.config.update(SQLALCHEMY_DATABASE_URI=url, **config)
+    set_default_time_zone(app.config['TIME_ZONE'])
+    db.init_app(app)
+    mail.init_app(app)
+    message_cache.init_app(app)
+    return app
+
+
+def seed(count, chunk_size=10000, body='Hello from the benchmark.',
+         recipients=1):
+    db.drop_all()
+    db.create_all()
+    due = get_current_time() - timedelta(minutes=1)
+    key = content_hash(body)
+    store_contents(db.session.connection(), {key: body})
+
+    def addresses(i):
+        if recipients == 1:
+            return [f'user{i}@example.com']
+        return [f'user{i}-{j}@example.com' for j in range(recipients)]
+
+    for start in range(0, count, chunk_size):
+        ids = range(start, min(start + chunk_size, count))
+        db.session.bulk_insert_mappings(Event, [{
+            'event_id': f'bench-{i:08d}',
+            'email_subject': 'Benchmark',
+            'content_hash': key,
+            'recipients': ','.join(addresses(i)),
+            'expected_sent_at': due,
+            'status': EventStatus.PENDING,
+        } for i in ids])
+        db.session.bulk_insert_mappings(EventRecipient, [{
+            'event_id': f'bench-{i:08d}',
+            'address': address,
+            'status': EventStatus.PENDING,
+        } for i in ids for address in addresses(i)])
+        db.session.commit()
@@ -0,0 +1,299 @@
+# benchmarks/loadgen.py
+#
+# HTTP load generator for a running Janus: replays a weighted mix of
+# create (POST /api/events), list (GET /api/events), index (GET /) and batch
+# (POST /api/events/batch) requests and writes the latency percentiles and
+# error rates of every operation as JSON, so runs can be compared across
+# releases.
+#
+# With --rate the load is open-loop: requests are scheduled at a fixed rate
+# and latency is measured from the scheduled start, so a server that falls
+# behind shows its queueing delay instead of hiding it (no coordinated
+# omission). Without --rate, --concurrency clients send back to back.
+#
+#   make run-prod &
+#   python -m benchmarks.loadgen --url http://localhost:5000 --rate 200 \
+#       --duration 60 --output results.json
+#   python -m benchmarks.loadgen --url http://localhost:5000 --concurrency 32 \
+#       --mix create=80,list=20 --compare results.json
+
+import argparse
+import http.client
+import itertools
+import json
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+OPERATIONS = ('create', 'list', 'index', 'batch')
+
+
+def event_payload(i):
+    send_at = datetime.now() + timedelta(days=1, seconds=i % 86400)
+    return {
+        'email_subject': f'Load test {i}',
+        'email_content': 'Hello from the load generator.',
+        'expected_sent_at': send_at.replace(microsecond=0).isoformat(),
+        'recipients': f'load{i}@example.com',
+    }
+
+
+class Client:
+    """One keep-alive connection; reopened after an error."""
+
+    def __init__(self, url, timeout, batch_size):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.connection = None
+
+    def request(self, operation, i):
+        """Send one request; return the status code, or None on a network
+        error."""
+        if operation == 'create':
+            method, path = 'POST', '/api/events'
+            body = json.dumps(event_payload(i))
+            headers = {'Content-Type': 'application/json',
+                       'Idempotency-Key': str(uuid.uuid4())}
+        elif operation == 'batch':
+            method, path = 'POST', '/api/events/batch'
+            body = '\n'.join(json.dumps(event_payload(i * self.batch_size + j))
+                             for j in range(self.batch_size))
+            headers = {'Content-Type': 'application/x-ndjson'}
+        elif operation == 'list':
+            method, path, body, headers = 'GET', '/api/events', None, {}
+        else:
+            method, path, body, headers = 'GET', '/', None, {}
+
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout)
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            if response.will_close:
+                self.close()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Recorder:
+    """Latencies and outcomes per operation, from every client thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {operation: [] for operation in OPERATIONS}
+        self.errors = {operation: 0 for operation in OPERATIONS}
+        self.statuses = {operation: {} for operation in OPERATIONS}
+
+    def record(self, operation, latency, status):
+        with self._lock:
+            self.latencies[operation].append(latency)
+            key = str(status) if status is not None else 'network'
+            counts = self.statuses[operation]
+            counts[key] = counts.get(key, 0) + 1
+            if status is None or status >= 400:
+                self.errors[operation] += 1
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summarize(latencies, errors, statuses, elapsed):
+    count = len(latencies)
+    return {
+        'requests': count,
+        'throughput_rps': count / elapsed if elapsed else 0,
+        'errors': errors,
+        'error_rate': errors / count if count else 0,
+        'statuses': statuses,
+        'latency_ms': {
+            name: None if value is None else value * 1000
+            for name, value in (
+                ('p50', percentile(latencies, 50)),
+                ('p95', percentile(latencies, 95)),
+                ('p99', percentile(latencies, 99)),
+                ('max', max(latencies) if latencies else None))},
+    }
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}; use "
+                             f"{', '.join(OPERATIONS)}.")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def run(args):
+    weights = parse_mix(args.mix)
+    operations, cumulative = list(weights), list(itertools.accumulate(
+        weights.values()))
+    rng = random.Random(args.seed)
+    counter = itertools.count()
+    recorder = Recorder()
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.duration
+
+    def pick():
+        return rng.choices(operations, cum_weights=cumulative)[0]
+
+    def execute(client, operation, scheduled):
+        status = client.request(operation, next(counter))
+        if scheduled >= measure_from:
+            recorder.record(operation, time.perf_counter() - scheduled, status)
+
+    if args.rate:
+        # Open loop: one thread schedules, the clients only execute.
+        work = queue.Queue()
+
+        def client_loop():
+            client = Client(args.url, args.timeout, args.batch_size)
+            while True:
+                item = work.get()
+                if item is None:
+                    break
+                execute(client, *item)
+            client.close()
+
+        threads = [threading.Thread(target=client_loop, daemon=True)
+                   for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        interval = 1 / args.rate
+        scheduled = started
+        while scheduled < deadline:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            work.put((pick(), scheduled))
+            scheduled += interval
+        for _ in threads:
+            work.put(None)
+    else:
+        def client_loop():
+            client = Client(args.url, args.timeout, args.batch_size)
+            while True:
+                scheduled = time.perf_counter()
+                if scheduled >= deadline:
+                    break
+                execute(client, pick(), scheduled)
+            client.close()
+
+        threads = [threading.Thread(target=client_loop, daemon=True)
+                   for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - measure_from
+
+    everything = [latency for operation in OPERATIONS
+                  for latency in recorder.latencies[operation]]
+    statuses = {}
+    for operation in OPERATIONS:
+        for key, count in recorder.statuses[operation].items():
+            statuses[key] = statuses.get(key, 0) + count
+    return {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'url': args.url, 'mode': 'rate' if args.rate else 'concurrency',
+            'rate': args.rate, 'concurrency': args.concurrency,
+            'duration': args.duration, 'warmup': args.warmup,
+            'mix': weights, 'batch_size': args.batch_size,
+        },
+        'overall': summarize(everything, sum(recorder.errors.values()),
+                             statuses, elapsed),
+        'operations': {
+            operation: summarize(recorder.latencies[operation],
+                                 recorder.errors[operation],
+                                 recorder.statuses[operation], elapsed)
+            for operation in operations},
+    }
+
+
+def report(results, previous=None):
+    """Print a table, with the change against ``previous`` results."""
+    rows = [('overall', results['overall'])] + list(
+        results['operations'].items())
+    for name, stats in rows:
+        latency = stats['latency_ms']
+        line = (f'{name:<8} {stats["requests"]:>7} req  '
+                f'{stats["throughput_rps"]:>8.1f} req/s  '
+                f'errors {stats["error_rate"]:>6.2%}  ')
+        line += '  '.join(
+            f'{q} {latency[q]:>8.1f} ms' if latency[q] is not None
+            else f'{q} {"-":>8}' for q in ('p50', 'p95', 'p99'))
+        old = (previous or {}).get('operations', {}).get(name) \
+            if name != 'overall' else (previous or {}).get('overall')
+        if old and old['latency_ms']['p99'] and latency['p99'] is not None:
+            change = latency['p99'] / old['latency_ms']['p99'] - 1
+            line += f'  (p99 {change:+.1%}, errors ' \
+                    f'{stats["error_rate"] - old["error_rate"]:+.2%})'
+        print(line, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay a create/list/index/batch mix against Janus.')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='requests per second (open loop); 0 runs '
+                             '--concurrency clients back to back')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='client connections')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5,
+                        help='seconds sent before measuring')
+    parser.add_argument('--mix', default='create=60,list=20,index=10,batch=10',
+                        help='operation weights')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='events per batch request')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help='write the JSON results here '
+                                         'instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON results to compare '
+                                          'against')
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    results = run(args)
+    report(results, previous)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/smtp_sink.py
+
+import asyncio
+import time
+from aiosmtpd.controller import Controller
+
+
+class SinkHandler:
+    """Accepts every message and throws it away, optionally slowly."""
+
+    def __init__(self, connect_latency=0.0, message_latency=0.0,
+                 recipient_latency=0.0, max_rate=0.0):
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.recipient_latency = recipient_latency
+        self.connections = 0
+        self.messages = 0
+        self.recipients = 0
+        # Provider-style cap: messages over max_rate per second get a 421.
+        self.max_rate = max_rate
+        self.throttled = 0
+        # perf_counter() of every accepted message.
+        self.arrivals = []
+        self._allowance = max_rate
+        self._checked = time.monotonic()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # Stands in for the TLS handshake and AUTH round-trips of a real
+        # provider, which only happen once per connection.
+        self.connections += 1
+        if self.connect_latency:
+            await asyncio.sleep(self.connect_latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address,
+                          rcpt_options):
+        # Real servers check every RCPT TO before accepting it.
+        if self.recipient_latency:
+            await asyncio.sleep(self.recipient_latency)
+        self.recipients += 1
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.message_latency:
+            await asyncio.sleep(self.message_latency)
+        if self.max_rate and not self._allow():
+            self.throttled += 1
+            return '421 4.7.0 Too many messages, slow down'
+        self.messages += 1
+        self.arrivals.append(time.perf_counter())
+        return '250 OK'
+
+    def _allow(self):
+        now = time.monotonic()
+        self._allowance = min(self.max_rate, self._allowance
+                              + (now - self._checked) * self.max_rate)
+        self._checked = now
+        if self._allowance < 1:
+            return False
+        self._allowance -= 1
+        return True
+
+
+class SMTPSink:
+    """Local SMTP stand-in running on a background thread."""
+
+    def __init__(self, host='127.0.0.1', port=8025, **latency):
+        self.handler = SinkHandler(**latency)
+        self.controller = Controller(self.handler, hostname=host, port=port)
+
+    @property
+    def host(self):
+        return self.controller.hostname
+
+    @property
+    def port(self):
+        return self.controller.port
+
+    def mail_config(self):
+        return {
+            'MAIL_SERVER': self.host,
+            'MAIL_PORT': self.port,
+            'MAIL_USE_TLS': False,
+            'MAIL_USE_SSL': False,
+            'MAIL_USERNAME': None,
+            'MAIL_PASSWORD': None,
+            'MAIL_DEFAULT_SENDER': 'bench@example.com',
+        }
+
+    def __enter__(self):
+        self.controller.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.controller.stop()
@@ -13,4 +13,55 @@ class Config:
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'True').lower() in ['true', 'on', '1']
     MAIL_USE_SSL = os.getenv('MAIL_USE_SSL', 'False').lower() in ['true', 'on', '1']
     MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER')
+    MAIL_POOL_SIZE = int(os.getenv('MAIL_POOL_SIZE', 4))
+    MAIL_POOL_MAX_MESSAGES = int(os.getenv('MAIL_POOL_MAX_MESSAGES', 100))
+    SMTP_RATE_LIMIT = float(os.getenv('SMTP_RATE_LIMIT', 0))
+    SMTP_BURST = int(os.getenv('SMTP_BURST', 10))
+    SMTP_MIN_RATE = float(os.getenv('SMTP_MIN_RATE', 1))
+    SMTP_THROTTLE_RETRIES = int(os.getenv('SMTP_THROTTLE_RETRIES', 3))
+    # flask_mail (one thread per send) or asyncio (aiosmtplib on one loop).
+    DELIVERY_BACKEND = os.getenv('DELIVERY_BACKEND', 'flask_mail')
+    ASYNC_SMTP_CONNECTIONS = int(os.getenv('ASYNC_SMTP_CONNECTIONS', 100))
+    ASYNC_SMTP_TIMEOUT = float(os.getenv('ASYNC_SMTP_TIMEOUT', 60))
+    DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', 4))
+    DISPATCH_MAX_IN_FLIGHT = int(os.getenv('DISPATCH_MAX_IN_FLIGHT', 16))
+    DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', 100))
+    DISPATCH_LEASE_SECONDS = int(os.getenv('DISPATCH_LEASE_SECONDS', 300))
+    RECIPIENT_CHUNK_SIZE = int(os.getenv('RECIPIENT_CHUNK_SIZE', 50))
+    TIME_ZONE = os.getenv('TIME_ZONE', 'Asia/Singapore')
+    RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 5))
+    RETRY_BASE_SECONDS = float(os.getenv('RETRY_BASE_SECONDS', 30))
+    RETRY_MAX_SECONDS = float(os.getenv('RETRY_MAX_SECONDS', 3600))
+    STATUS_FLUSH_SIZE = int(os.getenv('STATUS_FLUSH_SIZE', 100))
+    STATUS_FLUSH_INTERVAL_MS = int(os.getenv('STATUS_FLUSH_INTERVAL_MS', 500))
+    # Run the dispatcher inside the web app (single-process setups only);
+    # otherwise it runs in `python -m app.worker`.
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'False').lower() in ['true', 'on', '1']
+    # Port of the worker's Prometheus /metrics listener; 0 turns it off.
+    WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', 0))
+    # Events due this soon are fired on time by the worker. On Postgres it
+    # hears about new events at once; elsewhere only every interval.
+    LOOKAHEAD_ENABLED = os.getenv('LOOKAHEAD_ENABLED', 'True').lower() in ['true', 'on', '1']
+    LOOKAHEAD_WINDOW_SECONDS = int(os.getenv('LOOKAHEAD_WINDOW_SECONDS', 90))
+    LOOKAHEAD_INTERVAL_SECONDS = int(os.getenv('LOOKAHEAD_INTERVAL_SECONDS', 30))
+    # Render the messages of events due this soon ahead of their send time.
+    PRERENDER_WINDOW_SECONDS = int(os.getenv('PRERENDER_WINDOW_SECONDS', 300))
+    PRERENDER_INTERVAL_SECONDS = int(os.getenv('PRERENDER_INTERVAL_SECONDS', 60))
+    MIME_CACHE_SIZE = int(os.getenv('MIME_CACHE_SIZE', 10000))
+    MIME_CACHE_MAX_BYTES = int(os.getenv('MIME_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Responses remembered per Idempotency-Key, and for how long.
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 86400))
+    # Compression of stored email bodies: none, zlib or zstd (needs the
+    # zstandard package). Bodies under the minimum size are kept as is.
+    CONTENT_COMPRESSION = os.getenv('CONTENT_COMPRESSION', 'zlib')
+    CONTENT_COMPRESSION_MIN_BYTES = int(os.getenv('CONTENT_COMPRESSION_MIN_BYTES', 1024))
+    # Move sent, failed and cancelled events this old to event_archive;
+    # 0 keeps everything in the hot table.
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+    ARCHIVE_INTERVAL_SECONDS = int(os.getenv('ARCHIVE_INTERVAL_SECONDS', 3600))
+    BATCH_INSERT_CHUNK_SIZE = int(os.getenv('BATCH_INSERT_CHUNK_SIZE', 1000))
+    EVENTS_PAGE_SIZE = int(os.getenv('EVENTS_PAGE_SIZE', 50))
+    EVENTS_MAX_PAGE_SIZE = int(os.getenv('EVENTS_MAX_PAGE_SIZE', 200))
 
@@ -0,0 +1,24 @@
+"""add time_zone on event
+
+Revision ID: 5d0f8e3a6b27
+Revises: e7a4c90b1d52
+Create Date: 2024-08-22 09:41:17.530642
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0f8e3a6b27'
+down_revision = 'e7a4c90b1d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('event', sa.Column('time_zone', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('event', 'time_zone')
@@ -0,0 +1,46 @@
+"""replace status indexes with partial pending index
+
+Revision ID: 9b2e7d41c6a8
+Revises: 4f6a9c2d7b13
+Create Date: 2024-08-12 11:03:47.218930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2e7d41c6a8'
+down_revision = '4f6a9c2d7b13'
+branch_labels = None
+depends_on = None
+
+PENDING = 'NOT is_sent AND NOT is_failed AND deleted_at IS NULL'
+
+
+def upgrade():
+    # Built and dropped concurrently so a large event table stays writable.
+    with op.get_context().autocommit_block():
+        op.create_index('idx_event_pending_expected_sent_at', 'event',
+                        ['expected_sent_at', 'event_id'], unique=False,
+                        postgresql_where=sa.text(PENDING),
+                        postgresql_concurrently=True)
+        op.drop_index('idx_expected_sent_at_is_sent_is_failed_deleted_at',
+                      table_name='event', postgresql_concurrently=True)
+        op.drop_index(op.f('ix_event_is_sent'), table_name='event',
+                      postgresql_concurrently=True)
+        op.drop_index(op.f('ix_event_is_failed'), table_name='event',
+                      postgresql_concurrently=True)
+        op.drop_index(op.f('ix_event_exactly_sent_at'), table_name='event',
+                      postgresql_concurrently=True)
+    # Duplicates the primary key index.
+    op.execute('ALTER TABLE event DROP CONSTRAINT IF EXISTS event_event_id_key')
+
+
+def downgrade():
+    op.create_unique_constraint('event_event_id_key', 'event', ['event_id'])
+    op.create_index(op.f('ix_event_exactly_sent_at'), 'event', ['exactly_sent_at'], unique=False)
+    op.create_index(op.f('ix_event_is_failed'), 'event', ['is_failed'], unique=False)
+    op.create_index(op.f('ix_event_is_sent'), 'event', ['is_sent'], unique=False)
+    op.create_index('idx_expected_sent_at_is_sent_is_failed_deleted_at', 'event', ['expected_sent_at', 'is_sent', 'is_failed', 'deleted_at'], unique=False)
+    op.drop_index('idx_event_pending_expected_sent_at', table_name='event')
@@ -0,0 +1,56 @@
+"""add event archive tables
+
+Revision ID: a93f0c6e5d18
+Revises: d47e1b9c3f60
+Create Date: 2024-08-27 09:18:52.640173
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93f0c6e5d18'
+down_revision = 'd47e1b9c3f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('event_archive',
+    sa.Column('event_id', sa.String(length=50), nullable=False),
+    sa.Column('email_subject', sa.String(length=120), nullable=False),
+    sa.Column('email_content', sa.Text(), nullable=False),
+    sa.Column('recipients', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('expected_sent_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('exactly_sent_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('status', sa.SmallInteger(), nullable=False),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('time_zone', sa.String(length=64), nullable=True),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('idempotency_key', sa.String(length=255), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    op.create_index('idx_event_archive_expected_sent_at_event_id', 'event_archive', ['expected_sent_at', 'event_id'], unique=False)
+    op.create_table('event_recipient_archive',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=False, nullable=False),
+    sa.Column('event_id', sa.String(length=50), nullable=False),
+    sa.Column('address', sa.String(length=320), nullable=False),
+    sa.Column('status', sa.SmallInteger(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_event_recipient_archive_event_id'), 'event_recipient_archive', ['event_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_event_recipient_archive_event_id'), table_name='event_recipient_archive')
+    op.drop_table('event_recipient_archive')
+    op.drop_index('idx_event_archive_expected_sent_at_event_id', table_name='event_archive')
+    op.drop_table('event_archive')
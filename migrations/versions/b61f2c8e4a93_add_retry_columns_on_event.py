@@ -0,0 +1,26 @@
+"""add retry columns on event
+
+Revision ID: b61f2c8e4a93
+Revises: 5d0f8e3a6b27
+Create Date: 2024-08-24 14:12:05.318420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b61f2c8e4a93'
+down_revision = '5d0f8e3a6b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('event', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('event', sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('event', 'next_attempt_at')
+    op.drop_column('event', 'attempts')
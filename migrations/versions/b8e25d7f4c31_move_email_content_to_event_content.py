@@ -0,0 +1,79 @@
+"""move email_content to event_content
+
+Revision ID: b8e25d7f4c31
+Revises: a93f0c6e5d18
+Create Date: 2024-08-28 14:02:11.375904
+
+"""
+import zlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e25d7f4c31'
+down_revision = 'a93f0c6e5d18'
+branch_labels = None
+depends_on = None
+
+TABLES = ('event', 'event_archive')
+
+# Existing bodies are moved uncompressed; new ones follow CONTENT_COMPRESSION.
+BACKFILL = '''
+    INSERT INTO event_content (content_hash, encoding, body)
+    SELECT encode(sha256(body), 'hex'), 'none', body
+    FROM (SELECT convert_to(email_content, 'UTF8') AS body FROM event
+          UNION
+          SELECT convert_to(email_content, 'UTF8') FROM event_archive) AS bodies
+'''
+
+
+def upgrade():
+    op.create_table('event_content',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('encoding', sa.String(length=16), nullable=False),
+    sa.Column('body', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('content_hash')
+    )
+    op.execute(BACKFILL)
+    for table in TABLES:
+        op.add_column(table, sa.Column('content_hash', sa.String(length=64), nullable=True))
+        op.execute(f"UPDATE {table} SET content_hash = "
+                   f"encode(sha256(convert_to(email_content, 'UTF8')), 'hex')")
+        op.alter_column(table, 'content_hash', nullable=False)
+        op.create_foreign_key(f'{table}_content_hash_fkey', table, 'event_content', ['content_hash'], ['content_hash'])
+        op.drop_column(table, 'email_content')
+
+
+def _decode(encoding, data):
+    data = bytes(data)
+    if encoding == 'zlib':
+        data = zlib.decompress(data)
+    elif encoding == 'zstd':
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
+
+
+def downgrade():
+    bind = op.get_bind()
+    bind.execute(sa.text(
+        'CREATE TEMPORARY TABLE decoded_content '
+        '(content_hash VARCHAR(64) PRIMARY KEY, email_content TEXT)'))
+    rows = [{'content_hash': key, 'email_content': _decode(encoding, body)}
+            for key, encoding, body in bind.execute(sa.text(
+                'SELECT content_hash, encoding, body FROM event_content'))]
+    if rows:
+        bind.execute(sa.text(
+            'INSERT INTO decoded_content VALUES (:content_hash, :email_content)'),
+            rows)
+    for table in TABLES:
+        op.add_column(table, sa.Column('email_content', sa.Text(), nullable=True))
+        op.execute(f'UPDATE {table} SET email_content = decoded_content.email_content '
+                   f'FROM decoded_content '
+                   f'WHERE decoded_content.content_hash = {table}.content_hash')
+        op.alter_column(table, 'email_content', nullable=False)
+        op.drop_constraint(f'{table}_content_hash_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'content_hash')
+    op.execute('DROP TABLE decoded_content')
+    op.drop_table('event_content')
@@ -0,0 +1,49 @@
+"""add status column on event
+
+Revision ID: c3d81f5a2e90
+Revises: 9b2e7d41c6a8
+Create Date: 2024-08-19 14:26:08.551342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d81f5a2e90'
+down_revision = '9b2e7d41c6a8'
+branch_labels = None
+depends_on = None
+
+# 0 pending, 1 claimed, 2 sent, 3 failed, 4 cancelled (see EventStatus).
+BACKFILL = '''
+    UPDATE event SET status = CASE
+        WHEN is_sent THEN 2
+        WHEN is_failed THEN 3
+        WHEN deleted_at IS NOT NULL THEN 4
+        WHEN lease_expires_at > now() THEN 1
+        ELSE 0
+    END
+'''
+
+
+def upgrade():
+    op.add_column('event', sa.Column('status', sa.SmallInteger(), server_default='0', nullable=False))
+    op.execute(BACKFILL)
+    op.drop_index('idx_event_pending_expected_sent_at', table_name='event')
+    op.drop_column('event', 'is_sent')
+    op.drop_column('event', 'is_failed')
+    op.create_index('idx_event_status_expected_sent_at', 'event',
+                    ['status', 'expected_sent_at', 'event_id'], unique=False,
+                    postgresql_where=sa.text('status IN (0, 1)'))
+
+
+def downgrade():
+    op.add_column('event', sa.Column('is_failed', sa.Boolean(), nullable=True))
+    op.add_column('event', sa.Column('is_sent', sa.Boolean(), nullable=True))
+    op.execute('UPDATE event SET is_sent = (status = 2), is_failed = (status = 3)')
+    op.drop_index('idx_event_status_expected_sent_at', table_name='event')
+    op.create_index('idx_event_pending_expected_sent_at', 'event',
+                    ['expected_sent_at', 'event_id'], unique=False,
+                    postgresql_where=sa.text('NOT is_sent AND NOT is_failed AND deleted_at IS NULL'))
+    op.drop_column('event', 'status')
@@ -0,0 +1,30 @@
+"""add personalized campaigns
+
+Revision ID: c4f19a7e2b86
+Revises: b8e25d7f4c31
+Create Date: 2024-08-29 11:26:03.917452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f19a7e2b86'
+down_revision = 'b8e25d7f4c31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('event', sa.Column('personalized', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.add_column('event_archive', sa.Column('personalized', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.add_column('event_recipient', sa.Column('variables', sa.Text(), nullable=True))
+    op.add_column('event_recipient_archive', sa.Column('variables', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('event_recipient_archive', 'variables')
+    op.drop_column('event_recipient', 'variables')
+    op.drop_column('event_archive', 'personalized')
+    op.drop_column('event', 'personalized')
@@ -0,0 +1,26 @@
+"""add idempotency key on event
+
+Revision ID: d47e1b9c3f60
+Revises: b61f2c8e4a93
+Create Date: 2024-08-26 10:41:37.502916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd47e1b9c3f60'
+down_revision = 'b61f2c8e4a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('event', sa.Column('idempotency_key', sa.String(length=255), nullable=True))
+    op.create_unique_constraint('event_idempotency_key_key', 'event', ['idempotency_key'])
+
+
+def downgrade():
+    op.drop_constraint('event_idempotency_key_key', 'event', type_='unique')
+    op.drop_column('event', 'idempotency_key')
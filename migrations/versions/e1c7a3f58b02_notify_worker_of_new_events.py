@@ -0,0 +1,36 @@
+"""notify worker of new events
+
+Revision ID: e1c7a3f58b02
+Revises: c4f19a7e2b86
+Create Date: 2024-09-04 09:41:27.218830
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1c7a3f58b02'
+down_revision = 'c4f19a7e2b86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('''
+        CREATE OR REPLACE FUNCTION janus_notify_event() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('janus_event', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute('''
+        CREATE TRIGGER event_notify
+            AFTER INSERT OR UPDATE OF expected_sent_at ON event
+            FOR EACH STATEMENT EXECUTE PROCEDURE janus_notify_event()
+    ''')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER event_notify ON event')
+    op.execute('DROP FUNCTION janus_notify_event()')
@@ -0,0 +1,44 @@
+"""add event_recipient table
+
+Revision ID: e7a4c90b1d52
+Revises: c3d81f5a2e90
+Create Date: 2024-08-21 10:12:44.018216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4c90b1d52'
+down_revision = 'c3d81f5a2e90'
+branch_labels = None
+depends_on = None
+
+# Only events that can still be dispatched need per-recipient rows; sent and
+# failed history keeps its comma-separated recipients.
+BACKFILL = '''
+    INSERT INTO event_recipient (event_id, address, status)
+    SELECT DISTINCT event.event_id, trim(address), 0
+    FROM event, unnest(string_to_array(event.recipients, ',')) AS address
+    WHERE event.status IN (0, 1) AND trim(address) <> ''
+'''
+
+
+def upgrade():
+    op.create_table('event_recipient',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('event_id', sa.String(length=50), nullable=False),
+    sa.Column('address', sa.String(length=320), nullable=False),
+    sa.Column('status', sa.SmallInteger(), server_default='0', nullable=False),
+    sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['event.event_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id', 'address', name='uq_event_recipient_event_id_address')
+    )
+    op.execute(BACKFILL)
+
+
+def downgrade():
+    op.drop_table('event_recipient')
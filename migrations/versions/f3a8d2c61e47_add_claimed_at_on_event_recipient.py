@@ -0,0 +1,24 @@
+"""add claimed_at on event_recipient
+
+Revision ID: f3a8d2c61e47
+Revises: e1c7a3f58b02
+Create Date: 2024-09-06 11:08:52.614307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8d2c61e47'
+down_revision = 'e1c7a3f58b02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('event_recipient', sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('event_recipient', 'claimed_at')
@@ -0,0 +1,85 @@
+# tests/test_content.py
+
+import unittest
+from app import create_app, db
+from app.content import content_hash, decode, encode, load_bodies
+from app.models import Event, EventContent
+
+
+class TestEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        body = 'Hello ü\n' * 500
+        for codec in ('none', 'zlib'):
+            encoding, data = encode(body, codec)
+            self.assertEqual(encoding, codec)
+            self.assertEqual(decode(encoding, data), body)
+        self.assertLess(len(encode(body, 'zlib')[1]), len(body))
+
+    def test_small_bodies_are_not_compressed(self):
+        self.assertEqual(encode('Hello', 'zlib', min_bytes=1024),
+                         ('none', b'Hello'))
+
+    def test_invalid_codec(self):
+        with self.assertRaises(ValueError):
+            encode('Hello' * 1000, 'lz4')
+
+
+class TestContentStorage(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.client = cls.app.test_client()
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def setUp(self):
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_identical_bodies_are_stored_once(self):
+        body = 'Campaign body\n' * 200
+        for i in range(3):
+            db.session.add(Event(event_id=f"event-{i}", email_subject="Test",
+                                 email_content=body,
+                                 recipients="test@example.com"))
+        db.session.commit()
+        response = self.client.post('/api/events/batch', json=[{
+            'email_subject': 'Test',
+            'email_content': body,
+            'expected_sent_at': '2024-08-01T10:00:00',
+            'recipients': 'test@example.com',
+        }] * 2)
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(Event.query.count(), 5)
+        content = EventContent.query.one()
+        self.assertEqual(content.content_hash, content_hash(body))
+        self.assertEqual(content.encoding, 'zlib')
+        self.assertEqual(content.text, body)
+        db.session.expunge_all()
+        self.assertEqual(Event.query.get("event-1").email_content, body)
+
+    def test_edited_body_gets_its_own_row(self):
+        db.session.add(Event(event_id="event-1", email_subject="Test",
+                             email_content="Old", recipients="a@example.com"))
+        db.session.commit()
+        event = Event.query.get("event-1")
+        event.email_content = "New"
+        db.session.commit()
+
+        self.assertEqual(load_bodies([content_hash("Old"), content_hash("New")]),
+                         {content_hash("Old"): "Old",
+                          content_hash("New"): "New"})
+        db.session.expunge_all()
+        self.assertEqual(Event.query.get("event-1").email_content, "New")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+# tests/test_delivery.py
+
+import unittest
+from unittest.mock import MagicMock, ANY
+from aiosmtpd.controller import Controller
+from app import create_app, db
+from app.mail import mail
+from app.async_delivery import AsyncSMTPBackend
+from app.delivery import FlaskMailBackend, get_backend
+from app.models import Event, EventRecipient, EventStatus
+from datetime import datetime, timezone
+
+
+class Handler:
+    def __init__(self):
+        self.messages = []
+        self.data_reply = '250 OK'
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith('unknown'):
+            return '550 5.1.1 No such user'
+        if address.startswith('busy'):
+            return '451 4.2.1 Mailbox busy'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.data_reply.startswith('250'):
+            self.messages.append(envelope.rcpt_tos)
+        return self.data_reply
+
+
+class TestDeliveryBackends(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def setUp(self):
+        db.create_all()
+        db.session.add(Event(
+            event_id="event-1",
+            email_subject="Test Subject",
+            email_content="Test Content",
+            expected_sent_at=datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc),
+            recipients="a@example.com",
+            status=EventStatus.CLAIMED,
+            lease_owner="worker-1",
+            recipient_rows=[EventRecipient(address="a@example.com")]
+        ))
+        db.session.commit()
+        self.handler = Handler()
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=8027)
+        self.controller.start()
+        self.app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=8027,
+                               MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+                               MAIL_USERNAME=None, MAIL_PASSWORD=None,
+                               MAIL_DEFAULT_SENDER='sender@example.com')
+        mail.init_app(self.app)
+
+    def tearDown(self):
+        self.controller.stop()
+        self.app.config['DELIVERY_BACKEND'] = 'flask_mail'
+        db.session.remove()
+        db.drop_all()
+
+    def test_get_backend(self):
+        with get_backend(self.app) as backend:
+            self.assertIsInstance(backend, FlaskMailBackend)
+
+        self.app.config['DELIVERY_BACKEND'] = 'asyncio'
+        with get_backend(self.app) as backend:
+            self.assertIsInstance(backend, AsyncSMTPBackend)
+
+        self.app.config['DELIVERY_BACKEND'] = 'carrier-pigeon'
+        with self.assertRaises(ValueError):
+            get_backend(self.app)
+
+    def test_async_backend_sends_chunks(self):
+        outcomes = MagicMock()
+
+        with AsyncSMTPBackend(self.app) as backend:
+            backend.prepare(["event-1"], "worker-1")
+            backend.submit("event-1", [(1, "a@example.com"), (2, "b@example.com")],
+                           "worker-1", outcomes)
+            backend.submit("event-1", [(3, "c@example.com")], "worker-1", outcomes)
+
+        self.assertEqual(sorted(self.handler.messages),
+                         [["a@example.com", "b@example.com"], ["c@example.com"]])
+        outcomes.sent.assert_any_call("event-1", [1, 2], ANY)
+        outcomes.sent.assert_any_call("event-1", [3], ANY)
+        outcomes.failed.assert_not_called()
+
+    def test_async_backend_classifies_failures(self):
+        outcomes = MagicMock()
+        self.app.config['SMTP_THROTTLE_RETRIES'] = 0
+
+        with AsyncSMTPBackend(self.app) as backend:
+            backend.submit("event-1", [(1, "unknown@example.com")], "worker-1",
+                           outcomes)
+        self.handler.data_reply = '452 4.3.1 Insufficient storage'
+        with AsyncSMTPBackend(self.app) as backend:
+            backend.submit("event-1", [(2, "a@example.com")], "worker-1", outcomes)
+
+        self.app.config['SMTP_THROTTLE_RETRIES'] = 3
+        outcomes.failed.assert_any_call("event-1", [1], ANY, ANY, permanent=True)
+        outcomes.failed.assert_any_call("event-1", [2], ANY, ANY, permanent=False)
+        outcomes.sent.assert_not_called()
+
+    def test_async_backend_records_partly_refused_chunk(self):
+        outcomes = MagicMock()
+
+        with AsyncSMTPBackend(self.app) as backend:
+            backend.submit("event-1", [(1, "a@example.com"),
+                                       (2, "unknown@example.com"),
+                                       (3, "busy@example.com")],
+                           "worker-1", outcomes)
+
+        self.assertEqual(self.handler.messages, [["a@example.com"]])
+        outcomes.sent.assert_called_once_with("event-1", [1], ANY)
+        outcomes.failed.assert_any_call("event-1", [2], ANY, ANY, permanent=True)
+        outcomes.failed.assert_any_call("event-1", [3], ANY, ANY, permanent=False)
+        self.assertEqual(outcomes.failed.call_count, 2)
+
+    def test_async_backend_skips_lost_lease(self):
+        outcomes = MagicMock()
+
+        with AsyncSMTPBackend(self.app) as backend:
+            backend.prepare(["event-1"], "worker-2")
+            backend.submit("event-1", [(1, "a@example.com")], "worker-2", outcomes)
+
+        self.assertEqual(self.handler.messages, [])
+        outcomes.sent.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
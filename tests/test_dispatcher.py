@@ -0,0 +1,61 @@
+# tests/test_dispatcher.py
+
+import threading
+import time
+import unittest
+from app.dispatcher import Dispatcher
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def test_runs_every_submission(self):
+        done = []
+        lock = threading.Lock()
+
+        def work(i):
+            with lock:
+                done.append(i)
+
+        with Dispatcher(workers=4) as dispatcher:
+            for i in range(50):
+                dispatcher.submit(work, i)
+
+        self.assertEqual(sorted(done), list(range(50)))
+
+    def test_bounds_in_flight_work(self):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def work():
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+
+        with Dispatcher(workers=8, max_in_flight=3) as dispatcher:
+            for _ in range(20):
+                dispatcher.submit(work)
+
+        self.assertLessEqual(peak, 3)
+
+    def test_error_in_one_send_does_not_stop_others(self):
+        done = []
+
+        def work(i):
+            if i == 0:
+                raise RuntimeError("boom")
+            done.append(i)
+
+        with Dispatcher(workers=1) as dispatcher:
+            futures = [dispatcher.submit(work, i) for i in range(3)]
+
+        self.assertIsInstance(futures[0].exception(), RuntimeError)
+        self.assertEqual(done, [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 # tests/test_email_utils.py
 
 import unittest
-from app.utils.email_utils import is_valid_email, validate_and_get_recipients
+from app.utils.email_utils import (check_email, is_valid_email,
+                                   validate_and_get_recipients,
+                                   validate_recipients)
 
 
 class TestEmailUtils(unittest.TestCase):
@@ -34,6 +36,35 @@ class TestEmailUtils(unittest.TestCase):
         self.assertEqual(recipients, [])
         self.assertEqual(error, 'Recipients are required.')
 
+    def test_validate_recipients_dedupes_in_one_pass(self):
+        for addresses in ('a@example.com, B@example.com,A@EXAMPLE.com , b@example.com',
+                          ['a@example.com', ' B@example.com', 'A@EXAMPLE.com',
+                           'b@example.com']):
+            result = validate_recipients(addresses)
+            self.assertEqual(result.valid, ['a@example.com', 'B@example.com'])
+            self.assertEqual(result.duplicate_count, 2)
+            self.assertIsNone(result.error)
+
+    def test_validate_recipients_bounds_invalid_report(self):
+        addresses = (f'user{i}.example.com' if i % 2 else f'user{i}@example.com'
+                     for i in range(100))
+
+        result = validate_recipients(addresses, max_invalid=3)
+
+        self.assertEqual(len(result.valid), 50)
+        self.assertEqual(result.invalid_count, 50)
+        self.assertEqual(result.error, 'Invalid emails: user1.example.com, '
+                         'user3.example.com, user5.example.com and 47 more')
+
+    def test_check_email_is_cached(self):
+        check_email.cache_clear()
+        check_email(' test@example.com')
+        check_email(' test@example.com')
+
+        self.assertEqual(check_email.cache_info().hits, 1)
+        self.assertEqual(check_email(' test@example.com'),
+                         ('test@example.com', 'test@example.com'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,30 @@
+# tests/test_idempotency.py
+
+import unittest
+from app.idempotency import IdempotencyCache
+
+
+class TestIdempotencyCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.cache = IdempotencyCache(max_entries=2, ttl=60,
+                                      clock=lambda: self.now)
+
+    def test_expires_entries_after_ttl(self):
+        self.cache.put('key-1', ({'status': 'success'}, 201))
+        self.now = 59
+        self.assertEqual(self.cache.get('key-1'), ({'status': 'success'}, 201))
+        self.now = 60
+        self.assertIsNone(self.cache.get('key-1'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('key-1', 1)
+        self.cache.put('key-2', 2)
+        self.cache.get('key-1')
+        self.cache.put('key-3', 3)
+
+        self.assertEqual(self.cache.get('key-1'), 1)
+        self.assertIsNone(self.cache.get('key-2'))
+        self.assertEqual(self.cache.get('key-3'), 3)
@@ -0,0 +1,126 @@
+# tests/test_lookahead.py
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import timedelta
+from app import create_app
+from app.db import db
+from app.lookahead import Lookahead
+from app.models import Event
+from app.utils.time_utils import get_current_time, set_clock
+
+
+class TestLookahead(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+
+    def setUp(self):
+        with self.app.app_context():
+            db.create_all()
+        self.lookahead = Lookahead()
+        self.backend = MagicMock()
+        self.outcomes = MagicMock()
+        self.lookahead.start(self.app, self.backend, self.outcomes)
+
+    def tearDown(self):
+        self.lookahead.stop()
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def add_events(self, count, due):
+        with self.app.app_context():
+            for i in range(count):
+                db.session.add(Event(
+                    event_id=f"event-{i}", email_subject="Subject",
+                    email_content="Body", recipients="a@example.com",
+                    expected_sent_at=due + timedelta(seconds=i)))
+            db.session.commit()
+            db.session.remove()
+
+    def test_ignores_events_outside_window(self):
+        now = get_current_time()
+
+        self.assertFalse(self.lookahead.schedule(
+            "overdue", now - timedelta(minutes=5)))
+        self.assertFalse(self.lookahead.schedule(
+            "far-future", now + timedelta(hours=1)))
+
+    def test_does_not_schedule_when_stopped(self):
+        idle = Lookahead()
+        self.assertFalse(idle.schedule(
+            "event", get_current_time() + timedelta(seconds=1)))
+
+    @patch('app.lookahead.fire_event')
+    def test_fires_event_at_due_time(self, mock_fire_event):
+        fired = threading.Event()
+        fired_at = []
+
+        def fire(*args):
+            fired_at.append(get_current_time())
+            fired.set()
+
+        mock_fire_event.side_effect = fire
+        due = get_current_time() + timedelta(milliseconds=200)
+
+        self.assertTrue(self.lookahead.schedule("event", due))
+        self.assertFalse(self.lookahead.schedule("event", due))
+        self.assertTrue(fired.wait(5))
+
+        mock_fire_event.assert_called_once()
+        self.assertEqual(mock_fire_event.call_args[0][0], "event")
+        self.assertGreaterEqual(fired_at[0], due)
+        self.assertLess(fired_at[0], due + timedelta(seconds=1))
+        # Into the backend and outcome buffer it was started with
+        self.assertIs(mock_fire_event.call_args[0][2], self.backend)
+        self.assertIs(mock_fire_event.call_args[0][3], self.outcomes)
+
+    @patch('app.lookahead.fire_event')
+    def test_follows_injected_clock(self, mock_fire_event):
+        now = get_current_time()
+        clock = [now]
+        fired = threading.Event()
+        mock_fire_event.side_effect = lambda *args: fired.set()
+        previous = set_clock(lambda: clock[0])
+        try:
+            self.assertTrue(self.lookahead.schedule(
+                "event", now + timedelta(seconds=60)))
+            self.assertFalse(fired.wait(0.3))
+
+            clock[0] = now + timedelta(seconds=60)
+            self.assertTrue(fired.wait(5))
+        finally:
+            set_clock(previous)
+
+    def test_load_is_capped_at_batch_size(self):
+        self.lookahead.limit = 3
+        self.add_events(5, get_current_time() + timedelta(seconds=30))
+
+        self.lookahead.load()
+
+        # The earliest ones; the rest are left to the next load or the poll
+        self.assertEqual(sorted(event_id for _, event_id in
+                                self.lookahead._heap),
+                         ["event-0", "event-1", "event-2"])
+
+    def test_hears_new_events_on_postgres(self):
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('LISTEN/NOTIFY needs Postgres')
+
+        # Created by another process: nothing calls load or schedule here
+        self.add_events(1, get_current_time() + timedelta(seconds=30))
+
+        deadline = time.monotonic() + 5
+        while "event-0" not in self.lookahead._scheduled \
+                and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertIn("event-0", self.lookahead._scheduled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# tests/test_mail.py
+
+import smtplib
+import unittest
+from unittest.mock import patch, MagicMock
+from app.mail import MailPool, is_permanent
+from app.ratelimit import RateLimiter
+
+
+def make_connection():
+    connection = MagicMock()
+    connection.host.sock = object()
+    connection.host.sendmail.return_value = {}
+    return connection
+
+
+def make_message(*recipients):
+    message = MagicMock(sender='sender@example.com', date=None,
+                        send_to=set(recipients or ['a@example.com']),
+                        mail_options=[], rcpt_options=[])
+    message.has_bad_headers.return_value = False
+    return message
+
+
+class TestMailPool(unittest.TestCase):
+
+    @patch('app.mail.mail.connect')
+    def test_reuses_connection(self, mock_connect):
+        connection = make_connection()
+        mock_connect.return_value = connection
+
+        with MailPool(size=2, max_messages=10) as pool:
+            for _ in range(3):
+                pool.send(make_message())
+
+        mock_connect.assert_called_once()
+        self.assertEqual(connection.host.sendmail.call_count, 3)
+        connection.__exit__.assert_called_once()
+
+    @patch('app.mail.mail.connect')
+    def test_recycles_after_max_messages(self, mock_connect):
+        first, second = make_connection(), make_connection()
+        mock_connect.side_effect = [first, second]
+
+        with MailPool(size=1, max_messages=2) as pool:
+            for _ in range(3):
+                pool.send(make_message())
+
+        self.assertEqual(mock_connect.call_count, 2)
+        self.assertEqual(first.host.sendmail.call_count, 2)
+        self.assertEqual(second.host.sendmail.call_count, 1)
+        first.__exit__.assert_called_once()
+
+    @patch('app.mail.mail.connect')
+    def test_reconnects_when_server_drops_connection(self, mock_connect):
+        dropped, fresh = make_connection(), make_connection()
+        dropped.host.sendmail.side_effect = smtplib.SMTPServerDisconnected()
+        mock_connect.side_effect = [dropped, fresh]
+
+        with MailPool(size=1) as pool:
+            pool.send(make_message())
+
+        self.assertEqual(mock_connect.call_count, 2)
+        fresh.host.sendmail.assert_called_once()
+
+    @patch('app.mail.mail.connect')
+    def test_keeps_connection_after_rejected_message(self, mock_connect):
+        connection = make_connection()
+        connection.host.sendmail.side_effect = [
+            smtplib.SMTPRecipientsRefused({}), {}]
+        mock_connect.return_value = connection
+
+        with MailPool(size=1) as pool:
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                pool.send(make_message())
+            pool.send(make_message())
+
+        mock_connect.assert_called_once()
+
+    @patch('app.mail.mail.connect')
+    def test_retries_throttled_message_through_limiter(self, mock_connect):
+        connection = make_connection()
+        connection.host.sendmail.side_effect = [
+            smtplib.SMTPDataError(421, b'slow down'), {}]
+        mock_connect.return_value = connection
+        limiter = RateLimiter(rate=100, burst=10, sleep=lambda seconds: None)
+
+        with MailPool(size=1, limiter=limiter, throttle_retries=1) as pool:
+            pool.send(make_message())
+
+        self.assertEqual(connection.host.sendmail.call_count, 2)
+        self.assertEqual(limiter.snapshot()['throttles'], 1)
+        self.assertLess(limiter.rate, 100)
+
+    @patch('app.mail.mail.connect')
+    def test_returns_refused_recipients(self, mock_connect):
+        connection = make_connection()
+        connection.host.sendmail.return_value = {
+            'b@example.com': (550, b'no such user')}
+        mock_connect.return_value = connection
+
+        with MailPool(size=1) as pool:
+            refused = pool.send(make_message('a@example.com', 'b@example.com'))
+
+        self.assertEqual(refused, {'b@example.com': (550, b'no such user')})
+        sender, recipients = connection.host.sendmail.call_args[0][:2]
+        self.assertEqual(sender, 'sender@example.com')
+        self.assertEqual(sorted(recipients), ['a@example.com', 'b@example.com'])
+
+    def test_classifies_permanent_errors(self):
+        self.assertTrue(is_permanent(smtplib.SMTPDataError(554, b'rejected')))
+        self.assertTrue(is_permanent(smtplib.SMTPRecipientsRefused(
+            {'a@example.com': (550, b'no such user')})))
+        self.assertTrue(is_permanent(ValueError('bad message')))
+        self.assertFalse(is_permanent(smtplib.SMTPDataError(451, b'try later')))
+        self.assertFalse(is_permanent(smtplib.SMTPRecipientsRefused(
+            {'a@example.com': (550, b'no such user'),
+             'b@example.com': (450, b'mailbox busy')})))
+        self.assertFalse(is_permanent(smtplib.SMTPServerDisconnected()))
+        self.assertFalse(is_permanent(ConnectionRefusedError()))
+
+
+if __name__ == '__main__':
+    unittest.main()
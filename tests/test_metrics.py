@@ -0,0 +1,86 @@
+# tests/test_metrics.py
+
+import threading
+import unittest
+from app.metrics import (Counter, FunctionCounter, Gauge, Histogram,
+                         Registry)
+from app.ratelimit import RateLimiter
+
+
+class TestPrometheusMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_sums_every_thread(self):
+        counter = Counter('sent', 'Sent.', registry=self.registry)
+
+        def work():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(5)
+
+        # Cells of the exited threads are folded, not lost
+        self.assertEqual(counter.value(), 4005)
+        self.assertEqual(counter.value(), 4005)
+        self.assertIn('sent_total 4005', self.registry.render())
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram('latency_seconds', 'Latency.', (0.1, 1),
+                              labelnames=('endpoint',),
+                              registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value, ('list',))
+
+        lines = self.registry.render().splitlines()
+        self.assertEqual(lines[:2], ['# HELP latency_seconds Latency.',
+                                     '# TYPE latency_seconds histogram'])
+        self.assertEqual(lines[2:], [
+            'latency_seconds_bucket{endpoint="list",le="0.1"} 2',
+            'latency_seconds_bucket{endpoint="list",le="1.0"} 3',
+            'latency_seconds_bucket{endpoint="list",le="+Inf"} 4',
+            'latency_seconds_sum{endpoint="list"} 2.65',
+            'latency_seconds_count{endpoint="list"} 4',
+        ])
+
+    def test_gauge_reads_its_function_and_survives_errors(self):
+        Gauge('backlog', 'Backlog.', lambda: 7, registry=self.registry)
+        Gauge('broken', 'Broken.', lambda: 1 / 0, registry=self.registry)
+
+        text = self.registry.render()
+        self.assertIn('\nbacklog 7\n', text)
+        self.assertIn('# TYPE broken gauge', text)
+        self.assertNotIn('\nbroken ', text)
+
+    def test_rate_limiter_exports_its_state_once(self):
+        limiter = RateLimiter(rate=10, burst=1, sleep=lambda seconds: None)
+        limiter.export(self.registry)
+        limiter.export(self.registry)
+        limiter.acquire()
+        limiter.acquire()
+
+        text = self.registry.render()
+        self.assertEqual(text.count('# TYPE janus_smtp_rate_limit_rate gauge'), 1)
+        self.assertIn('\njanus_smtp_rate_limit_rate 10\n', text)
+        self.assertIn('# TYPE janus_smtp_rate_limit_waits counter', text)
+        self.assertIn('\njanus_smtp_rate_limit_waits_total 1\n', text)
+
+    def test_unset_values_are_left_out(self):
+        Gauge('rate', 'Rate.', lambda: None, registry=self.registry)
+        FunctionCounter('throttles', 'Throttles.', lambda: 3,
+                        registry=self.registry)
+
+        text = self.registry.render()
+        self.assertIn('# TYPE rate gauge', text)
+        self.assertNotIn('\nrate ', text)
+        self.assertIn('\nthrottles_total 3\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
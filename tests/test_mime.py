@@ -0,0 +1,224 @@
+# tests/test_mime.py
+
+import unittest
+from unittest.mock import patch
+from flask_mail import Message
+from app import create_app, db
+from app.mail import mail
+from app.mime import (MessageCache, MessageTemplate, PersonalizedTemplate,
+                      message_cache)
+from app.models import Event
+from app.tasks import prerender_due_events
+from datetime import datetime, timedelta, timezone
+
+
+def _headers(raw):
+    head = raw.split(b'\r\n\r\n', 1)[0].decode()
+    return [line for line in head.split('\r\n')
+            if not line.startswith(('Date:', 'Message-ID:'))]
+
+
+class TestMessageTemplate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app.config['MAIL_DEFAULT_SENDER'] = 'sender@example.com'
+        mail.init_app(cls.app)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def test_renders_like_flask_mail(self):
+        template = MessageTemplate('Grüße', 'Hello\nthere', 'sender@example.com')
+        raw = template.render(['a@example.com'], date=0)
+        expected = Message(subject='Grüße', recipients=['a@example.com'],
+                           body='Hello\nthere', sender='sender@example.com')
+        expected.date = 0
+
+        self.assertEqual(_headers(raw), _headers(expected.as_bytes()))
+        self.assertEqual(raw.split(b'\r\n\r\n', 1)[1],
+                         expected.as_bytes().split(b'\r\n\r\n', 1)[1])
+
+    def test_renders_recipients_and_fresh_message_ids(self):
+        template = MessageTemplate('Subject', 'Body', 'sender@example.com')
+        first = template.render(['a@example.com', 'b@example.com'])
+        second = template.render(['c@example.com'])
+
+        self.assertIn(b'\r\nTo: a@example.com,\r\n b@example.com\r\n', first)
+        self.assertIn(b'\r\nTo: c@example.com\r\n', second)
+        self.assertNotIn(b'render.invalid', first)
+        message_id = [line for line in first.split(b'\r\n')
+                      if line.startswith(b'Message-ID:')]
+        self.assertEqual(len(message_id), 1)
+        self.assertNotIn(message_id[0], second)
+
+
+class TestPersonalizedTemplate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app.config['MAIL_DEFAULT_SENDER'] = 'sender@example.com'
+        mail.init_app(cls.app)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def test_renders_like_flask_mail(self):
+        template = PersonalizedTemplate(
+            'Hello {{ name }}', 'Dear {{ name }},\r\nyour code: {{ code }}\n',
+            'sender@example.com')
+        for name in ('Ann', 'Zoë', 'Zoë Ann ' * 20):
+            raw = template.message('a@example.com',
+                                   {'name': name, 'code': 7}).as_bytes()
+            expected = Message(subject=f'Hello {name}',
+                               recipients=['a@example.com'],
+                               body=f'Dear {name},\r\nyour code: 7\n',
+                               sender='sender@example.com')
+            self.assertEqual(_headers(raw), _headers(expected.as_bytes()))
+            self.assertEqual(raw.split(b'\r\n\r\n', 1)[1],
+                             expected.as_bytes().split(b'\r\n\r\n', 1)[1])
+
+    def test_missing_variables_render_empty(self):
+        template = PersonalizedTemplate('Hi', 'Hello {{ name }}!',
+                                        'sender@example.com')
+        self.assertTrue(template.message('a@example.com', {}).as_bytes()
+                        .endswith(b'\r\n\r\nHello !'))
+
+    def test_rejects_unsafe_output(self):
+        template = PersonalizedTemplate('{{ subject }}', '{{ x.__class__.__subclasses__() }}',
+                                        'sender@example.com')
+        with self.assertRaises(ValueError):
+            template.message('a@example.com', {'subject': 'Hi\nBcc: x@y.z'})
+        with self.assertRaises(Exception):
+            template.message('a@example.com', {'subject': 'Hi', 'x': 1})
+
+    def test_cache_yields_failures_per_recipient(self):
+        cache = MessageCache()
+        messages = list(cache.messages(
+            'event-1', 1,
+            [('a@example.com', '{"n": 1}'), ('b@example.com', None)],
+            lambda: ('Hi', '{{ n | int + 1 }}')))
+        self.assertTrue(messages[0].as_bytes().endswith(b'2'))
+        # Undefined, so the filter fails for this recipient alone.
+        self.assertIsInstance(messages[1], Exception)
+
+        broken = list(cache.messages('event-2', 1, [('a@example.com', None)],
+                                     lambda: ('Hi', '{% if %}')))
+        self.assertIsInstance(broken[0], Exception)
+
+
+class TestMessageCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app.config['MAIL_DEFAULT_SENDER'] = 'sender@example.com'
+        mail.init_app(cls.app)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def test_is_bounded_by_entries_and_bytes(self):
+        cache = MessageCache(max_entries=2)
+        for i in range(3):
+            cache.render(f'event-{i}', 1, 'Subject', 'Body')
+        self.assertNotIn(('event-0', 1), cache)
+        self.assertIn(('event-2', 1), cache)
+
+        size = MessageTemplate('Subject', 'x' * 1000).size
+        cache = MessageCache(max_entries=10, max_bytes=2 * size)
+        for i in range(3):
+            cache.render(f'event-{i}', 1, 'Subject', 'x' * 1000)
+        self.assertEqual(cache.snapshot()['entries'], 2)
+        self.assertLessEqual(cache.snapshot()['bytes'], 2 * size)
+
+    def test_misses_on_a_new_version(self):
+        cache = MessageCache()
+        cache.render('event-1', 1, 'Subject', 'Old body')
+        loads = []
+
+        def load():
+            loads.append(1)
+            return 'Subject', 'New body'
+
+        cache.message('event-1', 1, ['a@example.com'], load)
+        message = cache.message('event-1', 2, ['a@example.com'], load)
+        cache.message('event-1', 2, ['b@example.com'], load)
+
+        self.assertEqual(len(loads), 1)
+        self.assertIn(b'New body', message.as_bytes())
+        self.assertEqual(cache.snapshot()['hits'], 2)
+
+
+class TestPrerender(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app.config['MAIL_DEFAULT_SENDER'] = 'sender@example.com'
+        mail.init_app(cls.app)
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def setUp(self):
+        db.create_all()
+        message_cache.configure()
+        self.now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        for i, minutes in enumerate([-1, 2, 4, 10]):
+            db.session.add(Event(
+                event_id=f"event-{i}",
+                email_subject="Test Subject",
+                email_content="Test Content",
+                expected_sent_at=self.now + timedelta(minutes=minutes),
+                recipients="test@example.com"
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    @patch('app.tasks.get_current_time')
+    def test_renders_events_due_within_the_window(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+
+        self.assertEqual(prerender_due_events(self.app), 2)
+        self.assertEqual(prerender_due_events(self.app), 0)
+
+        versions = {event.event_id: event.updated_at
+                    for event in Event.query.all()}
+        cached = [event_id for event_id, version in versions.items()
+                  if (event_id, version) in message_cache]
+        self.assertEqual(sorted(cached), ["event-1", "event-2"])
+
+    @patch('app.tasks.get_current_time')
+    def test_drops_edited_events(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+        prerender_due_events(self.app)
+
+        event = Event.query.get("event-1")
+        rendered_at = event.updated_at
+        event.email_content = "Edited"
+        db.session.commit()
+
+        self.assertNotIn(("event-1", rendered_at), message_cache)
+        self.assertEqual(prerender_due_events(self.app), 1)
+        message = message_cache.message(
+            "event-1", Event.query.get("event-1").updated_at,
+            ["test@example.com"], None)
+        self.assertIn(b"Edited", message.as_bytes())
@@ -0,0 +1,32 @@
+# tests/test_models.py
+
+import unittest
+from app.models import Event, EventStatus
+
+
+class TestEventStatus(unittest.TestCase):
+
+    def test_status_flags_are_read_only(self):
+        event = Event(status=EventStatus.SENT)
+
+        self.assertTrue(event.is_sent)
+        self.assertFalse(event.is_failed)
+        with self.assertRaises(AttributeError):
+            event.is_sent = False
+
+    def test_sources(self):
+        self.assertEqual(EventStatus.sources(EventStatus.CLAIMED),
+                         (EventStatus.PENDING,))
+        self.assertEqual(EventStatus.sources(EventStatus.SENT),
+                         (EventStatus.PENDING, EventStatus.CLAIMED))
+        self.assertEqual(EventStatus.sources(EventStatus.PENDING),
+                         (EventStatus.CLAIMED,))
+
+    def test_from_name(self):
+        self.assertEqual(EventStatus.from_name('failed'), EventStatus.FAILED)
+        with self.assertRaises(ValueError):
+            EventStatus.from_name('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
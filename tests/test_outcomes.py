@@ -0,0 +1,206 @@
+# tests/test_outcomes.py
+
+import unittest
+from unittest.mock import patch
+from app import create_app, db
+from app.metrics import recipients_failed, recipients_retried, recipients_sent
+from app.models import Event, EventRecipient, EventStatus
+from app.outcomes import OutcomeBuffer, backoff_delay
+from datetime import datetime, timedelta, timezone
+
+
+class TestOutcomeBuffer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def setUp(self):
+        db.create_all()
+        self.now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        # Recipients are claimed while their chunk is in flight
+        for i in range(3):
+            db.session.add(Event(
+                event_id=f"event-{i}",
+                email_subject="Test Subject",
+                email_content="Test Content",
+                expected_sent_at=self.now,
+                recipients="a@example.com,b@example.com",
+                recipient_rows=[EventRecipient(id=2 * i + 1, address="a@example.com",
+                                               status=EventStatus.CLAIMED),
+                                EventRecipient(id=2 * i + 2, address="b@example.com",
+                                               status=EventStatus.CLAIMED)]
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_flushes_outcomes_in_bulk_on_close(self):
+        with OutcomeBuffer(self.app, flush_size=10, flush_interval_ms=0) as outcomes:
+            outcomes.sent("event-0", [1, 2], self.now)
+            outcomes.sent("event-1", [3], self.now)
+            outcomes.sent("event-1", [4], self.now + timedelta(seconds=1))
+            outcomes.failed("event-2", [5, 6], "Mailbox unavailable", self.now)
+
+            # Nothing is written until the buffer flushes
+            self.assertEqual(Event.query.filter_by(is_sent=True).count(), 0)
+
+        db.session.expire_all()
+        sent = Event.query.get("event-1")
+        failed = Event.query.get("event-2")
+        self.assertTrue(Event.query.get("event-0").is_sent)
+        self.assertTrue(sent.is_sent)
+        self.assertEqual(sent.exactly_sent_at.replace(tzinfo=timezone.utc),
+                         self.now + timedelta(seconds=1))
+        self.assertTrue(failed.is_failed)
+        self.assertFalse(failed.is_sent)
+        self.assertEqual(failed.error_message, "Mailbox unavailable")
+        self.assertEqual(EventRecipient.query.filter_by(
+            status=EventStatus.SENT).count(), 4)
+
+    def test_flushes_when_buffer_is_full(self):
+        outcomes = OutcomeBuffer(self.app, flush_size=2, flush_interval_ms=0)
+        outcomes.sent("event-0", [1, 2], self.now)
+        outcomes.sent("event-1", [3, 4], self.now)
+
+        self.assertEqual(Event.query.filter_by(is_sent=True).count(), 2)
+        outcomes.close()
+
+    def test_settles_event_once_every_chunk_is_in(self):
+        outcomes = OutcomeBuffer(self.app, flush_size=1, flush_interval_ms=0)
+        outcomes.failed("event-0", [1], "Mailbox unavailable", self.now)
+        self.assertEqual(Event.query.get("event-0").status, EventStatus.PENDING)
+
+        outcomes.sent("event-0", [2], self.now)
+        outcomes.finish("event-1")
+        outcomes.close()
+
+        db.session.expire_all()
+        # A partial failure fails the event but keeps the sent address sent
+        event = Event.query.get("event-0")
+        self.assertEqual(event.status, EventStatus.FAILED)
+        self.assertEqual(event.error_message, "Mailbox unavailable")
+        self.assertEqual(EventRecipient.query.get(2).status, EventStatus.SENT)
+        # finish() leaves an event with recipients in flight alone
+        self.assertEqual(Event.query.get("event-1").status, EventStatus.PENDING)
+
+    def test_holds_streaming_event_until_finished(self):
+        # Only the first chunk is claimed; the second is still to come
+        EventRecipient.query.get(2).status = EventStatus.PENDING
+        db.session.commit()
+        outcomes = OutcomeBuffer(self.app, flush_size=1, flush_interval_ms=0)
+        outcomes.begin("event-0", "worker-1")
+        outcomes.sent("event-0", [1], self.now)
+
+        db.session.expire_all()
+        event = Event.query.get("event-0")
+        self.assertEqual(event.status, EventStatus.PENDING)
+        self.assertEqual(event.attempts, 0)
+
+        EventRecipient.query.get(2).status = EventStatus.CLAIMED
+        db.session.commit()
+        outcomes.sent("event-0", [2], self.now)
+        outcomes.finish("event-0")
+        outcomes.close()
+
+        db.session.expire_all()
+        self.assertTrue(Event.query.get("event-0").is_sent)
+
+    @patch('app.outcomes.time.monotonic')
+    @patch('app.outcomes.get_current_time')
+    def test_renews_lease_while_sends_are_outstanding(self, mock_get_current_time,
+                                                      mock_monotonic):
+        for event_id, owner in (("event-0", "worker-1"), ("event-1", "worker-2")):
+            event = Event.query.get(event_id)
+            event.status = EventStatus.CLAIMED
+            event.lease_owner = owner
+            event.lease_expires_at = self.now
+        db.session.commit()
+        lease = timedelta(seconds=self.app.config['DISPATCH_LEASE_SECONDS'])
+        renewed_at = self.now + timedelta(minutes=1)
+        mock_get_current_time.return_value = renewed_at
+        mock_monotonic.return_value = 0
+
+        outcomes = OutcomeBuffer(self.app, flush_size=10, flush_interval_ms=0)
+        for event_id in ("event-0", "event-1"):
+            outcomes.begin(event_id, "worker-1")
+            outcomes.submitted(event_id, 1)
+            outcomes.finish(event_id)
+        outcomes.flush()
+
+        db.session.expire_all()
+        self.assertEqual(Event.query.get("event-0").lease_expires_at,
+                         renewed_at + lease)
+        # A lease taken over by another dispatcher is left alone
+        self.assertEqual(Event.query.get("event-1").lease_expires_at, self.now)
+
+        # The other address is still claimed by a dispatcher that went away:
+        # once the chunk sent here is in, the lease is left to run out
+        outcomes.sent("event-0", [1], renewed_at)
+        mock_get_current_time.return_value = self.now + timedelta(minutes=10)
+        mock_monotonic.return_value = lease.total_seconds()
+        outcomes.close()
+
+        db.session.expire_all()
+        event = Event.query.get("event-0")
+        self.assertEqual(event.status, EventStatus.CLAIMED)
+        self.assertEqual(event.lease_expires_at, renewed_at + lease)
+
+    def test_retries_transient_failure_with_backoff(self):
+        with OutcomeBuffer(self.app, flush_size=10, flush_interval_ms=0) as outcomes:
+            outcomes.sent("event-0", [1], self.now)
+            outcomes.failed("event-0", [2], "Service unavailable", self.now,
+                            permanent=False)
+
+        db.session.expire_all()
+        event = Event.query.get("event-0")
+        self.assertEqual(event.status, EventStatus.PENDING)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(event.error_message, "Service unavailable")
+        self.assertIsNotNone(event.next_attempt_at)
+        self.assertEqual(EventRecipient.query.get(2).status, EventStatus.PENDING)
+
+        # The last attempt gives up and fails what is left
+        event.attempts = self.app.config['RETRY_MAX_ATTEMPTS'] - 1
+        EventRecipient.query.get(2).status = EventStatus.CLAIMED
+        db.session.commit()
+        with OutcomeBuffer(self.app, flush_size=10, flush_interval_ms=0) as outcomes:
+            outcomes.failed("event-0", [2], "Service unavailable", self.now,
+                            permanent=False)
+
+        db.session.expire_all()
+        self.assertEqual(Event.query.get("event-0").status, EventStatus.FAILED)
+        self.assertEqual(EventRecipient.query.get(2).status, EventStatus.FAILED)
+        self.assertEqual(EventRecipient.query.get(1).status, EventStatus.SENT)
+
+    def test_counts_recipients_once_written(self):
+        before = (recipients_sent.value(), recipients_failed.value(),
+                  recipients_retried.value())
+        outcomes = OutcomeBuffer(self.app, flush_size=10, flush_interval_ms=0)
+        outcomes.sent("event-0", [1, 2], self.now)
+        outcomes.failed("event-1", [3], "Mailbox unavailable", self.now)
+        outcomes.failed("event-1", [4], "Service unavailable", self.now,
+                        permanent=False)
+        self.assertEqual(recipients_sent.value(), before[0])
+
+        outcomes.close()
+        self.assertEqual((recipients_sent.value(), recipients_failed.value(),
+                          recipients_retried.value()),
+                         (before[0] + 2, before[1] + 1, before[2] + 1))
+
+    def test_backoff_delay_is_jittered_and_capped(self):
+        delays = [backoff_delay(3, 30, 3600) for _ in range(50)]
+        self.assertTrue(all(60 <= delay <= 120 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertLessEqual(backoff_delay(20, 30, 3600), 3600)
+
+if __name__ == '__main__':
+    unittest.main()
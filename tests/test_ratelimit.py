@@ -0,0 +1,86 @@
+# tests/test_ratelimit.py
+
+import smtplib
+import unittest
+from app.ratelimit import RateLimiter, is_throttled
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make_limiter(self, **kwargs):
+        return RateLimiter(clock=self.clock, sleep=self.clock.sleep, **kwargs)
+
+    def test_paces_after_burst(self):
+        limiter = self.make_limiter(rate=10, burst=2)
+
+        for _ in range(4):
+            limiter.acquire()
+
+        # Two tokens from the burst, then one every 100 ms
+        self.assertEqual(len(self.clock.slept), 2)
+        self.assertAlmostEqual(self.clock.now, 0.2)
+        self.assertEqual(limiter.snapshot()['waits'], 2)
+
+    def test_unlimited_without_rate(self):
+        limiter = self.make_limiter()
+
+        for _ in range(100):
+            limiter.acquire()
+
+        self.assertEqual(self.clock.slept, [])
+        self.assertIsNone(limiter.snapshot()['rate'])
+
+    def test_backs_off_once_per_cooldown_and_recovers(self):
+        limiter = self.make_limiter(rate=100, burst=10, backoff=0.5,
+                                    recovery=2, recovery_interval=1)
+
+        limiter.throttled()
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 50)
+        self.assertEqual(limiter.snapshot()['throttles'], 1)
+
+        self.clock.now += 1
+        limiter.acquire()
+        self.assertEqual(limiter.rate, 100)
+        self.clock.now += 1
+        limiter.acquire()
+        # Never above the configured rate
+        self.assertEqual(limiter.rate, 100)
+
+    def test_unlimited_starts_pacing_below_sent_rate(self):
+        limiter = self.make_limiter(backoff=0.5, min_rate=1)
+        for _ in range(40):
+            self.clock.now += 0.025
+            limiter.acquire()
+
+        limiter.throttled()
+
+        self.assertAlmostEqual(limiter.rate, 20, delta=1)
+
+    def test_is_throttled(self):
+        self.assertTrue(is_throttled(smtplib.SMTPDataError(421, b'slow down')))
+        self.assertTrue(is_throttled(smtplib.SMTPRecipientsRefused(
+            {'a@example.com': (451, b'try later')})))
+        self.assertFalse(is_throttled(smtplib.SMTPRecipientsRefused(
+            {'a@example.com': (550, b'no such user')})))
+        self.assertFalse(is_throttled(smtplib.SMTPRecipientsRefused({})))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# tests/test_retention.py
+
+import unittest
+from datetime import datetime, timedelta
+import pytz
+from app import create_app, db
+from app.models import (ArchivedEvent, ArchivedEventRecipient, Event,
+                        EventRecipient, EventStatus)
+from app.retention import archive_batch, archive_events
+
+
+class TestRetention(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def setUp(self):
+        db.create_all()
+        self.now = datetime.now(pytz.UTC)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def add_event(self, event_id, status, days_ago):
+        db.session.add(Event(
+            event_id=event_id,
+            email_subject=f"Subject {event_id}",
+            email_content="Content",
+            expected_sent_at=self.now - timedelta(days=days_ago),
+            recipients="a@example.com,b@example.com",
+            status=status,
+            recipient_rows=[
+                EventRecipient(address="a@example.com", status=status),
+                EventRecipient(address="b@example.com", status=status)]))
+        db.session.commit()
+
+    def test_archive_batch_moves_old_terminal_events(self):
+        self.add_event("old-sent", EventStatus.SENT, 40)
+        self.add_event("old-failed", EventStatus.FAILED, 35)
+        self.add_event("old-pending", EventStatus.PENDING, 40)
+        self.add_event("new-sent", EventStatus.SENT, 1)
+
+        moved = archive_batch(self.now - timedelta(days=30), 100)
+
+        self.assertEqual(moved, 2)
+        self.assertEqual(sorted(e.event_id for e in Event.query),
+                         ["new-sent", "old-pending"])
+        archived = ArchivedEvent.query.get("old-sent")
+        self.assertEqual(archived.status, EventStatus.SENT)
+        self.assertEqual(archived.email_content, "Content")
+        self.assertEqual(archived.expected_sent_at,
+                         self.now - timedelta(days=40))
+        self.assertIsNotNone(archived.archived_at)
+        self.assertEqual(
+            sorted(r.address for r in ArchivedEventRecipient.query.filter_by(
+                event_id="old-sent")),
+            ["a@example.com", "b@example.com"])
+        self.assertEqual(EventRecipient.query.filter(
+            EventRecipient.event_id.in_(["old-sent", "old-failed"])).count(), 0)
+
+    def test_archive_events_runs_in_batches(self):
+        for i in range(5):
+            self.add_event(f"event-{i}", EventStatus.SENT, 60 + i)
+        self.app.config['ARCHIVE_BATCH_SIZE'] = 2
+        try:
+            self.assertEqual(archive_events(self.app), 5)
+        finally:
+            self.app.config['ARCHIVE_BATCH_SIZE'] = 1000
+        self.assertEqual(Event.query.count(), 0)
+        self.assertEqual(ArchivedEvent.query.count(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@
 
 import unittest
 from app import create_app, db
-from app.models import Event
+from app.idempotency import idempotency_cache
+from app.models import ArchivedEvent, Event, EventRecipient, EventStatus
+from app.retention import archive_batch
 from app.utils.email_utils import validate_and_get_recipients
 from app.utils.time_utils import get_default_time_zone
 from datetime import datetime
@@ -49,6 +51,118 @@ class TestRoutes(unittest.TestCase):
         self.assertIn(b'Test Subject', response.data)
         self.assertIn(b'Test Content', response.data)
 
+    def add_events(self, count):
+        for i in range(count):
+            db.session.add(Event(
+                event_id=f"event-{i}",
+                email_subject=f"Test Subject {i}",
+                email_content="Test Content",
+                expected_sent_at=datetime(2024, 8, 1, 10, i, 0, tzinfo=pytz.UTC),
+                recipients="test@example.com",
+                status=EventStatus.SENT if i % 2 == 0 else EventStatus.PENDING
+            ))
+        db.session.commit()
+
+    def test_list_emails_paginates_newest_first(self):
+        self.add_events(5)
+
+        response = self.client.get('/api/events?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['event_id'] for e in response.json['events']],
+                         ['event-4', 'event-3'])
+        self.assertEqual(response.json['events'][0]['status'], 'sent')
+        self.assertEqual(response.json['events'][0]['expected_sent_at'],
+                         '2024-08-01T18:04:00+08:00')
+
+        seen = [e['event_id'] for e in response.json['events']]
+        cursor = response.json['next_cursor']
+        while cursor:
+            response = self.client.get(f'/api/events?limit=2&cursor={cursor}')
+            seen += [e['event_id'] for e in response.json['events']]
+            cursor = response.json['next_cursor']
+        self.assertEqual(seen, [f'event-{i}' for i in range(4, -1, -1)])
+
+    def test_list_emails_in_request_time_zone(self):
+        self.add_events(1)
+
+        response = self.client.get('/api/events?tz=America/New_York')
+        self.assertEqual(response.json['events'][0]['expected_sent_at'],
+                         '2024-08-01T06:00:00-04:00')
+
+        response = self.client.get('/api/events',
+                                   headers={'X-Time-Zone': 'Mars/Olympus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['error'], 'Invalid time zone.')
+
+    def test_save_emails_post_with_event_time_zone(self):
+        data = {
+            'email_subject': 'Test Subject',
+            'email_content': 'Test Content',
+            'expected_sent_at': '2024-08-01T10:00:00',
+            'recipients': 'test@example.com',
+            'time_zone': 'Europe/London'
+        }
+
+        response = self.client.post('/api/events', json=data)
+        self.assertEqual(response.status_code, 201)
+
+        event = Event.query.first()
+        self.assertEqual(event.time_zone, 'Europe/London')
+        # Stored as UTC and listed in the event's own zone
+        self.assertEqual(event.expected_sent_at,
+                         datetime(2024, 8, 1, 9, 0, 0, tzinfo=pytz.UTC))
+        self.assertEqual(event.expected_sent_at.utcoffset().total_seconds(), 0)
+        response = self.client.get('/api/events')
+        self.assertEqual(response.json['events'][0]['expected_sent_at'],
+                         '2024-08-01T10:00:00+01:00')
+
+        data['time_zone'] = 'Nowhere/Special'
+        response = self.client.post('/api/events', json=data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['error'], 'Invalid time zone.')
+
+    def test_list_emails_filters_by_status(self):
+        self.add_events(5)
+
+        response = self.client.get('/api/events?status=pending')
+        self.assertEqual([e['event_id'] for e in response.json['events']],
+                         ['event-3', 'event-1'])
+        self.assertIsNone(response.json['next_cursor'])
+
+    def test_list_emails_merges_archived_events(self):
+        self.add_events(6)
+        archive_batch(datetime(2024, 8, 1, 10, 3, 0, tzinfo=pytz.UTC), 100)
+        self.assertEqual(ArchivedEvent.query.count(), 2)
+
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            response = self.client.get(f'/api/events?limit=2&cursor={cursor}')
+            seen += [e['event_id'] for e in response.json['events']]
+            cursor = response.json['next_cursor']
+        self.assertEqual(seen, ['event-5', 'event-4', 'event-3', 'event-2',
+                                'event-1', 'event-0'])
+
+        response = self.client.get('/api/events?status=sent')
+        self.assertEqual([e['event_id'] for e in response.json['events']],
+                         ['event-4', 'event-2', 'event-0'])
+        response = self.client.get('/api/events?status=pending')
+        self.assertEqual([e['event_id'] for e in response.json['events']],
+                         ['event-5', 'event-3', 'event-1'])
+
+    def test_list_emails_fail_invalid_status(self):
+        response = self.client.get('/api/events?status=unknown')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Invalid status', response.data)
+
+    def test_index_does_not_modify_events(self):
+        self.add_events(1)
+
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'2024-08-01 18:00:00+08:00', response.data)
+        self.assertFalse(db.session.dirty)
+
     def test_add_email_post_fail_invalid_datetime(self):
         data = {
             'email_subject': 'Test Subject',
@@ -81,6 +195,65 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(event.email_content, 'Test Content')
         self.assertEqual(event.recipients, 'test@example.com')
 
+    def test_save_emails_post_replays_idempotency_key(self):
+        data = {
+            'email_subject': 'Test Subject',
+            'email_content': 'Test Content',
+            'expected_sent_at': '2024-08-01T10:00:00',
+            'recipients': 'test@example.com'
+        }
+        headers = {'Idempotency-Key': str(uuid.uuid4())}
+
+        first = self.client.post('/api/events', json=data, headers=headers)
+        second = self.client.post('/api/events', json=data, headers=headers)
+        # Forgotten by the cache, still caught by the unique column.
+        idempotency_cache.configure()
+        third = self.client.post('/api/events', json=data, headers=headers)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        for response in (second, third):
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json, first.json)
+            self.assertEqual(response.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(Event.query.count(), 1)
+        self.assertEqual(EventRecipient.query.count(), 1)
+
+        response = self.client.post('/api/events', json=data,
+                                    headers={'Idempotency-Key': 'x' * 256})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Event.query.count(), 1)
+
+    def test_metrics(self):
+        self.add_events(3)
+        self.client.get('/api/events')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        self.assertIn('# TYPE janus_http_request_seconds histogram', text)
+        self.assertIn('janus_http_request_seconds_count{method="GET",'
+                      'endpoint="main.list_emails",status="200"}', text)
+        self.assertIn('# TYPE janus_recipients_sent counter', text)
+        self.assertIn('\njanus_dispatch_backlog 1\n', text)
+
+    def test_save_emails_post_dedupes_recipients(self):
+        data = {
+            'email_subject': 'Test Subject',
+            'email_content': 'Test Content',
+            'expected_sent_at': '2024-08-01T10:00:00',
+            'recipients': 'a@example.com, B@example.com,A@EXAMPLE.com,b@example.com'
+        }
+
+        response = self.client.post('/api/events', json=data)
+        self.assertEqual(response.status_code, 201)
+
+        event = Event.query.first()
+        self.assertEqual(event.recipients, 'a@example.com,B@example.com')
+        self.assertEqual(sorted(r.address for r in EventRecipient.query.all()),
+                         ['B@example.com', 'a@example.com'])
+
     def test_save_emails_post_fail_missing_fields(self):
         data = {
             'email_subject': 'Test Subject',
@@ -106,7 +279,116 @@ class TestRoutes(unittest.TestCase):
         self.assertIn(
             b'Invalid datetime format. Use ISO 8601 format.', response.data)
 
-    
+    def test_save_emails_batch_post_partial_success(self):
+        data = [
+            {
+                'email_subject': 'Test Subject 1',
+                'email_content': 'Test Content 1',
+                'expected_sent_at': '2024-08-01T10:00:00',
+                'recipients': 'test1@example.com'
+            },
+            {
+                'email_subject': 'Test Subject 2',
+                'email_content': 'Test Content 2',
+                'expected_sent_at': 'Invalid datetime format',
+                'recipients': 'test2@example.com'
+            },
+            {
+                'email_subject': 'Test Subject 3',
+                'email_content': 'Test Content 3',
+                'expected_sent_at': '2024-08-01T11:00:00',
+                'recipients': 'test3@example.com'
+            },
+        ]
+
+        response = self.client.post('/api/events/batch', json=data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['status'], 'partial')
+        self.assertEqual(response.json['created'], 2)
+        self.assertEqual(response.json['errors'], [{
+            'index': 1, 'error': 'Invalid datetime format. Use ISO 8601 format.'}])
+
+        subjects = sorted(e.email_subject for e in Event.query.all())
+        self.assertEqual(subjects, ['Test Subject 1', 'Test Subject 3'])
+        self.assertIsNotNone(Event.query.first().created_at)
+        self.assertEqual(EventRecipient.query.count(), 2)
+
+    def test_save_emails_batch_post_ndjson(self):
+        lines = [
+            '{"email_subject": "Test Subject", "email_content": "Test Content", '
+            '"expected_sent_at": "2024-08-01T10:00:00", '
+            '"recipients": "test%d@example.com"}' % i for i in range(5)
+        ]
+        lines.append('not json')
+
+        response = self.client.post('/api/events/batch',
+                                    data='\n'.join(lines),
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['created'], 5)
+        self.assertEqual(response.json['errors'][0]['index'], 5)
+        self.assertEqual(Event.query.count(), 5)
+
+    def test_save_emails_batch_post_fail_not_array(self):
+        response = self.client.post('/api/events/batch',
+                                    json={'email_subject': 'Test Subject'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Expected a JSON array or NDJSON body.', response.data)
+
+    def test_save_campaign_post(self):
+        response = self.client.post('/api/campaigns', json={
+            'email_subject': 'Hello {{ name }}',
+            'email_content': 'Your code is {{ code }}.',
+            'expected_sent_at': '2024-08-01T10:00:00',
+            'recipients': [
+                {'email': 'a@example.com', 'variables': {'name': 'Ann', 'code': 1}},
+                {'email': 'B@example.com', 'variables': {'name': 'Bob'}},
+                {'email': 'b@example.com'},
+                {'email': 'not-an-email'},
+            ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['status'], 'partial')
+        self.assertEqual(response.json['recipients'], 2)
+        self.assertEqual(response.json['duplicates'], 1)
+        self.assertEqual(response.json['error'], 'Invalid emails: not-an-email')
+
+        event = Event.query.one()
+        self.assertTrue(event.personalized)
+        self.assertEqual(event.email_content, 'Your code is {{ code }}.')
+        self.assertEqual(
+            [(r.address, r.variables) for r in EventRecipient.query.order_by(
+                EventRecipient.id)],
+            [('a@example.com', '{"code":1,"name":"Ann"}'),
+             ('B@example.com', '{"name":"Bob"}')])
+
+    def test_save_campaign_post_ndjson(self):
+        lines = ['{"email_subject": "Hi {{ name }}", "email_content": "Hello", '
+                 '"expected_sent_at": "2024-08-01T10:00:00"}']
+        lines += ['{"email": "user%d@example.com", "variables": {"name": "%d"}}'
+                  % (i, i) for i in range(5)]
+        response = self.client.post('/api/campaigns', data='\n'.join(lines),
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['recipients'], 5)
+        self.assertEqual(EventRecipient.query.count(), 5)
+
+    def test_save_campaign_post_fail_invalid_template(self):
+        response = self.client.post('/api/campaigns', json={
+            'email_subject': 'Hello {{ name',
+            'email_content': 'Body',
+            'expected_sent_at': '2024-08-01T10:00:00',
+            'recipients': [{'email': 'a@example.com'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Invalid template', response.data)
+
+    def test_save_campaign_post_fail_no_recipients(self):
+        response = self.client.post('/api/campaigns', json={
+            'email_subject': 'Hello',
+            'email_content': 'Body',
+            'expected_sent_at': '2024-08-01T10:00:00',
+            'recipients': [{'email': 'bad'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Event.query.count(), 0)
 
 
 if __name__ == '__main__':
@@ -1,12 +1,16 @@
 # tests/test_tasks.py
 
+import threading
 import unittest
-from unittest.mock import patch, MagicMock
-from app import create_app
-from app.tasks import send_email, send_scheduled_emails
-from app.models import Event
+from unittest.mock import patch, MagicMock, ANY, call
+from app import create_app, db
+from app.tasks import (claim_due_events, claim_event, load_recipient_chunks,
+                       release_expired_leases, send_chunk,
+                       send_scheduled_emails)
+from app.models import Event, EventRecipient, EventStatus
+from app.outcomes import OutcomeBuffer
 from app.utils.time_utils import get_current_time
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 
 class TestTasks(unittest.TestCase):
@@ -17,103 +21,297 @@ class TestTasks(unittest.TestCase):
         cls.app = create_app()  # Ensure create_app initializes the Flask app
         cls.app.app_context().push()  # Push the app context for the test cases
 
+    def _send_one(self, mock_mail_send):
+        """Send a claimed single-recipient event through send_chunk and a
+        real OutcomeBuffer; return the event as stored afterwards."""
+        now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        db.create_all()
+        try:
+            db.session.add(Event(
+                event_id="12345678-1234-1234-1234-1234567890ab",
+                email_subject="Test Subject", email_content="Test Content",
+                expected_sent_at=now, recipients="test@example.com",
+                status=EventStatus.CLAIMED, lease_owner="worker-1",
+                recipient_rows=[EventRecipient(address="test@example.com",
+                                               status=EventStatus.CLAIMED)]))
+            db.session.commit()
+            chunk = [(EventRecipient.query.one().id, "test@example.com")]
+
+            with OutcomeBuffer(self.app, flush_interval_ms=0) as outcomes, \
+                    patch.object(self.app.extensions['mail'],
+                                 'default_sender', 'sender@example.com'):
+                send_chunk("12345678-1234-1234-1234-1234567890ab", chunk,
+                           self.app, None, "worker-1", outcomes)
+
+            mock_mail_send.assert_called_once()
+            self.assertEqual(mock_mail_send.call_args[0][0].recipients,
+                             ["test@example.com"])
+            db.session.remove()
+            return Event.query.get("12345678-1234-1234-1234-1234567890ab")
+        finally:
+            db.session.remove()
+            db.drop_all()
+
     @patch('app.tasks.mail.send')
+    @patch('app.outcomes.get_current_time')
     @patch('app.tasks.get_current_time')
-    def test_send_email_success(self, mock_get_current_time, mock_mail_send):
-        """Test send_email function for successful email sending."""
-        # Setup mock
-        mock_get_current_time.return_value = datetime(
-            2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+    def test_send_chunk_success(self, mock_get_current_time,
+                                mock_outcome_time, mock_mail_send):
+        """Test a sent chunk settles its event as sent."""
+        now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        mock_get_current_time.return_value = now
+        mock_outcome_time.return_value = now
 
-        # Create a mock event
-        event = Event(
-            event_id="12345678-1234-1234-1234-1234567890ab",
-            email_subject="Test Subject",
-            email_content="Test Content",
-            expected_sent_at=datetime(
-                2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc),
-            recipients="test@example.com"
-        )
-
-        # Call send_email function
-        send_email(event, self.app)
-
-        # Assertions
-        mock_mail_send.assert_called_once()
-        self.assertTrue(event.is_sent)
-        self.assertEqual(event.exactly_sent_at, datetime(
-            2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc))
-        self.assertEqual(event.updated_at, datetime(
-            2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc))
-        self.assertFalse(event.is_failed)
+        event = self._send_one(mock_mail_send)
+
+        self.assertEqual(event.status, EventStatus.SENT)
+        self.assertEqual(event.exactly_sent_at, now)
+        self.assertEqual(event.updated_at, now)
         self.assertIsNone(event.error_message)
 
     @patch('app.tasks.mail.send')
+    @patch('app.outcomes.get_current_time')
     @patch('app.tasks.get_current_time')
-    def test_send_email_failure(self, mock_get_current_time, mock_mail_send):
-        """Test send_email function for failure scenario."""
-        # Setup mock
-        mock_get_current_time.return_value = datetime(
-            2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+    def test_send_chunk_failure(self, mock_get_current_time,
+                                mock_outcome_time, mock_mail_send):
+        """Test a chunk refused for good settles its event as failed."""
+        now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        mock_get_current_time.return_value = now
+        mock_outcome_time.return_value = now
         mock_mail_send.side_effect = Exception("Email sending failed")
 
-        # Create a mock event
-        event = Event(
-            event_id="12345678-1234-1234-1234-1234567890ab",
-            email_subject="Test Subject",
-            email_content="Test Content",
-            expected_sent_at=datetime(
-                2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc),
-            recipients="test@example.com"
-        )
-
-        # Call send_email function
-        send_email(event, self.app)
-
-        # Assertions
-        mock_mail_send.assert_called_once()
-        self.assertTrue(event.is_failed)
+        event = self._send_one(mock_mail_send)
+
+        self.assertEqual(event.status, EventStatus.FAILED)
         self.assertEqual(event.error_message, "Email sending failed")
-        self.assertEqual(event.updated_at, datetime(
-            2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc))
+        self.assertEqual(event.updated_at, now)
 
-    @patch('app.tasks.send_email')
+    @patch('app.tasks.mail.send')
+    @patch('app.outcomes.get_current_time')
     @patch('app.tasks.get_current_time')
-    def test_send_scheduled_emails(self, mock_get_current_time, mock_send_email):
-        """Test send_scheduled_emails function."""
+    def test_send_chunk_partly_refused(self, mock_get_current_time,
+                                       mock_outcome_time, mock_mail_send):
+        """Test recipients refused at RCPT are not recorded as sent."""
+        now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        mock_get_current_time.return_value = now
+        mock_outcome_time.return_value = now
+        mock_mail_send.return_value = {
+            "b@example.com": (550, b"no such user"),
+            "c@example.com": (451, b"greylisted")}
+        db.create_all()
+        try:
+            db.session.add(Event(
+                event_id="event-1", email_subject="Subject",
+                email_content="Body", expected_sent_at=now, recipients="",
+                status=EventStatus.CLAIMED, lease_owner="worker-1",
+                recipient_rows=[
+                    EventRecipient(address=f"{name}@example.com",
+                                   status=EventStatus.CLAIMED)
+                    for name in ("a", "b", "c")]))
+            db.session.commit()
+            chunk = [(r.id, r.address) for r in EventRecipient.query.order_by(
+                EventRecipient.id)]
+
+            with OutcomeBuffer(self.app, flush_interval_ms=0) as outcomes, \
+                    patch.object(self.app.extensions['mail'],
+                                 'default_sender', 'sender@example.com'):
+                send_chunk("event-1", chunk, self.app, None, "worker-1",
+                           outcomes)
+
+            mock_mail_send.assert_called_once()
+            db.session.remove()
+            rows = {r.address: r for r in EventRecipient.query}
+            self.assertEqual(rows["a@example.com"].status, EventStatus.SENT)
+            self.assertEqual(rows["b@example.com"].status, EventStatus.FAILED)
+            self.assertIn("550", rows["b@example.com"].error_message)
+            # The greylisted address is retried with the event.
+            self.assertEqual(rows["c@example.com"].status, EventStatus.PENDING)
+            event = Event.query.get("event-1")
+            self.assertEqual(event.status, EventStatus.PENDING)
+            self.assertEqual(event.attempts, 1)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+    @patch('app.tasks.release_expired_leases')
+    @patch('app.tasks.load_recipient_chunks')
+    @patch('app.tasks.send_chunk')
+    @patch('app.tasks.get_current_time')
+    def test_send_scheduled_emails(self, mock_get_current_time, mock_send_chunk,
+                                   mock_load_recipient_chunks,
+                                   mock_release_expired_leases):
+        """Test send_scheduled_emails dispatches every recipient chunk."""
         # Setup mocks
         mock_get_current_time.return_value = datetime(
             2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
 
-        # Create some mock events
-        event1 = Event(
-            event_id="12345678-1234-1234-1234-1234567890ab",
-            email_subject="Test Subject 1",
-            email_content="Test Content 1",
-            expected_sent_at=datetime(
-                2024, 8, 1, 9, 0, 0, tzinfo=timezone.utc),
-            recipients="test1@example.com"
-        )
-        event2 = Event(
-            event_id="23456789-2345-2345-2345-234567890abc",
-            email_subject="Test Subject 2",
-            email_content="Test Content 2",
-            expected_sent_at=datetime(
-                2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc),
-            recipients="test2@example.com"
-        )
-
-        # Mock Event.query
-        with patch('app.tasks.Event.query') as mock_query:
-            mock_query.filter.return_value.all.return_value = [event1, event2]
+        event_id1 = "12345678-1234-1234-1234-1234567890ab"
+        event_id2 = "23456789-2345-2345-2345-234567890abc"
+        chunk1 = [(1, "a@example.com"), (2, "b@example.com")]
+        chunk2 = [(3, "c@example.com")]
+        mock_load_recipient_chunks.return_value = iter(
+            [(event_id1, chunk1), (event_id1, chunk2)])
+
+        # Mock the lease claims: one batch, then nothing left
+        with patch('app.tasks.claim_due_events') as mock_claim, \
+                patch('app.tasks.OutcomeBuffer') as mock_outcome_buffer:
+            mock_claim.side_effect = [[(datetime(2024, 8, 1, 9, 0, 0), event_id1),
+                                       (datetime(2024, 8, 1, 10, 0, 0), event_id2)],
+                                      []]
+            outcomes = mock_outcome_buffer.return_value.__enter__.return_value
 
             # Call send_scheduled_emails function
             send_scheduled_emails(self.app)
 
             # Assertions
-            mock_send_email.assert_any_call(event1, self.app)
-            mock_send_email.assert_any_call(event2, self.app)
-            self.assertEqual(mock_send_email.call_count, 2)
+            mock_release_expired_leases.assert_called_once()
+            self.assertEqual(mock_claim.call_count, 2)
+            # The second claim continues after the last key of the first
+            self.assertEqual(mock_claim.call_args[0][4],
+                             (datetime(2024, 8, 1, 10, 0, 0), event_id2))
+            mock_load_recipient_chunks.assert_called_once_with(
+                [event_id1, event_id2], self.app.config['RECIPIENT_CHUNK_SIZE'],
+                self.app.config['DISPATCH_LEASE_SECONDS'])
+            mock_send_chunk.assert_any_call(event_id1, chunk1, self.app, ANY, ANY, ANY)
+            mock_send_chunk.assert_any_call(event_id1, chunk2, self.app, ANY, ANY, ANY)
+            self.assertEqual(mock_send_chunk.call_count, 2)
+            # Both events are settled once their chunks are in, including
+            # the one with nothing left to send
+            outcomes.begin.assert_has_calls([call(event_id1, ANY), call(event_id2, ANY)])
+            outcomes.finish.assert_has_calls([call(event_id1), call(event_id2)])
+
+    @patch('app.tasks.release_expired_leases')
+    @patch('app.tasks.load_recipient_chunks')
+    @patch('app.tasks.send_chunk')
+    def test_send_scheduled_emails_stops_claiming_when_draining(
+            self, mock_send_chunk, mock_load_recipient_chunks,
+            mock_release_expired_leases):
+        """Test a draining cycle sends the batch it claimed and stops there."""
+        stopping = threading.Event()
+        chunk = [(1, "a@example.com")]
+        mock_load_recipient_chunks.return_value = iter([("event-1", chunk)])
+
+        def claim(*args):
+            stopping.set()
+            return [(datetime(2024, 8, 1, 9, 0, 0), "event-1")]
+
+        with patch('app.tasks.claim_due_events', side_effect=claim) as mock_claim, \
+                patch('app.tasks.OutcomeBuffer'):
+            send_scheduled_emails(self.app, stopping)
+
+            mock_claim.assert_called_once()
+            mock_send_chunk.assert_called_once_with(
+                "event-1", chunk, self.app, ANY, ANY, ANY)
+
+    @patch('app.tasks.mail.send')
+    @patch('app.tasks.get_current_time')
+    def test_send_chunk(self, mock_get_current_time, mock_mail_send):
+        """Test send_chunk sends one message and records it per recipient."""
+        now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        mock_get_current_time.return_value = now
+        mock_mail_send.side_effect = [None, Exception("Email sending failed")]
+        event = MagicMock(status=EventStatus.CLAIMED, lease_owner="worker-1",
+                          expected_sent_at=now, updated_at=now,
+                          email_subject="Subject", email_content="Body",
+                          personalized=False)
+        outcomes = MagicMock()
+        chunk = [(1, "a@example.com"), (2, "b@example.com")]
+
+        with patch('app.tasks.Event.query') as mock_query, \
+                patch.object(self.app.extensions['mail'], 'default_sender',
+                             'sender@example.com'):
+            mock_query.get.return_value = event
+            send_chunk("event-1", chunk, self.app, None, "worker-1", outcomes)
+            send_chunk("event-1", chunk, self.app, None, "worker-1", outcomes)
+
+            mock_query.get.assert_called_with("event-1")
+            message = mock_mail_send.call_args[0][0]
+            self.assertEqual(message.recipients, ["a@example.com", "b@example.com"])
+            self.assertIn(b"To: a@example.com,\r\n b@example.com", message.as_bytes())
+            outcomes.sent.assert_called_once_with("event-1", [1, 2], now)
+            outcomes.failed.assert_called_once_with(
+                "event-1", [1, 2], "Email sending failed", now, permanent=True)
+
+    @patch('app.tasks.mail.send')
+    @patch('app.tasks.get_current_time')
+    def test_send_chunk_times_after_send(self, mock_get_current_time,
+                                         mock_mail_send):
+        """Test the sent time includes the wait for the SMTP server."""
+        now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        later = now + timedelta(seconds=3)
+        mock_get_current_time.return_value = now
+        mock_mail_send.side_effect = lambda message: setattr(
+            mock_get_current_time, 'return_value', later)
+        event = MagicMock(status=EventStatus.CLAIMED, lease_owner="worker-1",
+                          expected_sent_at=now, updated_at=now,
+                          email_subject="Subject", email_content="Body",
+                          personalized=False)
+        outcomes = MagicMock()
+
+        with patch('app.tasks.Event.query') as mock_query, \
+                patch.object(self.app.extensions['mail'], 'default_sender',
+                             'sender@example.com'):
+            mock_query.get.return_value = event
+            send_chunk("event-1", [(1, "a@example.com")], self.app, None,
+                       "worker-1", outcomes)
+
+        outcomes.sent.assert_called_once_with("event-1", [1], later)
+
+    @patch('app.tasks.mail.send')
+    @patch('app.tasks.get_current_time')
+    def test_send_chunk_personalized(self, mock_get_current_time, mock_mail_send):
+        """Test send_chunk renders and sends one message per recipient."""
+        now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        mock_get_current_time.return_value = now
+        mock_mail_send.side_effect = [None, Exception("Mailbox full"), None]
+        db.create_all()
+        try:
+            db.session.add(Event(
+                event_id="event-1", email_subject="Hi {{ name }}",
+                email_content="Hello {{ name }}", recipients="",
+                expected_sent_at=now, status=EventStatus.CLAIMED,
+                lease_owner="worker-1", personalized=True,
+                recipient_rows=[
+                    EventRecipient(address=f"{name}@example.com",
+                                   variables=f'{{"name": "{name}"}}')
+                    for name in ("ann", "bob", "cy")]))
+            db.session.commit()
+            outcomes = MagicMock()
+            chunk = [(r.id, r.address) for r in EventRecipient.query.order_by(
+                EventRecipient.id)]
+
+            with patch.object(self.app.extensions['mail'], 'default_sender',
+                              'sender@example.com'):
+                send_chunk("event-1", chunk, self.app, None, "worker-1",
+                           outcomes)
+
+            sent = [call[0][0] for call in mock_mail_send.call_args_list]
+            self.assertEqual([m.recipients for m in sent],
+                             [["ann@example.com"], ["bob@example.com"],
+                              ["cy@example.com"]])
+            self.assertIn(b"Subject: Hi cy\r\n", sent[2].as_bytes())
+            self.assertTrue(sent[2].as_bytes().endswith(b"\r\n\r\nHello cy"))
+            outcomes.sent.assert_called_once_with(
+                "event-1", [chunk[0][0], chunk[2][0]], now)
+            outcomes.failed.assert_called_once_with(
+                "event-1", [chunk[1][0]], "Mailbox full", now, permanent=True)
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+    @patch('app.tasks.mail.send')
+    def test_send_chunk_skips_lost_lease(self, mock_mail_send):
+        """Test send_chunk leaves events leased to another dispatcher alone."""
+        event = MagicMock(status=EventStatus.CLAIMED, lease_owner="worker-2")
+        outcomes = MagicMock()
+
+        with patch('app.tasks.Event.query') as mock_query:
+            mock_query.get.return_value = event
+            send_chunk("event-1", [(1, "a@example.com")], self.app, None,
+                       "worker-1", outcomes)
+
+            mock_mail_send.assert_not_called()
+            outcomes.sent.assert_not_called()
 
     @patch('app.tasks.send_scheduled_emails')
     @patch('app.tasks.get_current_time')
@@ -134,5 +332,152 @@ class TestTasks(unittest.TestCase):
             mock_send_scheduled_emails.assert_not_called()
 
 
+class TestClaimDueEvents(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app_context = cls.app.app_context()
+        cls.app_context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app_context.pop()
+
+    def setUp(self):
+        db.create_all()
+        self.now = datetime(2024, 8, 1, 10, 0, 0, tzinfo=timezone.utc)
+        for i, minutes in enumerate([-30, -20, -10, 10]):
+            db.session.add(Event(
+                event_id=f"event-{i}",
+                email_subject="Test Subject",
+                email_content="Test Content",
+                expected_sent_at=self.now + timedelta(minutes=minutes),
+                recipients="test@example.com"
+            ))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    @patch('app.tasks.get_current_time')
+    def test_claims_due_events_once(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+
+        first = claim_due_events(self.now, "worker-1", 2, 300)
+        second = claim_due_events(self.now, "worker-2", 2, 300)
+        third = claim_due_events(self.now, "worker-2", 2, 300)
+
+        self.assertEqual([k[1] for k in first], ["event-0", "event-1"])
+        self.assertEqual([k[1] for k in second], ["event-2"])
+        self.assertEqual(third, [])
+        self.assertEqual(Event.query.get("event-0").lease_owner, "worker-1")
+        self.assertEqual(Event.query.get("event-2").lease_owner, "worker-2")
+        self.assertEqual(Event.query.get("event-2").status, EventStatus.CLAIMED)
+        self.assertEqual(Event.query.get("event-3").status, EventStatus.PENDING)
+
+    @patch('app.tasks.get_current_time')
+    def test_reclaims_expired_lease(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+        claim_due_events(self.now, "worker-1", 10, 60)
+
+        mock_get_current_time.return_value = self.now + timedelta(minutes=2)
+        self.assertEqual(release_expired_leases(), 3)
+        reclaimed = claim_due_events(self.now, "worker-2", 10, 60)
+
+        self.assertEqual([k[1] for k in reclaimed],
+                         ["event-0", "event-1", "event-2"])
+        self.assertEqual(Event.query.get("event-1").lease_owner, "worker-2")
+
+    @patch('app.tasks.get_current_time')
+    def test_claim_event_only_once(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+
+        self.assertTrue(claim_event("event-2", "worker-1", 300))
+        self.assertFalse(claim_event("event-2", "worker-2", 300))
+        self.assertEqual(Event.query.get("event-2").lease_owner, "worker-1")
+
+    @patch('app.tasks.get_current_time')
+    def test_claim_event_skips_rescheduled(self, mock_get_current_time):
+        # event-3 was moved ten minutes out after its timer was set
+        mock_get_current_time.return_value = self.now
+
+        self.assertFalse(claim_event("event-3", "worker-1", 300))
+        self.assertEqual(Event.query.get("event-3").status, EventStatus.PENDING)
+
+    @patch('app.tasks.get_current_time')
+    def test_continues_after_cursor(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+        first = claim_due_events(self.now, "worker-1", 1, 300)
+
+        # Expire the lease so only the cursor keeps event-0 out
+        mock_get_current_time.return_value = self.now + timedelta(minutes=10)
+        release_expired_leases()
+        rest = claim_due_events(self.now, "worker-1", 10, 60, first[-1])
+
+        self.assertEqual([k[1] for k in rest], ["event-1", "event-2"])
+
+    @patch('app.tasks.get_current_time')
+    def test_skips_events_backing_off(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+        event = Event.query.get("event-1")
+        event.attempts = 1
+        event.next_attempt_at = self.now + timedelta(minutes=1)
+        db.session.commit()
+
+        claimed = claim_due_events(self.now, "worker-1", 10, 300)
+        self.assertEqual([k[1] for k in claimed], ["event-0", "event-2"])
+        self.assertFalse(claim_event("event-1", "worker-1", 300))
+
+        later = self.now + timedelta(minutes=1)
+        mock_get_current_time.return_value = later
+        self.assertEqual([k[1] for k in claim_due_events(
+            later, "worker-1", 10, 300)], ["event-1"])
+
+    @patch('app.tasks.get_current_time')
+    def test_load_recipient_chunks(self, mock_get_current_time):
+        mock_get_current_time.return_value = self.now
+        db.session.add_all(
+            [EventRecipient(event_id="event-0", address=f"user{i}@example.com")
+             for i in range(5)]
+            + [EventRecipient(event_id="event-1", address="sent@example.com",
+                              status=EventStatus.SENT),
+               EventRecipient(event_id="event-1", address="failed@example.com",
+                              status=EventStatus.FAILED, error_message="Refused"),
+               EventRecipient(event_id="event-1", address="retry@example.com",
+                              error_message="Service unavailable"),
+               EventRecipient(event_id="event-1", address="stale@example.com",
+                              status=EventStatus.CLAIMED,
+                              claimed_at=self.now - timedelta(minutes=10)),
+               EventRecipient(event_id="event-1", address="sending@example.com",
+                              status=EventStatus.CLAIMED,
+                              claimed_at=self.now - timedelta(minutes=1))])
+        db.session.commit()
+
+        chunks = load_recipient_chunks(["event-0", "event-1", "event-2"], 2, 300)
+
+        # Claimed a page at a time, as the chunks are consumed
+        self.assertEqual(next(chunks)[0], "event-0")
+        self.assertEqual(EventRecipient.query.filter_by(
+            status=EventStatus.CLAIMED, claimed_at=self.now).count(), 2)
+        rest = list(chunks)
+        self.assertEqual([(event_id, [address for _, address in chunk])
+                          for event_id, chunk in rest],
+                         [("event-0", ["user2@example.com", "user3@example.com"]),
+                          # The third page spans both events
+                          ("event-0", ["user4@example.com"]),
+                          # Only the address that failed transiently and the
+                          # one a lost dispatcher left claimed are sent again
+                          ("event-1", ["retry@example.com"]),
+                          ("event-1", ["stale@example.com"])])
+        self.assertEqual(EventRecipient.query.filter_by(
+            status=EventStatus.CLAIMED, claimed_at=self.now).count(), 7)
+        # A claim younger than the lease may still be in flight
+        sending = EventRecipient.query.filter_by(address="sending@example.com").one()
+        self.assertEqual(sending.claimed_at, self.now - timedelta(minutes=1))
+        failed = EventRecipient.query.filter_by(address="failed@example.com").one()
+        self.assertEqual(failed.status, EventStatus.FAILED)
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,9 @@
 # tests/test_time_utils.py
 
 import unittest
-from datetime import datetime, timedelta
-from app.utils.time_utils import get_current_time, get_default_time_zone
+from datetime import datetime, timedelta, timezone
+from app.utils.time_utils import (get_current_time, get_default_time_zone,
+                                  get_time_zone, set_clock)
 import pytz
 
 
@@ -31,6 +32,24 @@ class TestTimeUtils(unittest.TestCase):
         self.assertIsInstance(current_time, datetime)
         self.assertEqual(current_time.tzinfo.zone, 'Asia/Singapore')
 
+    def test_get_current_time_uses_injected_clock(self):
+        now = datetime(2024, 8, 1, 2, 0, 0, tzinfo=timezone.utc)
+        previous = set_clock(lambda: now)
+        try:
+            self.assertEqual(get_current_time(), now)
+            self.assertEqual(get_current_time().isoformat(),
+                             '2024-08-01T10:00:00+08:00')
+            self.assertEqual(get_current_time('Europe/London').isoformat(),
+                             '2024-08-01T03:00:00+01:00')
+        finally:
+            set_clock(previous)
+
+    def test_get_time_zone_is_cached(self):
+        self.assertIs(get_time_zone('Europe/London'),
+                      get_time_zone('Europe/London'))
+        with self.assertRaises(ValueError):
+            get_time_zone('Mars/Olympus')
+
 
 if __name__ == '__main__':
     unittest.main()
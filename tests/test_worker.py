@@ -0,0 +1,83 @@
+# tests/test_worker.py
+
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+from app import create_app
+from app.metrics import REGISTRY
+from app.scheduler import delivery, start_scheduler, stop_scheduler, stopping
+from app.worker import run, serve_metrics
+
+
+class TestWorker(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        cls.app.config['LOOKAHEAD_ENABLED'] = False
+
+    @patch('app.start_scheduler')
+    def test_create_app_does_not_start_scheduler_by_default(self, mock_start):
+        create_app()
+        mock_start.assert_not_called()
+
+        create_app(scheduler=True)
+        mock_start.assert_called_once()
+
+    @patch('app.scheduler.send_scheduled_emails')
+    def test_stop_drains_running_cycle(self, mock_send_scheduled_emails):
+        started = threading.Event()
+        finished = []
+
+        def cycle(app, stop, backend, outcomes):
+            # The poll uses the process's shared backend and outcome buffer
+            self.assertIs(backend, delivery['backend'])
+            self.assertIs(outcomes, delivery['outcomes'])
+            started.set()
+            time.sleep(0.2)
+            finished.append(stop.is_set())
+
+        mock_send_scheduled_emails.side_effect = cycle
+        scheduler = start_scheduler(self.app)
+        self.assertTrue(started.wait(5))
+
+        stop_scheduler(scheduler)
+
+        # The running cycle was told to stop claiming and was waited for
+        self.assertEqual(finished, [True])
+        self.assertTrue(stopping.is_set())
+        self.assertEqual(delivery, {})
+        # A process that sends mail exports its rate limiter
+        self.assertIn('janus_smtp_rate_limit_waits_total', REGISTRY.render())
+
+    @patch('app.worker.stop_scheduler')
+    @patch('app.worker.start_scheduler')
+    def test_run_stops_when_signalled(self, mock_start, mock_stop):
+        stop = threading.Event()
+        stop.set()
+
+        run(self.app, stop)
+
+        mock_start.assert_called_once_with(self.app)
+        mock_stop.assert_called_once_with(mock_start.return_value)
+
+    def test_serves_metrics(self):
+        server = serve_metrics(self.app, 0, host='127.0.0.1')
+        url = f'http://127.0.0.1:{server.server_port}'
+        try:
+            with urllib.request.urlopen(url + '/metrics') as response:
+                text = response.read().decode()
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + '/')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn('# TYPE janus_dispatch_cycle_seconds histogram', text)
+
+
+if __name__ == '__main__':
+    unittest.main()